@@ -120,6 +120,15 @@ mkdir -p "$PROJECT_DIR/results"
 echo "✅ Directories created"
 echo ""
 
+# Build the MAC vendor database from the vendor lists installed above
+echo "🏷️  Building MAC vendor database..."
+if python3 "$PROJECT_DIR/scripts/oui_db.py" build; then
+    echo "✅ Vendor database built"
+else
+    echo "⚠️  No vendor lists found; vendors will show as \"-\" until \`oui_db.py build\` succeeds"
+fi
+echo ""
+
 echo "=========================================="
 echo "  ✅ Installation Complete!"
 echo "=========================================="
@@ -0,0 +1,382 @@
+"""arp_sweep.py — Native ARP sweep engine on AF_PACKET sockets
+
+Sends ARP who-has frames for every address of an on-link subnet from one raw
+socket per interface, paced at a configurable packets-per-second rate, and
+collects replies asynchronously. Hosts the kernel neighbor table already has
+as REACHABLE are reported straight from it (read over netlink) and are not
+probed at all. Needs root (CAP_NET_RAW).
+
+Testable without touching a real LAN: put one end of a veth pair in a network
+namespace, give it addresses, and sweep from the other end.
+
+Usage: python3 scripts/arp_sweep.py [--interface IF] [--rate PPS] [--timeout MS] [--retries N] [--fixed-timeout]
+                                    CIDR [CIDR ...]
+       Prints one ARP|IP|MAC line per responding host.
+"""
+import argparse
+import asyncio
+import fcntl
+import ipaddress
+import socket
+import struct
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from icmp_sweep import expand_targets
+from rtt_estimator import RttEstimator
+
+ETH_P_ARP = 0x0806
+ETH_P_IP = 0x0800
+ARP_REQUEST = 1
+ARP_REPLY = 2
+
+_BROADCAST = b"\xff" * 6
+_ARP_FRAME = struct.Struct("!6s6sHHHBBH6s4s6s4s")  # Ethernet header + ARP payload
+
+# ioctls for an interface's primary IPv4 address and netmask
+_SIOCGIFADDR = 0x8915
+_SIOCGIFNETMASK = 0x891B
+
+# Netlink neighbor dump (rtnetlink)
+_NETLINK_ROUTE = 0
+_RTM_NEWNEIGH = 28
+_RTM_GETNEIGH = 30
+_NLMSG_ERROR = 2
+_NLMSG_DONE = 3
+_NLM_F_REQUEST_DUMP = 0x301
+_NDA_DST = 1
+_NDA_LLADDR = 2
+_NLMSGHDR = struct.Struct("=IHHII")
+_NDMSG = struct.Struct("=BBHiHBB")
+_RTATTR = struct.Struct("=HH")
+
+# Neighbor (NUD) states
+NUD_REACHABLE = 0x02
+NUD_STALE = 0x04
+NUD_DELAY = 0x08
+NUD_PROBE = 0x10
+NUD_PERMANENT = 0x80
+
+# Default send rate (who-has frames per second per interface)
+DEFAULT_RATE = 1000
+
+AliveCallback = Callable[[str, str], None]
+# (ip, mac, interface index, NUD state)
+Neighbor = Tuple[str, str, int, int]
+
+
+def format_mac(raw: bytes) -> str:
+    return ":".join(f"{b:02x}" for b in raw)
+
+
+def build_arp_request(src_mac: bytes, src_ip: str, target_ip: str) -> bytes:
+    return _ARP_FRAME.pack(
+        _BROADCAST, src_mac, ETH_P_ARP,
+        1, ETH_P_IP, 6, 4, ARP_REQUEST,
+        src_mac, socket.inet_aton(src_ip), b"\0" * 6, socket.inet_aton(target_ip),
+    )
+
+
+def parse_arp_frame(frame: bytes) -> Optional[Tuple[int, str, str]]:
+    """(opcode, sender ip, sender mac) of an Ethernet/IPv4 ARP frame, else None."""
+    if len(frame) < _ARP_FRAME.size:
+        return None
+    (_, _, ethertype, htype, ptype, hlen, plen, op,
+     sha, spa, _, _) = _ARP_FRAME.unpack_from(frame)
+    if ethertype != ETH_P_ARP or htype != 1 or ptype != ETH_P_IP or hlen != 6 or plen != 4:
+        return None
+    return op, socket.inet_ntoa(spa), format_mac(sha)
+
+
+# --- Interfaces and the neighbor table ---
+
+def _ifreq_ipv4(sock: socket.socket, request: int, name: str) -> str:
+    req = struct.pack("256s", name.encode()[:15])
+    return socket.inet_ntoa(fcntl.ioctl(sock.fileno(), request, req)[20:24])
+
+
+def interface_address(name: str) -> str:
+    """Primary IPv4 address of an interface (OSError if it has none)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        return _ifreq_ipv4(sock, _SIOCGIFADDR, name)
+    finally:
+        sock.close()
+
+
+def interface_networks() -> Dict[str, ipaddress.IPv4Network]:
+    """Map each configured (non-loopback) interface to its primary IPv4 network."""
+    networks: Dict[str, ipaddress.IPv4Network] = {}
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for _, name in socket.if_nameindex():
+            if name == "lo":
+                continue
+            try:
+                addr = _ifreq_ipv4(sock, _SIOCGIFADDR, name)
+                mask = _ifreq_ipv4(sock, _SIOCGIFNETMASK, name)
+            except OSError:
+                continue  # Down or no IPv4 address
+            networks[name] = ipaddress.ip_network(f"{addr}/{mask}", strict=False)
+    finally:
+        sock.close()
+    return networks
+
+
+def interface_for(subnet: str, networks: Optional[Dict[str, ipaddress.IPv4Network]] = None) -> Optional[str]:
+    """Pick the interface whose network overlaps the subnet (None if it is not on-link)."""
+    target = ipaddress.ip_network(subnet, strict=False)
+    networks = interface_networks() if networks is None else networks
+    for name, network in networks.items():
+        if network.version == target.version and network.overlaps(target):
+            return name
+    return None
+
+
+def read_neighbors(family: int = socket.AF_INET) -> List[Neighbor]:
+    """Dump the kernel neighbor table over rtnetlink (empty list if unavailable)."""
+    neighbors: List[Neighbor] = []
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, _NETLINK_ROUTE)
+    except OSError:
+        return neighbors
+    try:
+        sock.bind((0, 0))
+        sock.send(_NLMSGHDR.pack(_NLMSGHDR.size + _NDMSG.size, _RTM_GETNEIGH, _NLM_F_REQUEST_DUMP, 1, 0)
+                  + _NDMSG.pack(family, 0, 0, 0, 0, 0, 0))
+        while True:
+            data = sock.recv(1 << 16)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+                if length < _NLMSGHDR.size or msg_type in (_NLMSG_DONE, _NLMSG_ERROR):
+                    return neighbors
+                if msg_type == _RTM_NEWNEIGH:
+                    neighbor = _parse_neighbor(data[offset + _NLMSGHDR.size:offset + length])
+                    if neighbor is not None:
+                        neighbors.append(neighbor)
+                offset += (length + 3) & ~3
+    except OSError:
+        return neighbors
+    finally:
+        sock.close()
+
+
+def _parse_neighbor(payload: bytes) -> Optional[Neighbor]:
+    family, _, _, ifindex, state, _, _ = _NDMSG.unpack_from(payload)
+    dst = lladdr = None
+    offset = _NDMSG.size
+    while offset + _RTATTR.size <= len(payload):
+        length, attr = _RTATTR.unpack_from(payload, offset)
+        if length < _RTATTR.size:
+            break
+        value = payload[offset + _RTATTR.size:offset + length]
+        if attr == _NDA_DST:
+            dst = value
+        elif attr == _NDA_LLADDR:
+            lladdr = value
+        offset += (length + 3) & ~3
+    if dst is None or not lladdr or lladdr == b"\0" * len(lladdr):
+        return None
+    return socket.inet_ntop(family, dst), format_mac(lladdr), ifindex, state
+
+
+# --- Sweeper ---
+
+class ArpSweeper:
+    """Who-has sweeper bound to one interface.
+
+    Frames are paced at `rate` per second. After each pass, hosts that have
+    not answered are retried (`retries` extra passes), and each pass waits
+    `timeout` seconds for late replies, or the adaptive timeout of an `rtt`
+    estimator, which every reply then feeds. Any ARP frame whose sender is
+    one of the swept addresses counts as a sighting.
+    """
+
+    def __init__(self, interface: str, rate: int = DEFAULT_RATE, timeout: float = 1.0, retries: int = 1,
+                 rtt: Optional[RttEstimator] = None):
+        self.interface = interface
+        self.rate = max(1, int(rate))
+        self.timeout = max(0.05, float(timeout))
+        self.retries = max(0, int(retries))
+        self.rtt = rtt
+        self.ifindex = socket.if_nametoindex(interface)
+        self.address = interface_address(interface)
+        self._sock: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._mac = b""
+        self._sent: Dict[int, float] = {}  # Target address -> time its last who-has went out
+        self._attempt = 0
+        self._alive: Dict[str, str] = {}
+        self._on_alive: Optional[AliveCallback] = None
+        self.control = None  # Optional ScanControl: waited on before each frame
+        self.metrics = None  # Optional ScanMetrics: counts who-has frames and replies
+
+    def _open(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._sock is not None and self._loop is loop:
+            return
+        self.close()
+        try:
+            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        except PermissionError as e:
+            raise PermissionError("ARP sweeps need root (CAP_NET_RAW)") from e
+        sock.bind((self.interface, ETH_P_ARP))
+        sock.setblocking(False)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        except OSError:
+            pass
+        self._mac = sock.getsockname()[4]
+        self._sock = sock
+        self._loop = loop
+        loop.add_reader(sock.fileno(), self._on_readable)
+
+    def close(self) -> None:
+        if self._sock is None:
+            return
+        try:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(self._sock.fileno())
+        except (ValueError, RuntimeError):
+            pass
+        self._sock.close()
+        self._sock = None
+
+    def _found(self, ip: str, mac: str) -> None:
+        if ip in self._alive:
+            return
+        self._alive[ip] = mac
+        if self._on_alive:
+            self._on_alive(ip, mac)
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                frame = self._sock.recv(128)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            parsed = parse_arp_frame(frame)
+            if parsed is None:
+                continue
+            op, ip, mac = parsed
+            if op not in (ARP_REQUEST, ARP_REPLY) or ip == self.address or ip in self._alive:
+                continue
+            sent = self._sent.get(int(ipaddress.IPv4Address(ip)))
+            if sent is not None:
+                if self.rtt:
+                    self.rtt.observe(ip, time.perf_counter() - sent, retransmitted=self._attempt > 0)
+                if self.metrics:
+                    self.metrics.inc("ipscan_probe_replies_total", probe="arp")
+                self._found(ip, mac)
+
+    async def _send(self, frame: bytes) -> None:
+        while True:
+            try:
+                self._sock.send(frame)
+                return
+            except (BlockingIOError, InterruptedError):
+                await asyncio.sleep(0.001)  # TX queue full
+
+    async def _pass(self, targets: Iterable[str]) -> None:
+        """Send one who-has per target not yet seen, paced at self.rate."""
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.rate
+        next_send = loop.time()
+        last = None
+        for ip in targets:
+            if ip in self._alive or ip == self.address:
+                continue
+            if self.control:
+                await self.control.wait()
+            now = loop.time()
+            if next_send > now:
+                await asyncio.sleep(next_send - now)
+            elif now - next_send > 0.1:
+                next_send = now  # Don't burst to catch up after a pause or stall
+            self._sent[int(ipaddress.IPv4Address(ip))] = time.perf_counter()
+            await self._send(build_arp_request(self._mac, self.address, ip))
+            if self.metrics:
+                self.metrics.inc("ipscan_probes_sent_total", probe="arp")
+            next_send += interval
+            last = ip
+        if last is not None:
+            # Late replies
+            await asyncio.sleep(self.rtt.timeout(last, self._attempt) if self.rtt else self.timeout)
+
+    async def sweep(self, targets: Iterable[str], on_alive: Optional[AliveCallback] = None) -> Dict[str, str]:
+        """ARP every target, calling on_alive(ip, mac) as each host is seen. Returns {ip: mac}.
+
+        Targets the neighbor table lists as REACHABLE on this interface are
+        reported immediately without sending anything.
+        """
+        self._open()
+        self._alive = {}
+        self._sent = {}
+        self._attempt = 0
+        self._on_alive = on_alive
+        reachable = {ip: mac for ip, mac, ifindex, state in read_neighbors()
+                     if ifindex == self.ifindex and state & NUD_REACHABLE}
+
+        def first_pass() -> Iterable[str]:
+            for ip in targets:
+                if ip in reachable:
+                    self._found(ip, reachable[ip])
+                else:
+                    yield ip
+
+        await self._pass(first_pass())
+        for attempt in range(1, self.retries + 1):
+            self._attempt = attempt
+            missing = sorted(self._sent.keys() - {int(ipaddress.IPv4Address(ip)) for ip in self._alive})
+            if not missing:
+                break
+            await self._pass(str(ipaddress.IPv4Address(value)) for value in missing)
+        return dict(self._alive)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ARP sweep over AF_PACKET")
+    parser.add_argument("targets", nargs="+", help="On-link CIDRs or IPs to sweep")
+    parser.add_argument("--interface", help="Interface to sweep on (default: the one on the target's network)")
+    parser.add_argument("--rate", type=int, default=DEFAULT_RATE, help=f"Frames per second (default: {DEFAULT_RATE})")
+    parser.add_argument("--timeout", type=int, default=1000, help="Wait for replies after each pass, in ms (default: 1000)")
+    parser.add_argument("--retries", type=int, default=1, help="Extra passes for silent hosts (default: 1)")
+    parser.add_argument("--fixed-timeout", action="store_true",
+                        help="Always wait the full timeout after a pass instead of adapting it to measured RTTs")
+    args = parser.parse_args(argv)
+
+    try:
+        for spec in args.targets:
+            ipaddress.IPv4Network(spec, strict=False)
+    except ValueError as e:
+        parser.error(str(e))
+    interface = args.interface or interface_for(args.targets[0])
+    if interface is None:
+        parser.error(f"no local interface on {args.targets[0]}; pass --interface")
+
+    def report(ip: str, mac: str) -> None:
+        # Format: ARP|IP|MAC
+        print(f"ARP|{ip}|{mac}", flush=True)
+
+    async def run():
+        rtt = None if args.fixed_timeout else RttEstimator(timeout=args.timeout / 1000.0, retries=args.retries)
+        sweeper = ArpSweeper(interface, rate=args.rate, timeout=args.timeout / 1000.0, retries=args.retries, rtt=rtt)
+        try:
+            await sweeper.sweep(expand_targets(args.targets), on_alive=report)
+        finally:
+            sweeper.close()
+
+    try:
+        asyncio.run(run())
+    except (PermissionError, OSError) as e:
+        print(f"arp_sweep: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,754 @@
+"""discovery.py — Streaming host discovery pipeline
+
+Every probe method (ICMP sweep, ARP sweep, nmap host discovery) runs at the
+same time and pushes hosts into one shared, deduplicated stream. A host is
+reported the moment any probe finds it, with whatever is known so far; its
+hostname, MAC/vendor, RTT, ports and (with --services) the services on them
+then follow as field updates from the enrichment stage. Probe timeouts and
+retries adapt to the RTTs measured during the scan (rtt_estimator.py), with
+--timeout as the upper bound.
+With IPv6 ranges or --ipv6, NDP discovery (ndp_sweep.py) runs first on the
+scanned links: IPv6 addresses are attached to the IPv4 host with the same
+MAC (field "ipv6"), and devices with no IPv4 address become hosts of their
+own, enriched and port-checked like the rest.
+
+Usage: python3 scripts/discovery.py [--threads N] [--timeout MS] [--fixed-timeout]
+                                    [--ports LIST | --no-ports] [--syn]
+                                    [--syn-rate PPS] [--services] [--arp-rate PPS]
+                                    [--ipv6] [--store [FILE]] [--incremental]
+                                    [--resume] [--metrics-file FILE]
+                                    [--log-file FILE] [--debug] RANGE [RANGE ...]
+       Prints one LIVE|IP|HOSTNAME|MAC|VENDOR|PORTS|PING line per host as it
+       completes (with --services followed by one SERVICE|IP|PORT|NAME|DETAIL
+       line per open port, and with IPv6 discovery by an IPV6|IP|ADDRESSES
+       line for hosts with IPv6 addresses).
+       Progress is checkpointed (see scan_checkpoint.py); --resume continues a
+       stopped scan of the same ranges.
+       --metrics-file keeps a Prometheus text file of the scan's metrics (see
+       scan_metrics.py) up to date.
+       --log-file also appends the log lines to FILE, written in batches (see
+       scan_log.py).
+"""
+import argparse
+import asyncio
+import ipaddress
+import shutil
+import signal
+import socket
+import sys
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from arp_sweep import DEFAULT_RATE as DEFAULT_ARP_RATE, ArpSweeper, interface_for, interface_networks, read_neighbors
+from dns_resolver import ReverseResolver
+from enrichment import HostEnricher, format_ipv6_lines, format_live_line, format_rtt, format_service_lines
+from icmp_sweep import IcmpSweeper, expand_targets
+from ndp_sweep import NdpSweeper, Sighting, interface_addresses6
+from port_scanner import parse_ports
+from range_router import RangeRouter, outermost_ranges, split_families
+from rtt_estimator import RttEstimator
+from scan_checkpoint import ScanCheckpoint, open_checkpoint
+from scan_events import ScanProgress
+from scan_log import ScanLogger
+from scan_metrics import ScanMetrics, textfile_path
+from scan_store import DEFAULT_STORE, ScanStore
+from service_detect import ServiceDetector
+from syn_scan import DEFAULT_RATE as DEFAULT_SYN_RATE, SynScanner
+
+# Fields of a host record; "-" means not known (yet)
+HOST_FIELDS = ("hostname", "mac", "vendor", "ports", "services", "ping", "ipv6")
+
+# Event kinds emitted by the stream
+NEW = "new"
+UPDATE = "update"
+DISCOVERED = "discovered"  # Every probe method finished (ip and fields empty)
+
+HostEvent = Tuple[str, str, Dict[str, str]]
+EventCallback = Callable[[str, str, Dict[str, str]], None]
+LogCallback = Callable[[str, str], None]
+
+
+def _no_log(message: str, level: str = "info") -> None:
+    pass
+
+
+class ScanControl:
+    """Pause switch shared by every probe of a running scan.
+
+    Engines call `await control.wait()` before starting a new probe, so
+    pausing holds back new work while in-flight probes finish normally.
+    External tools started by the scan are stopped/continued with it.
+    Must be used from the scan's event loop.
+    """
+
+    def __init__(self):
+        self._running = asyncio.Event()
+        self._running.set()
+        self.processes: Set[asyncio.subprocess.Process] = set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    async def wait(self) -> None:
+        await self._running.wait()
+
+    def _signal_processes(self, sig: int) -> None:
+        for proc in list(self.processes):
+            try:
+                proc.send_signal(sig)
+            except ProcessLookupError:
+                self.processes.discard(proc)
+
+    def pause(self) -> None:
+        self._running.clear()
+        self._signal_processes(signal.SIGSTOP)
+
+    def resume(self) -> None:
+        self._signal_processes(signal.SIGCONT)
+        self._running.set()
+
+
+class DiscoveryStream:
+    """Deduplicated stream of hosts shared by all probe methods.
+
+    `push()` is for discovery results: the first sighting of an IP emits a
+    NEW event with the partial record, later sightings only fill fields that
+    are still unknown; `via` names the probe method, counted in `found_by`
+    once per host (`seen_by` holds the methods that found each host).
+    `update()` is for enrichment results and overwrites; `restore()` adds a
+    host known from a checkpoint, with the methods that had found it, and
+    `discovered()` marks the end of
+    discovery. Consumers iterate the stream to get (kind, ip, fields)
+    events in order. New hosts are counted in `metrics` by the method
+    that found them. IPv6 addresses given to `link_ipv6()` by MAC become the
+    "ipv6" field of the host with that MAC as soon as its MAC is known.
+    """
+
+    def __init__(self, metrics: Optional[ScanMetrics] = None):
+        self.hosts: Dict[str, Dict[str, str]] = {}
+        self.found_by: Dict[str, int] = {}
+        self.seen_by: Dict[str, Set[str]] = {}  # IP -> probe methods that found it
+        self.metrics = metrics
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._ipv6: Dict[str, str] = {}  # MAC -> its IPv6 addresses, comma-separated
+
+    def _linked(self, host: Dict[str, str]) -> Dict[str, str]:
+        """The "ipv6" field a host gains through its MAC, set on it (empty if none)."""
+        addresses = self._ipv6.get(host["mac"])
+        if addresses is None or host["ipv6"] != "-":
+            return {}
+        host["ipv6"] = addresses
+        return {"ipv6": addresses}
+
+    def link_ipv6(self, addresses: Dict[str, str]) -> None:
+        """Attach IPv6 addresses ({mac: "addr,addr"}) to the hosts with those MACs, now or later."""
+        self._ipv6.update(addresses)
+        for ip, host in self.hosts.items():
+            linked = self._linked(host)
+            if linked:
+                self._events.put_nowait((UPDATE, ip, linked))
+
+    def qsize(self) -> int:
+        """Events not consumed yet."""
+        return self._events.qsize()
+
+    def _credit(self, ip: str, via: str) -> None:
+        methods = self.seen_by.setdefault(ip, set())
+        if via not in methods:
+            methods.add(via)
+            self.found_by[via] = self.found_by.get(via, 0) + 1
+
+    def push(self, ip: str, via: str = "", **fields: str) -> None:
+        if via:
+            self._credit(ip, via)
+        host = self.hosts.get(ip)
+        if host is None:
+            host = {"ip": ip}
+            for name in HOST_FIELDS:
+                host[name] = fields.get(name) or "-"
+            self._linked(host)
+            self.hosts[ip] = host
+            if self.metrics:
+                self.metrics.inc("ipscan_hosts_found_total", method=via.lower() or "other")
+            self._events.put_nowait((NEW, ip, dict(host)))
+            return
+        changed = {name: value for name, value in fields.items()
+                   if value and value != "-" and host.get(name, "-") == "-"}
+        if changed:
+            host.update(changed)
+            if "mac" in changed:
+                changed.update(self._linked(host))
+            self._events.put_nowait((UPDATE, ip, changed))
+
+    def restore(self, record: Dict[str, str], methods: Iterable[str] = ()) -> None:
+        for via in methods:
+            self._credit(record["ip"], via)
+        host = {"ip": record["ip"]}
+        for name in HOST_FIELDS:
+            host[name] = record.get(name) or "-"
+        self.hosts[host["ip"]] = host
+        self._events.put_nowait((NEW, host["ip"], dict(host)))
+
+    def update(self, ip: str, **fields: str) -> None:
+        host = self.hosts.get(ip)
+        if host is None:
+            self.push(ip, **fields)
+            return
+        changed = {name: value for name, value in fields.items()
+                   if value and host.get(name) != value and not (value == "-" and host.get(name, "-") != "-")}
+        if changed:
+            host.update(changed)
+            if "mac" in changed:
+                changed.update(self._linked(host))
+            self._events.put_nowait((UPDATE, ip, changed))
+
+    def discovered(self) -> None:
+        """Mark the end of discovery, after every host pushed so far."""
+        self._events.put_nowait((DISCOVERED, "", {}))
+
+    def close(self) -> None:
+        self._events.put_nowait(None)
+
+    async def __aiter__(self) -> AsyncIterator[HostEvent]:
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            yield event
+
+
+# --- Probe sources ---
+
+async def _stream_lines(cmd: List[str], control: Optional[ScanControl] = None) -> AsyncIterator[str]:
+    """Run a command and yield its stdout lines as they are produced; kill it if cancelled."""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+    )
+    if control:
+        control.processes.add(proc)
+    try:
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            yield line.decode(errors="replace").rstrip("\n")
+        await proc.wait()
+    finally:
+        if control:
+            control.processes.discard(proc)
+        if proc.returncode is None:
+            try:
+                proc.send_signal(signal.SIGCONT)
+                proc.kill()
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+
+
+async def icmp_source(stream: DiscoveryStream, ranges: List[str], sweeper: IcmpSweeper,
+                      log: LogCallback = _no_log, whole: bool = False,
+                      checkpoint: Optional[ScanCheckpoint] = None,
+                      progress: Optional[ScanProgress] = None) -> None:
+    """Ping every address of `ranges`; with a `checkpoint`, from each range's cursor on, advancing it.
+
+    Each address whose probe is over is counted in `progress`.
+    """
+    def found(ip: str, rtt: float) -> None:
+        stream.push(ip, via="ICMP", ping=format_rtt(rtt))
+
+    def probed(ip: str) -> None:
+        if checkpoint is not None:
+            checkpoint.probed(ip)
+        if progress is not None:
+            progress.probed(ip)
+
+    try:
+        targets = checkpoint.targets(ranges, whole) if checkpoint else expand_targets(ranges, whole)
+        if count_addresses(ranges, whole) < sweeper.concurrency:
+            targets = list(targets)  # Small ranges (e.g. shard blocks) need fewer workers
+        await sweeper.sweep(targets, on_alive=found,
+                            on_done=probed if checkpoint is not None or progress is not None else None)
+    except PermissionError as e:
+        log(f"ICMP sweep unavailable: {e}", "error")
+
+
+async def arp_source(stream: DiscoveryStream, ranges: List[str], rate: int = DEFAULT_ARP_RATE,
+                     timeout: float = 1.0, control: Optional[ScanControl] = None,
+                     log: LogCallback = _no_log, rtt: Optional[RttEstimator] = None,
+                     whole: bool = False, metrics: Optional[ScanMetrics] = None) -> None:
+    """ARP-sweep the on-link part of every range, one sweeper per interface."""
+    networks = interface_networks()
+    by_interface: Dict[str, List[str]] = {}
+    for subnet in ranges:
+        interface = interface_for(subnet, networks)
+        if interface is None:
+            log(f"No local interface on {subnet}, skipping ARP sweep", "debug")
+            continue
+        # Only the on-link part of the range can answer ARP
+        target = ipaddress.ip_network(subnet, strict=False)
+        local = networks[interface]
+        by_interface.setdefault(interface, []).append(str(target if target.subnet_of(local) else local))
+
+    def found(ip: str, mac: str) -> None:
+        stream.push(ip, via="ARP", mac=mac)
+
+    async def sweep_interface(interface: str, subnets: List[str]) -> None:
+        log(f"ARP sweeping {', '.join(subnets)} on {interface} at {rate} pps", "debug")
+        try:
+            sweeper = ArpSweeper(interface, rate=rate, timeout=timeout, retries=1, rtt=rtt)
+        except OSError as e:
+            log(f"ARP sweep unavailable on {interface}: {e}", "error")
+            return
+        sweeper.control = control
+        sweeper.metrics = metrics
+        try:
+            await sweeper.sweep(expand_targets(outermost_ranges(subnets), whole), on_alive=found)
+        except PermissionError as e:
+            log(f"ARP sweep unavailable: {e}", "error")
+        finally:
+            sweeper.close()
+
+    await asyncio.gather(*(sweep_interface(name, subnets) for name, subnets in by_interface.items()))
+
+
+async def nmap_source(stream: DiscoveryStream, ranges: List[str], threads: int, timeout: float = 1.0,
+                      control: Optional[ScanControl] = None, log: LogCallback = _no_log) -> None:
+    if not shutil.which("nmap"):
+        log("nmap not found, skipping Nmap host discovery", "debug")
+        return
+    # Echo requests come from the ICMP sweep; nmap adds timestamp and TCP ACK probes.
+    # nmap adapts its own probe timeouts; the Timeout value caps them as it caps ours.
+    cmd = ["nmap", "-sn", "-PP", "-PA80,443", "--max-retries", "2", "--host-timeout", "15s",
+           "--max-rtt-timeout", f"{int(timeout * 1000)}ms",
+           "-T4", "--min-parallelism", str(threads), "-oG", "-"] + list(ranges)
+    log(f"Nmap options: {' '.join(cmd[1:-len(ranges)])}", "debug")
+    async for line in _stream_lines(cmd, control):
+        # Host: 192.168.0.1 (router.lan)	Status: Up
+        if line.startswith("Host: ") and "Status: Up" in line:
+            parts = line.split()
+            hostname = parts[2].strip("()") if len(parts) > 2 else ""
+            stream.push(parts[1], via="Nmap", hostname=hostname)
+
+
+def _ipv6_order(ip: str) -> Tuple[bool, int]:
+    """Routable addresses first, then link-local ones, each in address order."""
+    address = ipaddress.IPv6Address(ip)
+    return address.is_link_local, int(address)
+
+
+async def ndp_source(stream: DiscoveryStream, ranges: List[str], ranges6: List[str], timeout: float = 1.0,
+                     control: Optional[ScanControl] = None, log: LogCallback = _no_log,
+                     metrics: Optional[ScanMetrics] = None) -> Dict[str, Sighting]:
+    """NDP-sweep every interface on an IPv4 range or with an IPv6 network overlapping an IPv6 range.
+
+    The addresses found are linked to the stream's hosts by MAC; returns
+    every sighting, for ndp_hosts() once IPv4 discovery is over.
+    """
+    networks = interface_networks()
+    interfaces = {interface_for(subnet, networks) for subnet in ranges} - {None}
+    targets = [ipaddress.ip_network(spec, strict=False) for spec in ranges6]
+    for name, addresses in interface_addresses6().items():
+        if any(address.network.overlaps(target) for address in addresses for target in targets):
+            interfaces.add(name)
+    if not interfaces:
+        log("No local interface on the scanned ranges, skipping NDP discovery", "debug")
+        return {}
+    found: Dict[str, Sighting] = {}
+
+    async def sweep_interface(interface: str) -> None:
+        try:
+            sweeper = NdpSweeper(interface, timeout=timeout)
+        except OSError as e:
+            log(f"NDP discovery unavailable on {interface}: {e}", "debug")
+            return
+        sweeper.control = control
+        sweeper.metrics = metrics
+        try:
+            found.update(await sweeper.sweep())
+        except PermissionError as e:
+            log(f"NDP discovery unavailable: {e}", "error")
+        finally:
+            sweeper.close()
+
+    log(f"NDP discovery on {', '.join(sorted(interfaces))}", "debug")
+    await asyncio.gather(*(sweep_interface(name) for name in sorted(interfaces)))
+    by_mac: Dict[str, List[str]] = {}
+    for ip, (mac, _) in found.items():
+        if mac != "-":
+            by_mac.setdefault(mac, []).append(ip)
+    stream.link_ipv6({mac: ",".join(sorted(addresses, key=_ipv6_order)) for mac, addresses in by_mac.items()})
+    return found
+
+
+def ndp_hosts(stream: DiscoveryStream, found: Dict[str, Sighting], ranges6: List[str]) -> None:
+    """Push the devices NDP found that no IPv4 host has the MAC of, as IPv6-only hosts.
+
+    Called once IPv4 discovery is over. Each device is reported under its
+    first routable address (inside `ranges6`, if any are given), with all of
+    its addresses as the "ipv6" field; devices with only link-local
+    addresses are left out, as they cannot be addressed without a scope.
+    """
+    # ICMP-only sightings have no MAC yet, but the kernel resolved it to talk to them
+    for ip, mac, _, _ in read_neighbors(socket.AF_INET):
+        if ip in stream.hosts:
+            stream.push(ip, mac=mac)
+    taken = {host["mac"] for host in stream.hosts.values()} - {"-"}
+    router = RangeRouter(ranges6) if ranges6 else None
+    devices: Dict[str, List[str]] = {}
+    for ip, (mac, _) in found.items():
+        if mac not in taken:
+            devices.setdefault(mac if mac != "-" else ip, []).append(ip)
+    for addresses in devices.values():
+        addresses.sort(key=_ipv6_order)
+        primary = next((ip for ip in addresses if not ipaddress.IPv6Address(ip).is_link_local
+                        and (router is None or router.lookup(ip) is not None)), None)
+        if primary is None:
+            continue
+        rtt = next((found[ip][1] for ip in [primary] + addresses if found[ip][1] is not None), None)
+        stream.push(primary, via="NDP", mac=found[primary][0], ping=format_rtt(rtt), ipv6=",".join(addresses))
+
+
+# --- Pipeline ---
+
+def count_addresses(ranges: List[str], whole: bool = False) -> int:
+    """Number of addresses expand_targets() yields for `ranges` (none for IPv6 ranges)."""
+    total = 0
+    for spec in ranges:
+        network = ipaddress.ip_network(spec, strict=False)
+        if network.version == 6:
+            continue
+        size = network.num_addresses
+        total += size if whole or size <= 2 else size - 2
+    return total
+
+
+def log_detection(addresses: int, found: int, found_by: Dict[str, int], duration: float,
+                  rtt_metrics: Optional[Dict[str, Dict[str, float]]], log: LogCallback,
+                  earlier: int = 0) -> None:
+    """Log scan duration, detection rate and per-method counts (plus RTT estimates in debug).
+
+    `rtt_metrics` is RttEstimator.metrics(), or None for fixed timeouts.
+    `earlier` counts hosts resumed from a checkpoint that no method of this
+    scan found and the checkpoint did not say how they were found.
+    """
+    counts = sorted(found_by.items())
+    if earlier:
+        counts.append(("earlier run", earlier))
+    methods = ", ".join(f"{name} {count}" for name, count in counts) or "none"
+    log(f"Timing: {addresses} addresses in {duration:.1f}s "
+        f"({'fixed' if rtt_metrics is None else 'adaptive'} timeouts), "
+        f"{found} live ({found / max(1, addresses):.1%}); found by {methods}", "info")
+    if rtt_metrics is not None:
+        for subnet, stats in rtt_metrics.items():
+            log(f"RTT {subnet}: srtt {stats['srtt']:.2f}ms, rttvar {stats['rttvar']:.2f}ms, "
+                f"timeout {stats['rto']:.0f}ms, {stats['retries']} retries, loss {stats['loss']:.1%} "
+                f"({stats['samples']} replies)", "debug")
+
+
+def open_syn_scanner(rate: int, timeout: float, rtt: Optional[RttEstimator],
+                     log: LogCallback = _no_log) -> Optional[SynScanner]:
+    """A SYN scanner, or None (logged) if raw sockets are not allowed, so ports are scanned with connects."""
+    try:
+        return SynScanner(rate=rate, timeout=timeout, rtt=rtt)
+    except PermissionError as e:
+        log(f"SYN scan unavailable, using TCP connects: {e}", "error")
+        return None
+
+
+async def stream_scan(ranges: List[str], threads: int = 50, timeout: float = 1.0,
+                      ports: Optional[List[int]] = None, on_event: Optional[EventCallback] = None,
+                      on_host: Optional[Callable[[Dict[str, str]], None]] = None,
+                      control: Optional[ScanControl] = None,
+                      log: LogCallback = _no_log,
+                      resolver: Optional[ReverseResolver] = None,
+                      arp_rate: int = DEFAULT_ARP_RATE,
+                      store: Optional[ScanStore] = None,
+                      incremental: bool = False,
+                      adaptive: bool = True,
+                      sweeper: Optional[IcmpSweeper] = None,
+                      enricher: Optional[HostEnricher] = None,
+                      nmap: bool = True,
+                      whole: bool = False,
+                      found_by: Optional[Dict[str, int]] = None,
+                      checkpoint: Optional[ScanCheckpoint] = None,
+                      metrics: Optional[ScanMetrics] = None,
+                      progress: Optional[ScanProgress] = None,
+                      services: bool = False,
+                      syn: bool = False,
+                      syn_rate: int = DEFAULT_SYN_RATE,
+                      ipv6: bool = False) -> Dict[str, Dict[str, str]]:
+    """Discover and enrich hosts in one streaming pass.
+
+    on_event(kind, ip, fields) is called for every NEW host and field UPDATE,
+    on_host(record) once a host's enrichment is complete. Pass a `resolver`
+    kept between calls to reuse its DNS cache. `arp_rate` paces the ARP sweep
+    (frames per second per interface). Completed hosts are saved to `store`;
+    with `incremental`, hosts whose stored hostname/vendor/ports are still
+    fresh (and whose MAC is unchanged) reuse them instead of being looked up
+    again. With `adaptive`, every probe's timeout and retries follow the RTTs
+    measured so far (`timeout` is only the upper bound). With `syn`, ports
+    are scanned half-open from a raw socket at `syn_rate` SYNs per second
+    (falling back to TCP connects without root). With `services`, the service
+    on each open port is identified as soon as the port is found open;
+    fingerprints saved in `store` for the same MAC and port are reused
+    instead of connecting again. The duration and detection rate are logged
+    at the end. Returns all host records by IP.
+
+    IPv6 ranges are not swept address by address. With any of them, or with
+    `ipv6`, NDP discovery runs on the scanned links before the IPv4 probes
+    (so a host's IPv6 addresses are known by the time its MAC is), and the
+    IPv6 devices no IPv4 host has the MAC of are added once those finish.
+
+    Shard workers scanning many blocks in turn pass their long-lived
+    `sweeper` and `enricher` (which are then left open and decide
+    timeouts, ports, services and DNS themselves), skip `nmap`, sweep `whole` blocks
+    including their network/broadcast addresses and sum per-method counts
+    into `found_by`.
+
+    Progress is saved to `checkpoint` every few seconds, and when the scan
+    is cancelled; it is removed once the scan completes. A checkpoint loaded
+    from an earlier, stopped scan resumes it: its hosts are reported again
+    (enriching those that were still waiting), the ICMP sweep continues from
+    each range's cursor, and ARP and Nmap discovery run again unless they had
+    finished.
+
+    Probes, queue depths, phase durations (ndp, icmp, arp, nmap, discovery,
+    enrichment) and enrichment latencies are recorded in `metrics`; swept
+    addresses are counted in `progress`, which is complete once discovery
+    has finished.
+    """
+    # Nested ranges are covered by their parent's probes
+    ranges, ranges6 = split_families(outermost_ranges(ranges))
+    ipv6 = ipv6 or bool(ranges6)
+    metrics = metrics if metrics is not None else ScanMetrics()
+    stream = DiscoveryStream(metrics)
+    owned = sweeper is None
+    if owned:
+        rtt = RttEstimator(timeout=timeout, retries=2) if adaptive else None
+        sweeper = IcmpSweeper(concurrency=max(256, threads), timeout=timeout, retries=2, rtt=rtt)
+        detector = ServiceDetector(cache=store.fingerprints() if store is not None else None) \
+            if services and ports else None
+        syn_scanner = open_syn_scanner(syn_rate, timeout, rtt, log) if syn and ports else None
+        enricher = HostEnricher(workers=threads, timeout=timeout, ports=ports, pinger=sweeper,
+                                resolver=resolver, rtt=rtt, services=detector, port_scanner=syn_scanner)
+    rtt = sweeper.rtt
+    ports = enricher.ports
+    detector = enricher.services
+    for engine in (sweeper, enricher, enricher.port_scanner, detector):
+        if engine is not None:
+            engine.control = control
+            engine.metrics = metrics
+    if detector is not None and store is not None:
+        detector.on_identified = store.save_fingerprint
+    enricher.resolver.scan_metrics = metrics
+    enrich_queue: asyncio.Queue = asyncio.Queue()
+    metrics.track_queue("enrichment", enrich_queue)
+    metrics.track_queue("events", stream)
+    port_list = ",".join(map(str, ports)) if ports else None
+    reused: Dict[str, Set[str]] = {}
+    completed: Set[str] = set()
+    restored: Set[str] = set()
+    if checkpoint is not None:
+        restored = set(checkpoint.hosts)
+        for ip, record in checkpoint.hosts.items():
+            stream.restore(record, checkpoint.seen_by.get(ip, ()))
+        completed = checkpoint.completed
+        checkpoint.hosts = stream.hosts  # Saved as they fill in
+        checkpoint.seen_by = stream.seen_by
+        if progress is not None:
+            for spec, cursor in checkpoint.cursors.items():
+                progress.advance(spec, cursor)
+
+    async def probes() -> None:
+        try:
+            if checkpoint is not None and checkpoint.discovered:
+                log("Discovery had finished before the scan stopped; enriching the remaining hosts", "info")
+                if progress is not None:
+                    progress.finish()
+                return
+            nmap_ranges = nmap and bool(ranges)
+            log(f"Running {'NDP discovery, ' if ipv6 else ''}ICMP sweep, ARP sweep"
+                f"{' and Nmap host discovery' if nmap_ranges else ''}...", "info")
+
+            async def discover() -> None:
+                found6 = await metrics.timed("ndp", ndp_source(stream, ranges, ranges6, timeout, control, log,
+                                                               metrics)) if ipv6 else {}
+                await asyncio.gather(
+                    metrics.timed("icmp", icmp_source(stream, ranges, sweeper, log, whole, checkpoint, progress)),
+                    metrics.timed("arp", arp_source(stream, ranges, arp_rate, timeout, control, log, rtt, whole,
+                                                    metrics)),
+                    metrics.timed("nmap", nmap_source(stream, ranges, threads, timeout, control, log))
+                    if nmap_ranges else asyncio.sleep(0),
+                )
+                if found6:
+                    ndp_hosts(stream, found6, ranges6)
+
+            await metrics.timed("discovery", discover())
+            if checkpoint is not None:
+                checkpoint.discovered = True
+            if progress is not None:
+                progress.finish()
+            log(f"Discovery finished: {len(stream.hosts)} live hosts", "info")
+        finally:
+            stream.discovered()
+
+    async def consume() -> None:
+        async for kind, ip, fields in stream:
+            if kind == DISCOVERED:
+                enrich_queue.put_nowait(None)  # Queued behind every host found
+                continue
+            if kind == NEW:
+                if ip in completed:
+                    if on_host:
+                        on_host(dict(stream.hosts[ip]))  # Done before the scan stopped
+                else:
+                    enrich_queue.put_nowait(ip)
+                if checkpoint is not None:
+                    checkpoint.dirty = True
+            if on_event:
+                on_event(kind, ip, fields)
+
+    def field_update(ip: str, fields: Dict[str, str]) -> None:
+        stream.update(ip, **fields)
+
+    def skip(ip: str) -> Set[str]:
+        if store is None or not incremental:
+            return set()
+        cached = store.cached_fields(ip, stream.hosts[ip]["mac"], port_list)
+        if cached:
+            stream.update(ip, **cached)
+        reused[ip] = set(cached)
+        return reused[ip]
+
+    def host_done(record: Dict[str, str]) -> None:
+        host = stream.hosts[record["ip"]]
+        completed.add(host["ip"])
+        if checkpoint is not None:
+            checkpoint.dirty = True
+        if store is not None:
+            refreshed = set(HOST_FIELDS) - reused.get(host["ip"], set())
+            if not ports:
+                refreshed.discard("ports")  # Not scanned this time; keep what is stored
+            if not ports or detector is None:
+                refreshed.discard("services")
+            store.save_host(host, refreshed, port_list)
+        if on_host:
+            on_host(dict(host))
+
+    async def enrich() -> None:
+        try:
+            await metrics.timed("enrichment", enricher.run(enrich_queue, host_done, on_update=field_update,
+                                                           known=stream.hosts, skip=skip))
+        finally:
+            stream.close()
+
+    start = time.monotonic()
+    saver = asyncio.ensure_future(checkpoint.autosave(log)) if checkpoint is not None else None
+    finished = False
+    try:
+        await asyncio.gather(probes(), enrich(), consume())
+        finished = True
+        log_detection(count_addresses(ranges, whole), len(stream.hosts), stream.found_by,
+                      time.monotonic() - start, rtt.metrics() if rtt else None, log,
+                      earlier=sum(1 for ip in restored if ip not in stream.seen_by))
+    finally:
+        metrics.untrack_queue(enrich_queue)
+        metrics.untrack_queue(stream)
+        if saver is not None:
+            saver.cancel()
+            checkpoint.close(finished, log)
+        if found_by is not None:
+            for name, count in stream.found_by.items():
+                found_by[name] = found_by.get(name, 0) + count
+        if owned:
+            enricher.close()
+            sweeper.close()
+            if syn_scanner is not None:
+                syn_scanner.close()
+            dns = enricher.resolver.metrics()
+            log(f"DNS: {dns['lookups']} lookups, {dns['cache_hits']} cached names, "
+                f"{dns['negative_hits']} cached misses, {dns['queries']} queries sent "
+                f"({dns['timeouts']} timed out)", "debug")
+            if detector is not None:
+                log(f"Services: {detector.probed} ports probed, {detector.cache_hits} fingerprints reused", "debug")
+        if incremental and store is not None:
+            log(f"Incremental: reused stored details for {sum(1 for f in reused.values() if f)} "
+                f"of {len(reused)} hosts", "debug")
+    return stream.hosts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Streaming host discovery and enrichment")
+    parser.add_argument("ranges", nargs="+", help="CIDR ranges to scan")
+    parser.add_argument("--threads", type=int, default=50, help="Hosts enriched in parallel (default: 50)")
+    parser.add_argument("--timeout", type=int, default=1000, help="Probe timeout in ms (default: 1000)")
+    parser.add_argument("--fixed-timeout", action="store_true",
+                        help="Always wait the full timeout instead of adapting it to measured RTTs")
+    parser.add_argument("--ports", default="top", help="Port list, e.g. 22,80,8000-8100 (default: top 10)")
+    parser.add_argument("--no-ports", action="store_true", help="Skip port scanning")
+    parser.add_argument("--syn", action="store_true", help="Scan ports half-open from a raw socket (needs root)")
+    parser.add_argument("--syn-rate", type=int, default=DEFAULT_SYN_RATE,
+                        help=f"SYNs per second with --syn (default: {DEFAULT_SYN_RATE})")
+    parser.add_argument("--services", action="store_true", help="Identify the service on each open port")
+    parser.add_argument("--arp-rate", type=int, default=DEFAULT_ARP_RATE,
+                        help=f"ARP frames per second per interface (default: {DEFAULT_ARP_RATE})")
+    parser.add_argument("--ipv6", action="store_true",
+                        help="Also discover IPv6 hosts on the scanned links (implied by IPv6 ranges)")
+    parser.add_argument("--store", nargs="?", const=DEFAULT_STORE, metavar="FILE",
+                        help=f"Save results to a SQLite store (default file: {DEFAULT_STORE})."
+                             " A range right after a bare --store is taken as FILE: name FILE or put the ranges first.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse fresh stored hostname/vendor/ports/services for unchanged hosts (implies --store)")
+    parser.add_argument("--resume", action="store_true", help="Continue a stopped or crashed scan of these ranges")
+    parser.add_argument("--metrics-file", metavar="FILE", default=textfile_path(),
+                        help="Write scan metrics to this Prometheus text file while scanning "
+                             "(default: $IP_SCANNER_METRICS or the node_exporter textfile collector)")
+    parser.add_argument("--log-file", metavar="FILE",
+                        help="Also append log lines to FILE (written in batches by a background thread)")
+    parser.add_argument("--debug", action="store_true", help="Verbose logging")
+    args = parser.parse_args(argv)
+
+    try:
+        for subnet in args.ranges:
+            ipaddress.ip_network(subnet, strict=False)
+        ports = None if args.no_ports else parse_ports(args.ports)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        log = ScanLogger(debug=args.debug, stream=sys.stdout, path=args.log_file)
+    except OSError as e:
+        parser.error(f"cannot write log file: {e}")
+
+    def report(host: Dict[str, str]) -> None:
+        print("\n".join([format_live_line(host)] + format_service_lines(host) + format_ipv6_lines(host)), flush=True)
+
+    checkpoint = open_checkpoint(args.ranges, ports, args.resume, log)
+    store = ScanStore(args.store or DEFAULT_STORE) if args.store or args.incremental else None
+    if store is not None:
+        store.begin_scan(args.ranges)
+    metrics = ScanMetrics()
+    try:
+        scan = stream_scan(args.ranges, threads=args.threads, timeout=args.timeout / 1000.0,
+                           ports=ports, on_host=report, log=log, arp_rate=args.arp_rate,
+                           store=store, incremental=args.incremental,
+                           adaptive=not args.fixed_timeout, checkpoint=checkpoint, metrics=metrics,
+                           services=args.services, syn=args.syn, syn_rate=args.syn_rate, ipv6=args.ipv6)
+        hosts = asyncio.run(metrics.track_scan(scan, count_addresses(outermost_ranges(args.ranges)),
+                                               args.metrics_file, log))
+        if store is not None:
+            new, gone = store.finish_scan(hosts)
+            log(f"Since the last scan: {len(new)} new ({', '.join(new) or '-'}), "
+                f"{len(gone)} gone ({', '.join(gone) or '-'})", "info")
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if store is not None:
+            store.close()
+        log.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+"""dns_resolver.py — Asynchronous reverse-DNS (PTR) resolver with a TTL cache
+
+Sends PTR queries over UDP straight to the nameservers from /etc/resolv.conf
+(or any HOST[:PORT] given, e.g. a local stub server) from one socket, with a
+concurrency limit and per-query timeout. Answers and failures (NXDOMAIN,
+timeouts) are both cached with a TTL in a bounded LRU, so repeated scans of
+the same segments in one session skip almost all DNS round-trips.
+/etc/hosts entries are answered locally.
+
+Usage: python3 scripts/dns_resolver.py [--server HOST[:PORT]] [--timeout MS] [--concurrency N] [IP ...]
+       Reads IPs from stdin if none are given. Prints one PTR|IP|HOSTNAME line per IP.
+"""
+import argparse
+import asyncio
+import ipaddress
+import os
+import secrets
+import socket
+import struct
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+RESOLV_CONF = "/etc/resolv.conf"
+HOSTS_FILE = "/etc/hosts"
+DNS_PORT = 53
+
+TYPE_PTR = 12
+CLASS_IN = 1
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+
+Nameserver = Tuple[str, int]
+
+
+def reverse_name(ip: str) -> str:
+    """PTR query name for an address (in-addr.arpa / ip6.arpa)."""
+    return ipaddress.ip_address(ip).reverse_pointer
+
+
+def parse_nameserver(spec: str) -> Nameserver:
+    """Parse HOST, HOST:PORT, or [V6HOST]:PORT into (host, port)."""
+    spec = spec.strip()
+    if spec.startswith("["):
+        host, _, port = spec[1:].partition("]")
+        port = port.lstrip(":")
+    elif spec.count(":") == 1:
+        host, port = spec.split(":")
+    else:
+        host, port = spec, ""
+    ipaddress.ip_address(host)  # ValueError if not an address
+    return host, int(port) if port else DNS_PORT
+
+
+def load_nameservers(path: str = RESOLV_CONF) -> List[Nameserver]:
+    servers: List[Nameserver] = []
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    try:
+                        # Drop IPv6 zone ids (fe80::1%eth0)
+                        servers.append(parse_nameserver(fields[1].split("%")[0]))
+                    except ValueError:
+                        continue
+    except OSError:
+        pass
+    return servers
+
+
+def load_hosts_file(path: str = HOSTS_FILE) -> Dict[str, str]:
+    """Map each address in a hosts file to its first (canonical) name."""
+    table: Dict[str, str] = {}
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                fields = line.split("#", 1)[0].split()
+                if len(fields) < 2:
+                    continue
+                try:
+                    ip = str(ipaddress.ip_address(fields[0]))
+                except ValueError:
+                    continue
+                table.setdefault(ip, fields[1])
+    except OSError:
+        pass
+    return table
+
+
+# --- Wire format ---
+
+def build_ptr_query(qid: int, name: str) -> bytes:
+    header = struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0)  # RD set, one question
+    qname = b"".join(bytes([len(label)]) + label.encode("ascii")
+                     for label in name.rstrip(".").split(".")) + b"\0"
+    return header + qname + struct.pack("!HH", TYPE_PTR, CLASS_IN)
+
+
+def _read_name(data: bytes, offset: int) -> Tuple[str, int]:
+    """Decode a (possibly compressed) domain name; returns (name, offset after it)."""
+    labels = []
+    end = None
+    for _ in range(128):  # Bounds compression-pointer loops
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            return ".".join(labels), end if end is not None else offset
+        labels.append(data[offset:offset + length].decode("ascii", errors="replace"))
+        offset += length
+    raise ValueError("name compression loop")
+
+
+def parse_ptr_response(data: bytes) -> Tuple[int, str, int, Optional[str], int]:
+    """Parse a PTR response into (id, question name, rcode, hostname or None, ttl).
+
+    Raises ValueError (or IndexError/struct.error) on malformed packets.
+    """
+    qid, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", data[:12])
+    if not flags & 0x8000:
+        raise ValueError("not a response")
+    offset = 12
+    qname = ""
+    for i in range(qdcount):
+        name, offset = _read_name(data, offset)
+        if i == 0:
+            qname = name
+        offset += 4
+    for _ in range(ancount):
+        _, offset = _read_name(data, offset)
+        rtype, rclass, ttl, rdlength = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        if rtype == TYPE_PTR and rclass == CLASS_IN:
+            hostname, _ = _read_name(data, offset)
+            return qid, qname, flags & 0x0F, hostname, ttl
+        offset += rdlength
+    return qid, qname, flags & 0x0F, None, 0
+
+
+# --- Cache ---
+
+class DnsCache:
+    """Bounded LRU of ip -> (hostname or None, expiry). None entries are cached failures."""
+
+    def __init__(self, max_entries: int = 65536):
+        self.max_entries = max(1, int(max_entries))
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, ip: str) -> Tuple[bool, Optional[str]]:
+        """(hit, hostname); a hit with hostname None is a cached failure."""
+        entry = self._entries.get(ip)
+        if entry is None:
+            return False, None
+        hostname, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[ip]
+            return False, None
+        self._entries.move_to_end(ip)
+        return True, hostname
+
+    def put(self, ip: str, hostname: Optional[str], ttl: float) -> None:
+        self._entries[ip] = (hostname, time.monotonic() + ttl)
+        self._entries.move_to_end(ip)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# --- Resolver ---
+
+class ReverseResolver:
+    """Asynchronous PTR resolver with a session-wide cache.
+
+    At most `concurrency` queries are in flight; each waits `timeout` seconds
+    and is retried `retries` times, rotating through the nameservers.
+    Positive answers are cached for their record TTL (clamped to
+    [min_ttl, max_ttl]), failures for `negative_ttl`. close() only releases
+    the sockets, so one resolver (and its cache) can serve many scans.
+    """
+
+    def __init__(self, nameservers: Optional[List[Nameserver]] = None, concurrency: int = 64,
+                 timeout: float = 1.0, retries: int = 1, cache_size: int = 65536,
+                 negative_ttl: float = 300.0, min_ttl: float = 60.0, max_ttl: float = 3600.0,
+                 hosts_file: Optional[str] = HOSTS_FILE):
+        self.nameservers = list(nameservers) if nameservers is not None else load_nameservers()
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = max(0.05, float(timeout))
+        self.retries = max(0, int(retries))
+        self.negative_ttl = float(negative_ttl)
+        self.min_ttl = float(min_ttl)
+        self.max_ttl = max(self.min_ttl, float(max_ttl))
+        self.cache = DnsCache(cache_size)
+        self.hosts_file = hosts_file
+        self._hosts: Dict[str, str] = {}
+        self._hosts_mtime: Optional[float] = None
+        self._socks: Dict[int, socket.socket] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._pending: Dict[int, Tuple[str, Nameserver, asyncio.Future]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {
+            "lookups": 0,
+            "hosts_hits": 0,
+            "cache_hits": 0,
+            "negative_hits": 0,
+            "queries": 0,
+            "timeouts": 0,
+        }
+        self.scan_metrics = None  # Optional ScanMetrics of the current scan: counts queries, answers and queries in flight
+
+    # --- Socket handling ---
+
+    def _open(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self.close()
+        self._loop = loop
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._reload_hosts()
+
+    def _socket_for(self, family: int) -> socket.socket:
+        sock = self._socks.get(family)
+        if sock is None:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.bind(("::" if family == socket.AF_INET6 else "0.0.0.0", 0))
+            self._socks[family] = sock
+            self._loop.add_reader(sock.fileno(), self._on_readable, sock)
+        return sock
+
+    def close(self) -> None:
+        for sock in self._socks.values():
+            try:
+                if self._loop is not None and not self._loop.is_closed():
+                    self._loop.remove_reader(sock.fileno())
+            except (ValueError, RuntimeError):
+                pass
+            sock.close()
+        self._socks.clear()
+        for _, _, future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+        self._inflight.clear()
+        self._loop = None
+
+    def _reload_hosts(self) -> None:
+        if not self.hosts_file:
+            return
+        try:
+            mtime = os.stat(self.hosts_file).st_mtime
+        except OSError:
+            self._hosts, self._hosts_mtime = {}, None
+            return
+        if mtime != self._hosts_mtime:
+            self._hosts = load_hosts_file(self.hosts_file)
+            self._hosts_mtime = mtime
+
+    def _next_qid(self) -> int:
+        # Random ids so off-path replies can't be guessed
+        while True:
+            qid = secrets.randbelow(0x10000)
+            if qid not in self._pending:
+                return qid
+
+    def _on_readable(self, sock: socket.socket) -> None:
+        while True:
+            try:
+                data, addr = sock.recvfrom(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            try:
+                qid, qname, rcode, hostname, ttl = parse_ptr_response(data)
+            except (ValueError, IndexError, struct.error):
+                continue
+            pending = self._pending.get(qid)
+            if pending is None:
+                continue
+            name, server, future = pending
+            if (addr[0], addr[1]) != server or qname.lower() != name.lower() or future.done():
+                continue  # Not the answer to this question
+            future.set_result((rcode, hostname, ttl))
+
+    # --- Lookups ---
+
+    async def _query(self, name: str, server: Nameserver) -> Optional[Tuple[int, Optional[str], int]]:
+        """One PTR query; (rcode, hostname, ttl), or None on timeout/send failure."""
+        family = socket.AF_INET6 if ":" in server[0] else socket.AF_INET
+        qid = self._next_qid()
+        future = self._loop.create_future()
+        self._pending[qid] = (name, server, future)
+        self._stats["queries"] += 1
+        metrics = self.scan_metrics
+        try:
+            try:
+                self._socket_for(family).sendto(build_ptr_query(qid, name), server)
+            except OSError:
+                return None
+            if metrics:
+                metrics.inc("ipscan_probes_sent_total", probe="dns")
+                metrics.add("ipscan_probes_in_flight", 1, probe="dns")
+            try:
+                answer = await asyncio.wait_for(future, self.timeout)
+            finally:
+                if metrics:
+                    metrics.add("ipscan_probes_in_flight", -1, probe="dns")
+            if metrics:
+                metrics.inc("ipscan_probe_replies_total", probe="dns")
+            return answer
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            return None
+        finally:
+            if self._pending.get(qid, (None, None, None))[2] is future:
+                del self._pending[qid]
+
+    async def _lookup(self, ip: str) -> Optional[str]:
+        name = reverse_name(ip)
+        async with self._sem:
+            for attempt in range(self.retries + 1):
+                if not self.nameservers:
+                    break
+                server = self.nameservers[attempt % len(self.nameservers)]
+                answer = await self._query(name, server)
+                if answer is None:
+                    continue
+                rcode, hostname, ttl = answer
+                if rcode == RCODE_NOERROR and hostname:
+                    hostname = hostname.rstrip(".")
+                    self.cache.put(ip, hostname, min(max(ttl, self.min_ttl), self.max_ttl))
+                    return hostname
+                if rcode in (RCODE_NOERROR, RCODE_NXDOMAIN):
+                    break  # Authoritative "no name"; other servers would say the same
+        self.cache.put(ip, None, self.negative_ttl)
+        return None
+
+    async def resolve(self, ip: str) -> Optional[str]:
+        """Hostname for an IP, or None. Concurrent lookups of the same IP share one query."""
+        self._open()
+        self._stats["lookups"] += 1
+        try:
+            ip = str(ipaddress.ip_address(ip))
+        except ValueError:
+            return None
+        if ip in self._hosts:
+            self._stats["hosts_hits"] += 1
+            return self._hosts[ip]
+        hit, hostname = self.cache.get(ip)
+        if hit:
+            self._stats["cache_hits" if hostname else "negative_hits"] += 1
+            return hostname
+        inflight = self._inflight.get(ip)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        task = asyncio.ensure_future(self._lookup(ip))
+        self._inflight[ip] = task
+        task.add_done_callback(lambda done: self._lookup_done(ip, done))
+        return await asyncio.shield(task)
+
+    def _lookup_done(self, ip: str, task: asyncio.Future) -> None:
+        if self._inflight.get(ip) is task:
+            del self._inflight[ip]
+
+    def metrics(self) -> Dict[str, int]:
+        """Lookup/cache/query counters for this resolver's lifetime."""
+        stats = dict(self._stats)
+        stats["cached"] = len(self.cache)
+        return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Asynchronous reverse-DNS lookups")
+    parser.add_argument("ips", nargs="*", help="Addresses to resolve (default: read from stdin)")
+    parser.add_argument("--server", action="append", default=[],
+                        help="Nameserver HOST[:PORT], repeatable (default: /etc/resolv.conf)")
+    parser.add_argument("--timeout", type=int, default=1000, help="Per-query timeout in ms (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=64, help="Max queries in flight (default: 64)")
+    parser.add_argument("--retries", type=int, default=1, help="Extra attempts per lookup (default: 1)")
+    args = parser.parse_args(argv)
+
+    try:
+        servers = [parse_nameserver(s) for s in args.server] or None
+    except ValueError as e:
+        parser.error(f"invalid --server: {e}")
+
+    ips = args.ips or [line.strip() for line in sys.stdin if line.strip()]
+    resolver = ReverseResolver(nameservers=servers, concurrency=args.concurrency,
+                               timeout=args.timeout / 1000.0, retries=args.retries)
+
+    async def run():
+        async def one(ip: str) -> None:
+            # Format: PTR|IP|HOSTNAME
+            print(f"PTR|{ip}|{await resolver.resolve(ip) or '-'}", flush=True)
+
+        try:
+            await asyncio.gather(*(one(ip) for ip in ips))
+        finally:
+            resolver.close()
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""enrichment.py — Concurrent per-host enrichment stage
+
+Resolves hostname, MAC/vendor, RTT and open ports for many live hosts at
+once with a bounded pool of workers, and reports each host as soon as it is
+done rather than in input order. Optionally, the service on each open port
+is identified as soon as the port is found open (service_detect.py).
+
+Usage: python3 scripts/enrichment.py [--threads N] [--timeout MS] [--ports LIST | --no-ports] [--services]
+                                     [--rtt-data FILE] < hosts.txt
+       Prints one LIVE|IP|HOSTNAME|MAC|VENDOR|PORTS|PING line per host
+       (and, with --services, a SERVICE|IP|PORT|NAME|DETAIL line per open port).
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Awaitable, Callable, Collection, Dict, Iterable, List, Optional, Tuple, TypeVar, Union
+
+from dns_resolver import ReverseResolver
+from icmp_sweep import IcmpSweeper
+from oui_db import OuiDatabase, open_default
+from port_scanner import OPEN, PortScanner, format_ports, parse_ports
+from rtt_estimator import RttEstimator
+from service_detect import UNKNOWN, ServiceDetector, format_services, parse_services
+from syn_scan import SynScanner
+
+# Kernel neighbor (ARP) cache
+PROC_NET_ARP = "/proc/net/arp"
+
+_INCOMPLETE_MAC = "00:00:00:00:00:00"
+
+# Re-read the kernel neighbor cache at most this often (seconds) while hosts stream in
+NEIGHBOR_REFRESH = 1.0
+
+HostRecord = Dict[str, str]
+HostCallback = Callable[[HostRecord], None]
+UpdateCallback = Callable[[str, Dict[str, str]], None]
+SkipCallback = Callable[[str], Collection[str]]
+T = TypeVar("T")
+
+
+def load_rtt_data(path: str) -> Dict[str, float]:
+    """Parse RTTs recorded by the discovery sweep (IP<TAB>RTT_MS) into {ip: rtt_ms}."""
+    table: Dict[str, float] = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2:
+                    try:
+                        table.setdefault(fields[0], float(fields[1]))
+                    except ValueError:
+                        continue
+    except OSError:
+        pass
+    return table
+
+
+def load_neighbor_table(path: str = PROC_NET_ARP) -> Dict[str, str]:
+    """Read the kernel ARP cache into {ip: mac}, skipping incomplete entries."""
+    table: Dict[str, str] = {}
+    try:
+        with open(path) as f:
+            next(f, None)  # Header line
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 4 and fields[3] != _INCOMPLETE_MAC:
+                    table[fields[0]] = fields[3].lower()
+    except OSError:
+        pass
+    return table
+
+
+def format_rtt(rtt_ms: Optional[float]) -> str:
+    """Format a round-trip time for the Ping column."""
+    return f"{rtt_ms:.2f}ms" if rtt_ms is not None else "-"
+
+
+def format_live_line(host: HostRecord) -> str:
+    """Format a host record as LIVE|IP|HOSTNAME|MAC|VENDOR|PORTS|PING."""
+    return "LIVE|{ip}|{hostname}|{mac}|{vendor}|{ports}|{ping}".format(**host)
+
+
+def format_service_lines(host: HostRecord) -> List[str]:
+    """Format a host's identified services as SERVICE|IP|PORT|NAME|DETAIL lines."""
+    lines = []
+    for port, fingerprint in parse_services(host.get("services", "-")).items():
+        name, _, detail = fingerprint.partition(" ")
+        lines.append(f"SERVICE|{host['ip']}|{port}|{name}|{detail or '-'}")
+    return lines
+
+
+def format_ipv6_lines(host: HostRecord) -> List[str]:
+    """Format a host's IPv6 addresses as an IPV6|IP|ADDRESSES line (none if it has none)."""
+    addresses = host.get("ipv6", "-")
+    return [f"IPV6|{host['ip']}|{addresses}"] if addresses != "-" else []
+
+
+class HostEnricher:
+    """Bounded worker pool that enriches live hosts concurrently.
+
+    `workers` hosts are enriched at the same time (the TUI's Threads value),
+    also when several run() calls share the enricher; within a host, the
+    hostname lookup, ping and port scan also run in parallel. `timeout`
+    (seconds) bounds each individual lookup or probe. Pass `ports=None` to
+    skip port scanning, and a SynScanner as `port_scanner` to scan them
+    half-open. Hosts with an RTT in `rtts` (recorded by the discovery sweep)
+    are not pinged again; the rest share one in-process ICMP socket (`pinger`,
+    which may be the discovery sweeper). Hostnames come from an asynchronous
+    PTR `resolver`; pass a long-lived one to reuse its cache across scans.
+    Vendors for any known MAC come from the `oui` database (see oui_db.py)
+    when discovery did not supply one. An `rtt` estimator makes the owned
+    pinger and port scanner adapt their timeouts and retries to the RTTs
+    measured during the scan. With a `services` detector, each port is
+    identified as soon as its probe finds it open, while the host's other
+    ports are still being probed. With `metrics` set, each lookup's duration
+    and each host's enrichment time are recorded there.
+    """
+
+    def __init__(self, workers: int = 50, timeout: float = 1.0,
+                 ports: Optional[List[int]] = None,
+                 rtts: Optional[Dict[str, float]] = None,
+                 port_scanner: Optional[Union[PortScanner, SynScanner]] = None,
+                 pinger: Optional[IcmpSweeper] = None,
+                 resolver: Optional[ReverseResolver] = None,
+                 oui: Optional[OuiDatabase] = None,
+                 rtt: Optional[RttEstimator] = None,
+                 services: Optional[ServiceDetector] = None):
+        self.workers = max(1, int(workers))
+        self._slots: Optional[asyncio.Semaphore] = None  # `workers` hosts at a time across run() calls
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.timeout = max(0.05, float(timeout))
+        self.ports = ports
+        self.rtts = rtts or {}
+        self.neighbors: Dict[str, str] = {}
+        self._neighbors_read = 0.0
+        self._owns_pinger = pinger is None
+        self.pinger: Optional[IcmpSweeper] = pinger or IcmpSweeper(concurrency=self.workers,
+                                                                   timeout=self.timeout, rtt=rtt)
+        self.control = None  # Optional ScanControl: waited on before each host
+        self.metrics = None  # Optional ScanMetrics: lookup and per-host enrichment latencies
+        self.port_scanner = port_scanner or PortScanner(concurrency=self.workers, timeout=self.timeout, rtt=rtt)
+        self.services = services
+        self._owns_oui = oui is None
+        self.oui = oui or open_default()  # None until `oui_db.py build` has been run
+        self.resolver = resolver or ReverseResolver(concurrency=self.workers, timeout=max(self.timeout, 1.0))
+
+    def close(self) -> None:
+        self.resolver.close()  # Releases the socket only; the cache stays with the resolver
+        if self.pinger and self._owns_pinger:
+            self.pinger.close()
+        if self.oui and self._owns_oui:
+            self.oui.close()
+
+    async def resolve_hostname(self, ip: str) -> str:
+        return await self.resolver.resolve(ip) or "-"
+
+    async def ping(self, ip: str) -> Optional[float]:
+        """RTT in ms from discovery if known, else one in-process echo; None if no reply."""
+        if ip in self.rtts:
+            return self.rtts[ip]
+        if self.pinger is None:
+            return None
+        try:
+            return await self.pinger.ping(ip)
+        except PermissionError:
+            self.pinger = None  # No ICMP socket available; leave RTT empty
+            return None
+
+    def lookup_mac(self, ip: str) -> Tuple[str, str]:
+        now = time.monotonic()
+        if ip not in self.neighbors and now - self._neighbors_read >= NEIGHBOR_REFRESH:
+            # Discovery probes keep filling the neighbor cache while hosts stream in
+            self.neighbors = load_neighbor_table()
+            self._neighbors_read = now
+        return self.neighbors.get(ip, "-"), "-"
+
+    def vendor_for(self, mac: str) -> str:
+        if self.oui is None:
+            return "-"
+        return self.oui.lookup(mac) or "-"
+
+    async def _step(self, step: str, lookup: Awaitable[T]) -> T:
+        """Await one enrichment lookup, recording how long it took."""
+        if not self.metrics:
+            return await lookup
+        start = time.monotonic()
+        try:
+            return await lookup
+        finally:
+            self.metrics.observe("ipscan_enrichment_step_seconds", time.monotonic() - start, step=step)
+
+    async def enrich(self, ip: str, on_update: Optional[UpdateCallback] = None,
+                     known: Optional[HostRecord] = None, skip: Collection[str] = ()) -> HostRecord:
+        """Gather all details for one host concurrently.
+
+        Each field is reported through on_update(ip, {field: value}) as soon
+        as its lookup finishes. Fields already present in `known` (from
+        discovery) are not looked up again, nor are fields named in `skip`
+        (e.g. still-fresh values from a previous scan).
+        """
+        known = known or {}
+        record: HostRecord = {"ip": ip, "hostname": "-", "mac": "-", "vendor": "-", "ports": "-",
+                              "services": "-", "ping": "-"}
+        record.update({k: v for k, v in known.items() if k in record and v and v != "-"})
+
+        def report(**fields: str) -> None:
+            fields = {k: v for k, v in fields.items() if v != "-"}
+            record.update(fields)
+            if on_update and fields:
+                on_update(ip, fields)
+
+        if record["mac"] == "-":
+            mac, vendor = self.lookup_mac(ip)
+            report(mac=mac, vendor=vendor)
+        if "vendor" not in skip and record["mac"] != "-" and \
+                (record["vendor"] == "-" or record["vendor"].startswith("(Unknown")):
+            report(vendor=self.vendor_for(record["mac"]))
+
+        async def hostname() -> None:
+            if record["hostname"] == "-" and "hostname" not in skip:
+                report(hostname=await self._step("dns", self.resolve_hostname(ip)))
+
+        async def ping() -> None:
+            if record["ping"] == "-":
+                report(ping=format_rtt(await self._step("ping", self.ping(ip))))
+
+        async def ports() -> None:
+            if not self.ports:
+                return
+            detecting = self.services is not None and "services" not in skip
+            found: Dict[int, asyncio.Future] = {}
+
+            def identify(ip: str, port: int, state: str) -> None:
+                if state == OPEN:
+                    found[port] = asyncio.ensure_future(self.services.identify(ip, port, record["mac"]))
+
+            try:
+                if "ports" not in skip:
+                    states = await self._step("ports", self.port_scanner.scan_host(
+                        ip, self.ports, on_result=identify if detecting else None))
+                    report(ports=format_ports(states))
+                elif detecting and record["ports"] != "-":
+                    # Reused ports from an earlier scan that ran without service detection
+                    for port in record["ports"].split(","):
+                        identify(ip, int(port), OPEN)
+                if found:
+                    # One port's failed identification must not cost the host (or the scan) the rest
+                    fingerprints = await self._step("services", asyncio.gather(*found.values(),
+                                                                               return_exceptions=True))
+                    report(services=format_services({port: UNKNOWN if isinstance(fingerprint, BaseException)
+                                                     else fingerprint
+                                                     for port, fingerprint in zip(found, fingerprints)}))
+            finally:
+                for future in found.values():
+                    future.cancel()  # Scan stopped while services were still being identified
+
+        await asyncio.gather(hostname(), ping(), ports())
+        return record
+
+    async def run(self, hosts: Union[Iterable[str], asyncio.Queue], on_host: HostCallback,
+                  on_update: Optional[UpdateCallback] = None,
+                  known: Optional[Dict[str, HostRecord]] = None,
+                  skip: Optional[SkipCallback] = None) -> int:
+        """Enrich all hosts, calling on_host(record) as each one completes. Returns the host count.
+
+        `hosts` is either an iterable or an asyncio.Queue of IPs ended by None,
+        so hosts can be enriched while discovery is still finding more.
+        skip(ip), called just before a host is enriched, names fields to leave alone.
+        """
+        known = known if known is not None else {}
+        done = 0
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._slots_loop = loop
+        slots = self._slots
+        if isinstance(hosts, asyncio.Queue):
+            queue = hosts
+
+            async def next_host() -> Optional[str]:
+                ip = await queue.get()
+                if ip is None:
+                    queue.put_nowait(None)  # Let the other workers see the end too
+                return ip
+        else:
+            pending = iter(hosts)
+
+            async def next_host() -> Optional[str]:
+                return next(pending, None)
+
+        async def worker():
+            nonlocal done
+            while True:
+                ip = await next_host()
+                if ip is None:
+                    return
+                async with slots:
+                    if self.control:
+                        await self.control.wait()
+                    start = time.monotonic()
+                    record = await self.enrich(ip, on_update, known.get(ip), skip(ip) if skip else ())
+                if self.metrics:
+                    self.metrics.observe("ipscan_host_enrichment_seconds", time.monotonic() - start)
+                    self.metrics.inc("ipscan_hosts_enriched_total")
+                on_host(record)
+                done += 1
+
+        await asyncio.gather(*(worker() for _ in range(self.workers)))
+        return done
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent live-host enrichment")
+    parser.add_argument("--threads", type=int, default=50, help="Hosts enriched in parallel (default: 50)")
+    parser.add_argument("--timeout", type=int, default=1000, help="Per-lookup timeout in ms (default: 1000)")
+    parser.add_argument("--ports", default="top", help="Port list, e.g. 22,80,8000-8100 (default: top 10)")
+    parser.add_argument("--no-ports", action="store_true", help="Skip port scanning")
+    parser.add_argument("--services", action="store_true", help="Identify the service on each open port")
+    parser.add_argument("--rtt-data", help="Discovery RTTs (IP<TAB>RTT_MS) so hosts aren't pinged twice")
+    args = parser.parse_args(argv)
+
+    try:
+        ports = None if args.no_ports else parse_ports(args.ports)
+    except ValueError as e:
+        parser.error(str(e))
+
+    hosts = list(dict.fromkeys(line.strip() for line in sys.stdin if line.strip()))
+    enricher = HostEnricher(
+        workers=args.threads,
+        timeout=args.timeout / 1000.0,
+        ports=ports,
+        rtts=load_rtt_data(args.rtt_data) if args.rtt_data else None,
+        services=ServiceDetector() if args.services and ports else None,
+    )
+
+    def report(host: HostRecord) -> None:
+        print("\n".join([format_live_line(host)] + format_service_lines(host)), flush=True)
+
+    try:
+        asyncio.run(enricher.run(hosts, report))
+    finally:
+        enricher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
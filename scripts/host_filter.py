@@ -0,0 +1,238 @@
+"""host_filter.py — Indexed live filter over a HostStore's hosts
+
+A HostIndex is kept up to date by the store as hosts stream in: an inverted
+index from open port to hosts, word-prefix indexes over vendors and
+hostnames, and the hosts' IPs (IPv4 and IPv6 apart) in sorted order for
+CIDR lookups. A filter such as `port:22 vendor:cisco 10.1.0.0/16 rtt>50` is
+parsed once into a HostFilter; rows() answers it from the indexes
+(intersecting the smallest sets first, checking RTT only on what is left),
+and match() checks a single host as it changes, so a filter stays current
+without re-evaluating.
+
+Filter terms (all must match):
+  port:N            port N is open
+  vendor:TEXT       a word of the vendor starts with TEXT (case-insensitive)
+  host:TEXT         a word of the hostname starts with TEXT
+  rtt>N rtt<N       ping RTT in ms (also >= and <=); hosts without an RTT never match
+  10.1.0.0/16 or IP the host is in that range (IPv6 ranges such as fd00::/64 too)
+  TEXT              a vendor or hostname word starts with TEXT
+"""
+import bisect
+import ipaddress
+import re
+from array import array
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+if TYPE_CHECKING:
+    from host_store import HostStore
+
+_WORD = re.compile(r"[^\W_]+")
+_RTT = re.compile(r"rtt(<=|>=|<|>)(\d+(?:\.\d+)?)$")
+_COMPARE: Dict[str, Callable[[float, float], bool]] = {
+    "<": float.__lt__, ">": float.__gt__, "<=": float.__le__, ">=": float.__ge__,
+}
+FIELD_ALIASES = {"vendor": "vendor", "host": "hostname", "hostname": "hostname"}
+
+# Hosts' IPs are ints, IPv6 ones offset past every IPv4 one so both share one order (host_store.ip_to_int)
+IPV6_BASE = 1 << 32
+
+Term = Tuple[str, object]
+
+
+def words(value: str) -> List[str]:
+    """Case-folded words of a vendor or hostname ("Cisco Systems, Inc" -> cisco, systems, inc)."""
+    return _WORD.findall(value.casefold()) if value != "-" else []
+
+
+class PrefixIndex:
+    """Word -> rows, with the words kept sorted so a prefix is one bisect and a short walk."""
+
+    def __init__(self):
+        self.rows: Dict[str, Set[int]] = {}
+        self._words: List[str] = []
+
+    def add(self, row: int, value: str) -> None:
+        for word in words(value):
+            rows = self.rows.get(word)
+            if rows is None:
+                rows = self.rows[word] = set()
+                bisect.insort(self._words, word)
+            rows.add(row)
+
+    def remove(self, row: int, value: str) -> None:
+        for word in words(value):
+            rows = self.rows.get(word)
+            if rows is None:
+                continue
+            rows.discard(row)
+            if not rows:
+                del self.rows[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+
+    def prefix(self, prefix: str) -> Set[int]:
+        """Rows with a word starting with `prefix`."""
+        found: Set[int] = set()
+        i = bisect.bisect_left(self._words, prefix)
+        while i < len(self._words) and self._words[i].startswith(prefix):
+            found |= self.rows[self._words[i]]
+            i += 1
+        return found
+
+
+class HostIndex:
+    """Indexes over one HostStore, updated by the store on every change."""
+
+    def __init__(self):
+        self.ports: Dict[int, Set[int]] = {}
+        self.text = {"vendor": PrefixIndex(), "hostname": PrefixIndex()}
+        self._addresses = array("I")  # Sorted IPv4s, with the row of each in _address_rows
+        self._address_rows: List[int] = []
+        self._addresses6: List[int] = []  # The same for IPv6 hosts
+        self._address_rows6: List[int] = []
+
+    def _sorted(self, address: int) -> Tuple[Sequence[int], List[int]]:
+        if address >= IPV6_BASE:
+            return self._addresses6, self._address_rows6
+        return self._addresses, self._address_rows
+
+    def add_host(self, row: int, address: int) -> None:
+        addresses, rows = self._sorted(address)
+        i = bisect.bisect(addresses, address)
+        addresses.insert(i, address)
+        rows.insert(i, row)
+
+    def set_ports(self, row: int, old: Sequence[int], new: Sequence[int]) -> None:
+        if old == new:
+            return
+        for port in set(new).difference(old):
+            self.ports.setdefault(port, set()).add(row)
+        for port in set(old).difference(new):
+            rows = self.ports.get(port)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self.ports[port]
+
+    def set_text(self, field: str, row: int, old: str, new: str) -> None:
+        index = self.text.get(field)
+        if index is not None and old != new:
+            index.remove(row, old)
+            index.add(row, new)
+
+    def in_range(self, low: int, high: int) -> Set[int]:
+        """Rows with an IP in [low, high] (both IPv4 or both IPv6)."""
+        addresses, rows = self._sorted(low)
+        start = bisect.bisect_left(addresses, low)
+        end = bisect.bisect_right(addresses, high)
+        return set(rows[start:end])
+
+
+def _range(token: str) -> Term:
+    try:
+        network = ipaddress.ip_network(token, strict=False)
+    except ValueError:
+        raise ValueError(f"Invalid address or range {token!r}") from None
+    base = IPV6_BASE if network.version == 6 else 0
+    return "range", (base + int(network.network_address), base + int(network.broadcast_address))
+
+
+def _term(token: str) -> Term:
+    if token.count(":") > 1:
+        return _range(token)  # IPv6
+    key, sep, value = token.partition(":")
+    if sep:
+        key = key.casefold()
+        if key == "port":
+            if not value.isdigit() or int(value) > 65535:
+                raise ValueError(f"Invalid port in {token!r}")
+            return "port", int(value)
+        if key in FIELD_ALIASES:
+            prefixes = words(value)
+            if not prefixes:
+                raise ValueError(f"Nothing to match in {token!r}")
+            return FIELD_ALIASES[key], prefixes
+        raise ValueError(f"Unknown filter {key!r}, expected port:, vendor:, host: or rtt")
+    rtt = _RTT.match(token.casefold())
+    if rtt:
+        return "rtt", (_COMPARE[rtt.group(1)], float(rtt.group(2)))
+    if token[0].isdigit() and ("." in token or "/" in token):
+        return _range(token)
+    prefixes = words(token)
+    if not prefixes:
+        raise ValueError(f"Nothing to match in {token!r}")
+    return "text", prefixes
+
+
+class HostFilter:
+    """A parsed filter query (ValueError if it is malformed); an empty query matches every host."""
+
+    def __init__(self, query: str):
+        self.query = query.strip()
+        self.terms: List[Term] = [_term(token) for token in self.query.split()]
+
+    def __bool__(self) -> bool:
+        return bool(self.terms)
+
+    def _indexed(self, store: "HostStore", kind: str, arg) -> Optional[Set[int]]:
+        """Rows matching one term from the indexes, or None for terms checked per row."""
+        index = store.index
+        if kind == "port":
+            return set(index.ports.get(arg, ()))
+        if kind == "range":
+            return index.in_range(*arg)
+        if kind in ("vendor", "hostname"):
+            return _all(index.text[kind].prefix(prefix) for prefix in arg)
+        if kind == "text":
+            return _all(index.text["vendor"].prefix(prefix) | index.text["hostname"].prefix(prefix)
+                        for prefix in arg)
+        return None
+
+    def rows(self, store: "HostStore") -> Set[int]:
+        """Every row of `store` the filter matches."""
+        sets = []
+        checks = []
+        for kind, arg in self.terms:
+            rows = self._indexed(store, kind, arg)
+            if rows is None:
+                checks.append((kind, arg))
+            else:
+                sets.append(rows)
+        if sets:
+            sets.sort(key=len)
+            matched = sets[0]
+            for rows in sets[1:]:
+                matched &= rows
+        else:
+            matched = set(range(len(store)))
+        for _, (compare, limit) in checks:  # RTT bounds, on the indexed result only
+            rtts = store.rtts
+            matched = {row for row in matched if compare(rtts[row], limit)}
+        return matched
+
+    def match(self, store: "HostStore", row: int) -> bool:
+        """Whether one row matches, from its current fields (for hosts that just changed)."""
+        for kind, arg in self.terms:
+            if kind == "port":
+                if arg not in store.ports[row]:
+                    return False
+            elif kind == "range":
+                if not arg[0] <= store.ip_int(row) <= arg[1]:
+                    return False
+            elif kind == "rtt":
+                compare, limit = arg
+                if not compare(store.rtts[row], limit):
+                    return False
+            else:
+                fields = ("vendor", "hostname") if kind == "text" else (kind,)
+                found = [word for field in fields for word in words(store.text[field][row])]
+                if not all(any(word.startswith(prefix) for word in found) for prefix in arg):
+                    return False
+        return True
+
+
+def _all(sets: Iterable[Set[int]]) -> Set[int]:
+    """Intersection of the given sets (every prefix of a term must match)."""
+    result: Optional[Set[int]] = None
+    for rows in sets:
+        result = rows if result is None else result & rows
+    return result if result is not None else set()
@@ -0,0 +1,259 @@
+"""host_store.py — Columnar in-memory store of the hosts shown in a results table
+
+Each host is one row across parallel columns: the IP as a 32-bit int (the
+few IPv6 hosts keep theirs in a side table), the ping RTT as a float (NaN
+when unknown), the open ports as a sorted tuple and the text fields as lists
+of strings. Repeated values (vendors, services, the same set of open ports)
+are interned, so hosts that look alike share one copy and a row costs a few
+pointers plus its IP and RTT instead of a dict of formatted strings. The store keeps a view order sorted by IP (numerically),
+RTT, open-port count or vendor, with ties broken by IP. Each row's sort key
+is kept up to date as the row changes, and the order is re-sorted in place,
+at most once per draw; as only a few rows move between draws, that is close
+to linear even for tens of thousands of hosts. A HostFilter narrows the view
+to the hosts it matches, answered from the store's HostIndex and kept
+current host by host as the scan reports changes.
+"""
+import math
+import socket
+from array import array
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from host_filter import IPV6_BASE, HostFilter, HostIndex
+
+# Row flags: new since the last stored scan, seen last time but not now, or down while monitoring
+NEW = 1
+GONE = 2
+DOWN = 4
+
+# Sort keys offered by HostStore.sort(), and the scan field each is computed from
+SORT_FIELDS = {"ip": "ip", "rtt": "ping", "ports": "ports", "vendor": "vendor"}
+SORT_KEYS = tuple(SORT_FIELDS)
+
+TEXT_FIELDS = ("hostname", "mac", "vendor", "services", "ipv6")
+UNKNOWN_RTT = float("nan")
+
+
+def parse_rtt(value: str) -> float:
+    """RTT in ms from a Ping cell ("0.42ms"), NaN for "-", "gone", "down" or anything else."""
+    if value.endswith("ms"):
+        try:
+            return float(value[:-2])
+        except ValueError:
+            pass
+    return UNKNOWN_RTT
+
+
+def format_rtt(rtt: float) -> str:
+    return "-" if math.isnan(rtt) else f"{rtt:.2f}ms"
+
+
+def ping_label(flags: int, rtt: float) -> str:
+    """Ping cell of a row: "gone", "down" or its RTT."""
+    return "gone" if flags & GONE else "down" if flags & DOWN else format_rtt(rtt)
+
+
+def parse_port_cell(value: str) -> Tuple[int, ...]:
+    """Ports in a Ports cell ("22,80,443"), sorted and without repeats; () for "-"."""
+    return tuple(sorted({int(port) for port in value.split(",") if port.strip().isdigit()}))
+
+
+def ip_to_int(ip: str) -> int:
+    """IP address as an int, IPv6 ones offset by IPV6_BASE so they sort after IPv4 (OSError if invalid)."""
+    if ":" in ip:
+        return IPV6_BASE + int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    return int.from_bytes(socket.inet_aton(ip), "big")
+
+
+def int_to_ip(address: int) -> str:
+    if address >= IPV6_BASE:
+        return socket.inet_ntop(socket.AF_INET6, (address - IPV6_BASE).to_bytes(16, "big"))
+    return socket.inet_ntoa(address.to_bytes(4, "big"))
+
+
+def format_port_cell(ports: Tuple[int, ...]) -> str:
+    """Inverse of parse_port_cell(): ascending, comma-separated, or "-"."""
+    return ",".join(map(str, ports)) if ports else "-"
+
+
+class HostStore:
+    """Hosts of one results table, column by column, with a sortable view order.
+
+    update() inserts or changes a host from scan fields (the same strings the
+    scan reports: "0.42ms", "22,80", ...); host() formats one back. The view
+    (order(), ip_at(), shown) follows the current sort and filter. Not
+    thread-safe: the TUI only touches it from its own thread.
+    """
+
+    def __init__(self):
+        self._rows: Dict[int, int] = {}  # IP as int -> row
+        self.ips = array("I")  # 0 for IPv6 hosts, whose IPs are in _ips6
+        self._ips6: Dict[int, int] = {}  # Row -> IP as int
+        self.rtts = array("d")
+        self.ports: List[Tuple[int, ...]] = []  # Sorted open ports of each row, interned
+        self.port_counts = array("H")
+        self.flags = bytearray()
+        self.text: Dict[str, List[str]] = {field: [] for field in TEXT_FIELDS}
+        self._strings: Dict[str, str] = {"-": "-"}  # One copy of each repeated value (vendors, services)
+        self._port_sets: Dict[Tuple[int, ...], Tuple[int, ...]] = {(): ()}  # The same for open ports
+        self.sort_key = "ip"
+        self.reverse = False
+        self._keys: List[Any] = []  # Row -> sort key for the current sort
+        self._order: List[int] = []  # View position -> row
+        self._sorted = True
+        self.index = HostIndex()
+        self.filter: Optional[HostFilter] = None
+        self._matched: Optional[Set[int]] = None  # Rows the filter matches (None: no filter)
+        self._pruned = False  # Rows left the filter since _order was last rebuilt
+        self.version = 0  # Bumped on every change, so views know when to redraw
+
+    def __len__(self) -> int:
+        return len(self.ips)
+
+    def __contains__(self, ip: str) -> bool:
+        return ip_to_int(ip) in self._rows
+
+    def _intern(self, value: str) -> str:
+        return self._strings.setdefault(value, value)
+
+    def update(self, ip: str, fields: Dict[str, str], flags: int = 0) -> bool:
+        """Set a host's fields, adding it (with `flags`) if new. Returns True if it was added."""
+        address = ip_to_int(ip)
+        row = self._rows.get(address)
+        added = row is None
+        if added:
+            row = self._rows[address] = len(self.ips)
+            if address >= IPV6_BASE:
+                self._ips6[row] = address
+                self.ips.append(0)
+            else:
+                self.ips.append(address)
+            self.rtts.append(UNKNOWN_RTT)
+            self.ports.append(())
+            self.port_counts.append(0)
+            self.flags.append(flags)
+            for column in self.text.values():
+                column.append("-")
+            self._keys.append(None)
+            self.index.add_host(row, address)
+        for field, value in fields.items():
+            if field == "ping":
+                self.rtts[row] = parse_rtt(value)
+                if value == "gone":
+                    self.flags[row] |= GONE
+                elif value == "down":
+                    self.flags[row] |= DOWN
+                else:
+                    self.flags[row] &= ~(GONE | DOWN)  # Answering (again)
+            elif field == "ports":
+                ports = parse_port_cell(value)
+                ports = self._port_sets.setdefault(ports, ports)
+                self.index.set_ports(row, self.ports[row], ports)
+                self.ports[row] = ports
+                self.port_counts[row] = len(ports)
+            elif field in self.text:
+                column = self.text[field]
+                self.index.set_text(field, row, column[row], value)
+                column[row] = self._intern(value)
+        if added or SORT_FIELDS[self.sort_key] in fields:
+            self._keys[row] = self._key(row)
+            self._sorted = False
+        if self._matched is None:
+            if added:
+                self._order.append(row)
+        elif self.filter.match(self, row):
+            if row not in self._matched:
+                self._matched.add(row)
+                self._order.append(row)
+                self._sorted = False
+        elif row in self._matched:
+            self._matched.discard(row)
+            self._pruned = True
+        self.version += 1
+        return added
+
+    def host(self, ip: str) -> Optional[Dict[str, str]]:
+        """A host's fields as display strings, or None if it is not stored."""
+        row = self._rows.get(ip_to_int(ip))
+        return self.record(row) if row is not None else None
+
+    def ip_int(self, row: int) -> int:
+        """A row's IP as ip_to_int() gives it."""
+        return self._ips6.get(row, self.ips[row]) if self._ips6 else self.ips[row]
+
+    def address(self, row: int) -> str:
+        return int_to_ip(self.ip_int(row))
+
+    def record(self, row: int) -> Dict[str, str]:
+        fields = {field: column[row] for field, column in self.text.items()}
+        fields["ip"] = self.address(row)
+        fields["ping"] = ping_label(self.flags[row], self.rtts[row])
+        fields["ports"] = format_port_cell(self.ports[row])
+        return fields
+
+    @property
+    def shown(self) -> int:
+        """Hosts in the view: all of them, or those the filter matches."""
+        return len(self.ips) if self._matched is None else len(self._matched)
+
+    def clear(self) -> None:
+        """Drop every host, keeping the sort and filter."""
+        key, reverse, host_filter = self.sort_key, self.reverse, self.filter
+        self.__init__()
+        self.sort_key, self.reverse = key, reverse
+        self.set_filter(host_filter)
+
+    def set_filter(self, host_filter: Optional[HostFilter]) -> None:
+        """Show only the hosts `host_filter` matches (all hosts for None or an empty filter)."""
+        if not host_filter:
+            self.filter = self._matched = None
+            self._order = list(range(len(self.ips)))
+        else:
+            self.filter = host_filter
+            self._matched = host_filter.rows(self)
+            self._order = list(self._matched)
+        self._pruned = False
+        self._sorted = False
+        self.version += 1
+
+    def _key(self, row: int) -> Any:
+        """Sort key of a row: the IP, or (value, IP) with the IP negated when reversed, so
+        ties stay in ascending IP order either way; unknown RTTs and vendors always sort last."""
+        address = self.ip_int(row)
+        if self.sort_key == "ip":
+            return address
+        tie = -address if self.reverse else address
+        if self.sort_key == "rtt":
+            rtt = self.rtts[row]
+            return (rtt if rtt == rtt else -math.inf if self.reverse else math.inf), tie
+        if self.sort_key == "ports":
+            return self.port_counts[row], tie
+        vendor = self.text["vendor"][row]
+        return (vendor.casefold() if vendor != "-" else "" if self.reverse else "\uffff"), tie
+
+    def sort(self, key: str, reverse: bool = False) -> None:
+        """Order the view by one of SORT_KEYS (ValueError otherwise)."""
+        if key not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key {key!r}, expected one of {', '.join(SORT_KEYS)}")
+        if (key, reverse) != (self.sort_key, self.reverse):
+            self.sort_key, self.reverse = key, reverse
+            self._keys = [self._key(row) for row in range(len(self.ips))]
+            self._sorted = False
+            self.version += 1
+
+    def order(self) -> List[int]:
+        """Rows in view order (re-sorted here if anything changed since the last call)."""
+        if self._pruned:
+            self._order = [row for row in self._order if row in self._matched]
+            self._pruned = False
+        if not self._sorted:
+            # In place: the last order is nearly right, which timsort handles in about linear time
+            self._order.sort(key=self._keys.__getitem__, reverse=self.reverse)
+            self._sorted = True
+        return self._order
+
+    def ip_at(self, position: int) -> Optional[str]:
+        """IP of the host at a view position, or None."""
+        order = self.order()
+        if 0 <= position < len(order):
+            return self.address(order[position])
+        return None
@@ -0,0 +1,221 @@
+"""host_table.py — Virtualized results table over a HostStore
+
+HostTable draws only the rows in view: each frame formats the visible window
+of the store's sort order into cells, so a table of tens of thousands of
+hosts costs what a screenful does. Clicking a sortable header (IP, Ping,
+Vendor, Ports) or pressing i/t/v/o sorts by that column; doing it again
+reverses the order. A filter set with set_filter() narrows the rows to the
+hosts it matches. The Copy and Ping cells are drawn, not stored.
+"""
+from typing import List, Optional, Tuple
+
+from rich.cells import set_cell_size
+from rich.segment import Segment
+from rich.style import Style
+from textual import events
+from textual.binding import Binding
+from textual.geometry import Size
+from textual.message import Message
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+from host_filter import HostFilter
+from host_store import DOWN, GONE, NEW, HostStore, format_port_cell, ping_label
+
+# (title, host field or action, width, sort key or None)
+COLUMNS: Tuple[Tuple[str, str, int, Optional[str]], ...] = (
+    ("IP", "ip", 24, "ip"),
+    ("Ping", "ping", 10, "rtt"),
+    ("Hostname", "hostname", 25, None),
+    ("MAC", "mac", 18, None),
+    ("IPv6", "ipv6", 30, None),
+    ("Vendor", "vendor", 20, "vendor"),
+    ("Ports", "ports", 30, "ports"),
+    ("Service", "services", 40, None),
+    ("Copy", "copy", 8, None),
+    ("Ping", "ping-action", 8, None),
+)
+ACTIONS = {"copy": "📋 Copy", "ping-action": "🔔 Ping"}
+TABLE_WIDTH = sum(width for _, _, width, _ in COLUMNS)
+
+
+class HostTable(ScrollView, can_focus=True):
+    """Scrollable, sortable view of one range's hosts, drawn line by line from a HostStore."""
+
+    DEFAULT_CSS = """
+    HostTable {
+        height: auto;
+        max-height: 24;
+        background: $surface;
+    }
+    HostTable > .host-table--header {
+        text-style: bold;
+        background: $panel;
+    }
+    HostTable > .host-table--even-row {
+        background: $surface-lighten-1 50%;
+    }
+    HostTable > .host-table--cursor {
+        background: $accent 40%;
+    }
+    HostTable:focus > .host-table--cursor {
+        background: $accent;
+        text-style: bold;
+    }
+    """
+
+    COMPONENT_CLASSES = {"host-table--header", "host-table--even-row", "host-table--cursor"}
+
+    BINDINGS = [
+        Binding("up", "cursor(-1)", "Up", show=False),
+        Binding("down", "cursor(1)", "Down", show=False),
+        Binding("pageup", "page(-1)", "Page up", show=False),
+        Binding("pagedown", "page(1)", "Page down", show=False),
+        Binding("home", "cursor_to(0)", "Top", show=False),
+        Binding("end", "cursor_to(-1)", "Bottom", show=False),
+        Binding("enter", "select", "Select", show=False),
+        Binding("i", "sort('ip')", "Sort IP"),
+        Binding("t", "sort('rtt')", "Sort RTT"),
+        Binding("o", "sort('ports')", "Sort ports"),
+        Binding("v", "sort('vendor')", "Sort vendor"),
+    ]
+
+    class RowSelected(Message):
+        """A host row was clicked or Enter was pressed on it; `column` is the clicked field or action."""
+
+        def __init__(self, table: "HostTable", ip: str, column: str = "ip") -> None:
+            super().__init__()
+            self.table = table
+            self.ip = ip
+            self.column = column
+
+        @property
+        def control(self) -> "HostTable":
+            return self.table
+
+    def __init__(self, store: Optional[HostStore] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store if store is not None else HostStore()
+        self.cursor_row = 0
+        self._drawn = (-1, -1)  # (store version, rows) last laid out
+        self.virtual_size = Size(TABLE_WIDTH, 1)
+
+    @property
+    def cursor_ip(self) -> Optional[str]:
+        return self.store.ip_at(self.cursor_row)
+
+    def refresh_rows(self) -> None:
+        """Redraw after the store changed (cheap when nothing did)."""
+        drawn = (self.store.version, self.store.shown)
+        if drawn == self._drawn:
+            return
+        self._drawn = drawn
+        self.virtual_size = Size(TABLE_WIDTH, self.store.shown + 1)  # + header
+        self.cursor_row = min(self.cursor_row, max(0, self.store.shown - 1))
+        self.refresh()
+
+    def set_filter(self, host_filter: Optional[HostFilter]) -> None:
+        """Show only the hosts `host_filter` matches, from the top."""
+        self.store.set_filter(host_filter)
+        self.cursor_row = 0
+        self.scroll_to(0, 0, animate=False)
+        self.refresh_rows()
+
+    def clear(self) -> None:
+        self.store.clear()
+        self.cursor_row = 0
+        self.scroll_to(0, 0, animate=False)
+        self.refresh_rows()
+
+    def _cells(self, row: int) -> List[str]:
+        store = self.store
+        flags = store.flags[row]
+        icon = "👻" if flags & GONE else "🔻" if flags & DOWN else "🆕" if flags & NEW else "🔗"
+        text = store.text
+        return [
+            f"{icon} {store.address(row)}",
+            ping_label(flags, store.rtts[row]),
+            text["hostname"][row],
+            text["mac"][row],
+            text["ipv6"][row],
+            text["vendor"][row],
+            format_port_cell(store.ports[row]),
+            text["services"][row],
+            ACTIONS["copy"],
+            ACTIONS["ping-action"],
+        ]
+
+    def _header(self) -> List[str]:
+        arrow = " ▼" if self.store.reverse else " ▲"
+        return [title + (arrow if key == self.store.sort_key else "") for title, _, _, key in COLUMNS]
+
+    def _strip(self, cells: List[str], style: Style, position: int) -> Strip:
+        segments = []
+        for column, ((_, _, width, _), cell) in enumerate(zip(COLUMNS, cells)):
+            meta = Style.from_meta({"row": position, "column": column})
+            segments.append(Segment(set_cell_size(f" {cell}", width), style + meta))
+        return Strip(segments, TABLE_WIDTH)
+
+    def render_line(self, y: int) -> Strip:
+        width = self.size.width
+        scroll_x, scroll_y = self.scroll_offset
+        base = self.rich_style
+        if y == 0:
+            style = base + self.get_component_rich_style("host-table--header")
+            strip = self._strip(self._header(), style, -1)
+        else:
+            position = scroll_y + y - 1
+            order = self.store.order()
+            if position >= len(order):
+                return Strip.blank(width, base)
+            style = base
+            if position == self.cursor_row:
+                style += self.get_component_rich_style("host-table--cursor")
+            elif position % 2:
+                style += self.get_component_rich_style("host-table--even-row")
+            strip = self._strip(self._cells(order[position]), style, position)
+        return strip.crop_extend(scroll_x, scroll_x + width, base)
+
+    def _move_cursor(self, row: int) -> None:
+        rows = self.store.shown
+        self.cursor_row = max(0, min(row, rows - 1)) if rows else 0
+        view = self.scrollable_content_region.height - 1  # Rows below the header
+        if self.cursor_row < self.scroll_y:
+            self.scroll_to(y=self.cursor_row, animate=False)
+        elif view > 0 and self.cursor_row >= self.scroll_y + view:
+            self.scroll_to(y=self.cursor_row - view + 1, animate=False)
+        self.refresh()
+
+    def action_cursor(self, delta: int) -> None:
+        self._move_cursor(self.cursor_row + delta)
+
+    def action_page(self, direction: int) -> None:
+        self._move_cursor(self.cursor_row + direction * max(1, self.scrollable_content_region.height - 1))
+
+    def action_cursor_to(self, row: int) -> None:
+        self._move_cursor(row if row >= 0 else self.store.shown - 1)
+
+    def action_select(self) -> None:
+        ip = self.cursor_ip
+        if ip is not None:
+            self.post_message(self.RowSelected(self, ip))
+
+    def action_sort(self, key: str) -> None:
+        """Sort by `key`; sorting by the current key again reverses the order."""
+        self.store.sort(key, reverse=not self.store.reverse if key == self.store.sort_key else False)
+        self.refresh_rows()
+
+    def on_click(self, event: events.Click) -> None:
+        meta = event.style.meta
+        if "row" not in meta:
+            return
+        position, column = meta["row"], meta["column"]
+        _, field, _, key = COLUMNS[column]
+        if position < 0:
+            if key is not None:
+                self.action_sort(key)
+            return
+        self._move_cursor(position)
+        ip = self.cursor_ip
+        if ip is not None:
+            self.post_message(self.RowSelected(self, ip, field))
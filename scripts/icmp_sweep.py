@@ -0,0 +1,325 @@
+"""icmp_sweep.py — In-process ICMP echo sweep engine
+
+Pings whole CIDRs from a single socket and records each host's RTT at the
+moment it is discovered, so no separate per-host ping pass is needed. With an
+RttEstimator, reply timeouts and retries adapt to the RTTs measured so far
+instead of always waiting the full timeout. Uses a
+raw ICMP socket as root and an unprivileged ICMP datagram socket otherwise
+(needs net.ipv4.ping_group_range to include the user's group).
+
+Usage: python3 scripts/icmp_sweep.py [--concurrency N] [--timeout MS] [--retries N] [--fixed-timeout] CIDR [CIDR ...]
+       Prints one ALIVE|IP|RTT_MS line per responding host.
+"""
+import argparse
+import asyncio
+import ipaddress
+import itertools
+import os
+import socket
+import struct
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sized, Tuple
+
+from rtt_estimator import RttEstimator
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+# Payload sent with every echo request (timestamps come from the probe table)
+_PAYLOAD = b"ip_scanner_sweep"
+
+AliveCallback = Callable[[str, float], None]
+
+
+def checksum(data: bytes) -> int:
+    """RFC 1071 Internet checksum."""
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(ident: int, seq: int, payload: bytes = _PAYLOAD) -> bytes:
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    csum = checksum(header + payload)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, csum, ident, seq) + payload
+
+
+def expand_targets(specs: Iterable[str], whole: bool = False) -> Iterator[str]:
+    """Yield host addresses for CIDRs or single IPs, lazily (a /8 is never materialized).
+
+    With `whole`, network and broadcast addresses are included too (for
+    blocks cut out of a larger range, where they are ordinary hosts). IPv6
+    ranges are skipped: they are far too large to sweep address by address,
+    and their hosts are found through NDP instead (ndp_sweep.py).
+    """
+    for spec in specs:
+        network = ipaddress.ip_network(spec.strip(), strict=False)
+        if network.version == 6:
+            continue
+        if whole or network.num_addresses <= 2:
+            # /31 and /32: every address is a host
+            for addr in network:
+                yield str(addr)
+        else:
+            for addr in network.hosts():
+                yield str(addr)
+
+
+class _Probe:
+    __slots__ = ("ip", "sent", "future")
+
+    def __init__(self, ip: str, sent: float, future: asyncio.Future):
+        self.ip = ip
+        self.sent = sent
+        self.future = future
+
+
+class IcmpSweeper:
+    """Echo-request sweeper sharing one ICMP socket across all probes.
+
+    At most `concurrency` echo requests are outstanding at once. Each host gets
+    `retries` extra attempts, `timeout` seconds apart, before it is considered
+    down. With an `rtt` estimator, the wait and the number of attempts come
+    from it instead (re-read while waiting, so early probes profit from later
+    replies) and every reply feeds it. A late reply to an earlier attempt
+    still counts. Replies are matched to probes by identifier and sequence
+    number (and the sender's address), so concurrent sweeps and pings can
+    share the same socket.
+    """
+
+    def __init__(self, concurrency: int = 256, timeout: float = 1.0, retries: int = 1,
+                 privileged: Optional[bool] = None, rtt: Optional[RttEstimator] = None):
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = max(0.05, float(timeout))
+        self.retries = max(0, int(retries))
+        self.rtt = rtt
+        self.privileged = (os.geteuid() == 0) if privileged is None else privileged
+        self._sock: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._ident = os.getpid() & 0xFFFF
+        self._seq = itertools.count()
+        self._pending: Dict[int, _Probe] = {}
+        self.control = None  # Optional ScanControl: waited on before each echo request
+        self.metrics = None  # Optional ScanMetrics: counts echo requests, replies and probes in flight
+
+    # --- Socket handling ---
+
+    def _open(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._sock is not None and self._loop is loop:
+            return
+        self.close()
+        if self.privileged:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        else:
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            except PermissionError as e:
+                raise PermissionError(
+                    "ICMP sockets need root or net.ipv4.ping_group_range covering this user"
+                ) from e
+        sock.setblocking(False)
+        # A large receive buffer keeps reply bursts from big sweeps from being dropped
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        except OSError:
+            pass
+        if not self.privileged:
+            # The kernel rewrites the identifier to the socket's "port"
+            sock.bind(("", 0))
+            self._ident = sock.getsockname()[1] & 0xFFFF
+        self._sock = sock
+        self._loop = loop
+        self._sem = asyncio.Semaphore(self.concurrency)
+        loop.add_reader(sock.fileno(), self._on_readable)
+
+    def close(self) -> None:
+        if self._sock is None:
+            return
+        try:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(self._sock.fileno())
+        except (ValueError, RuntimeError):
+            pass
+        self._sock.close()
+        self._sock = None
+        for probe in self._pending.values():
+            if not probe.future.done():
+                probe.future.cancel()
+        self._pending.clear()
+
+    def _next_seq(self) -> int:
+        # 16-bit sequence space; skip numbers still in flight after a wrap
+        while True:
+            seq = next(self._seq) & 0xFFFF
+            if seq not in self._pending:
+                return seq
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                packet, addr = self._sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            now = time.perf_counter()
+            if self.privileged:
+                # Raw sockets deliver the IP header too
+                packet = packet[(packet[0] & 0x0F) * 4:]
+            if len(packet) < 8:
+                continue
+            icmp_type, _, _, ident, seq = struct.unpack("!BBHHH", packet[:8])
+            if icmp_type != ICMP_ECHO_REPLY:
+                continue
+            if self.privileged and ident != self._ident:
+                continue  # Someone else's ping
+            probe = self._pending.get(seq)
+            if probe is None or probe.ip != addr[0] or probe.future.done():
+                continue
+            probe.future.set_result((now - probe.sent) * 1000.0)
+
+    # --- Probing ---
+
+    async def _send(self, ip: str, seq: int) -> None:
+        packet = build_echo_request(self._ident, seq)
+        while True:
+            try:
+                self._sock.sendto(packet, (ip, 0))
+                return
+            except (BlockingIOError, InterruptedError):
+                await asyncio.sleep(0.001)  # Socket buffer full: let replies drain
+
+    async def _wait_reply(self, ip: str, probes: List[Tuple[int, _Probe]], attempt: int) -> Optional[float]:
+        """Wait for a reply to any probe sent to `ip` so far; returns its RTT in ms or None on timeout."""
+        sent = probes[-1][1].sent
+        futures = [probe.future for _, probe in probes]
+        while True:
+            timeout = self.rtt.timeout(ip, attempt) if self.rtt else self.timeout
+            remaining = sent + timeout - time.perf_counter()
+            if remaining <= 0:
+                return None
+            if self.rtt:
+                # Estimates may tighten meanwhile: look again after as long as we have waited so
+                # far, which keeps silent addresses in big sweeps to a few wake-ups per attempt
+                waited = time.perf_counter() - sent
+                remaining = min(remaining, max(self.rtt.min_timeout, waited))
+            await asyncio.wait(futures, timeout=remaining)
+            for index, (_, probe) in enumerate(probes):
+                if probe.future.done() and not probe.future.cancelled():
+                    rtt = probe.future.result()
+                    if self.rtt:
+                        self.rtt.observe(ip, rtt / 1000.0, retransmitted=index > 0)
+                    return rtt
+
+    async def ping(self, ip: str) -> Optional[float]:
+        """Ping one host (with retries); returns the RTT in ms, or None if it never answered."""
+        self._open()
+        loop = asyncio.get_running_loop()
+        retries = self.rtt.retries_for(ip) if self.rtt else self.retries
+        probes: List[Tuple[int, _Probe]] = []
+        try:
+            for attempt in range(retries + 1):
+                async with self._sem:
+                    if self.control:
+                        await self.control.wait()
+                    seq = self._next_seq()
+                    probe = _Probe(ip, time.perf_counter(), loop.create_future())
+                    self._pending[seq] = probe
+                    probes.append((seq, probe))
+                    try:
+                        await self._send(ip, seq)
+                    except OSError:
+                        return None  # Unroutable (e.g. no route to host)
+                    if self.metrics:
+                        self.metrics.inc("ipscan_probes_sent_total", probe="icmp")
+                        self.metrics.add("ipscan_probes_in_flight", 1, probe="icmp")
+                    try:
+                        rtt = await self._wait_reply(ip, probes, attempt)
+                    finally:
+                        if self.metrics:
+                            self.metrics.add("ipscan_probes_in_flight", -1, probe="icmp")
+                if rtt is not None:
+                    if self.metrics:
+                        self.metrics.inc("ipscan_probe_replies_total", probe="icmp")
+                    return rtt
+            return None
+        finally:
+            for seq, probe in probes:
+                if self._pending.get(seq) is probe:
+                    del self._pending[seq]
+
+    async def sweep(self, targets: Iterable[str],
+                    on_alive: Optional[AliveCallback] = None,
+                    on_done: Optional[Callable[[str], None]] = None) -> Dict[str, float]:
+        """Ping every target, calling on_alive(ip, rtt_ms) as each host answers
+        and on_done(ip) once a target's last attempt is over (answered or not).
+
+        Returns {ip: rtt_ms} for the hosts that answered. Targets are pulled
+        lazily, so CIDR expansions of any size run in constant memory; a
+        sized collection gets no more workers than it has targets.
+        """
+        self._open()
+        alive: Dict[str, float] = {}
+        pending = iter(targets)
+
+        async def worker():
+            for ip in pending:
+                rtt = await self.ping(ip)
+                if rtt is not None and ip not in alive:
+                    alive[ip] = rtt
+                    if on_alive:
+                        on_alive(ip, rtt)
+                if on_done:
+                    on_done(ip)
+
+        workers = min(self.concurrency, len(targets)) if isinstance(targets, Sized) else self.concurrency
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        return alive
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ICMP echo sweep")
+    parser.add_argument("targets", nargs="+", help="CIDRs or IPs to sweep")
+    parser.add_argument("--concurrency", type=int, default=256, help="Max outstanding echo requests (default: 256)")
+    parser.add_argument("--timeout", type=int, default=1000, help="Reply timeout in ms (default: 1000)")
+    parser.add_argument("--retries", type=int, default=1, help="Extra attempts per host (default: 1)")
+    parser.add_argument("--fixed-timeout", action="store_true",
+                        help="Always wait the full timeout instead of adapting it to measured RTTs")
+    args = parser.parse_args(argv)
+
+    try:
+        for spec in args.targets:
+            ipaddress.ip_network(spec, strict=False)
+    except ValueError as e:
+        parser.error(str(e))
+
+    rtt = None if args.fixed_timeout else RttEstimator(timeout=args.timeout / 1000.0, retries=args.retries)
+    sweeper = IcmpSweeper(concurrency=args.concurrency, timeout=args.timeout / 1000.0,
+                          retries=args.retries, rtt=rtt)
+
+    def report(ip: str, rtt: float) -> None:
+        # Format: ALIVE|IP|RTT_MS
+        print(f"ALIVE|{ip}|{rtt:.3f}", flush=True)
+
+    async def run():
+        try:
+            await sweeper.sweep(expand_targets(args.targets), on_alive=report)
+        finally:
+            sweeper.close()
+
+    try:
+        asyncio.run(run())
+    except PermissionError as e:
+        print(f"icmp_sweep: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""ndp_sweep.py — IPv6 host discovery through all-nodes echo and neighbor discovery
+
+An IPv6 /64 holds 2^64 addresses, far too many to probe one by one, so IPv6
+hosts are found the way the link itself finds them. One echo request to the
+all-nodes multicast group ff02::1 per interface address (sent from that
+address, so hosts answer from addresses of the same scope) brings a reply
+from every node on the link that answers multicast pings. Before replying,
+each of them resolves us with a Neighbor Solicitation that carries its MAC,
+and Neighbor Advertisements carry the MACs of the hosts we resolve; both are
+read off the same raw ICMPv6 socket. The kernel's IPv6 neighbor table (read
+over netlink) then adds the hosts that talked recently but ignored the
+echo. An address whose interface identifier is an EUI-64 (ff:fe in the
+middle) gives away the MAC it was built from when nothing else does; the
+MAC is what ties a device's IPv6 addresses to its IPv4 record (discovery.py).
+Needs root (CAP_NET_RAW).
+
+Usage: python3 scripts/ndp_sweep.py [--interface IF ...] [--timeout MS]
+       Prints one NDP|IP|MAC|RTT_MS line per IPv6 address found ("-" if unknown).
+"""
+import argparse
+import asyncio
+import ipaddress
+import os
+import socket
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from arp_sweep import format_mac, read_neighbors
+
+PROC_IF_INET6 = "/proc/net/if_inet6"
+ALL_NODES = "ff02::1"
+
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+ND_NEIGHBOR_SOLICIT = 135
+ND_NEIGHBOR_ADVERT = 136
+
+# Link-layer address options of NDP messages
+_SOURCE_LLADDR = 1
+_TARGET_LLADDR = 2
+
+# Interface address flags that rule an address out as a source
+_IFA_F_DADFAILED = 0x08
+_IFA_F_TENTATIVE = 0x40
+
+# Neighbor table entries in this state hold a stale or bogus link-layer address
+_NUD_FAILED = 0x20
+
+_ECHO_HEADER = struct.Struct("!BBHHH")
+_PAYLOAD = b"ipscan-ndp"
+
+# (MAC or "-", echo RTT in ms or None) of one IPv6 address
+Sighting = Tuple[str, Optional[float]]
+
+
+def eui64_mac(ip: str) -> Optional[str]:
+    """MAC an EUI-64 interface identifier was built from (ff:fe in its middle, U/L bit flipped), else None."""
+    iid = ipaddress.IPv6Address(ip).packed[8:]
+    if iid[3:5] != b"\xff\xfe":
+        return None
+    return format_mac(bytes([iid[0] ^ 0x02]) + iid[1:3] + iid[5:])
+
+
+def interface_addresses6(path: str = PROC_IF_INET6) -> Dict[str, List[ipaddress.IPv6Interface]]:
+    """Map each (non-loopback) interface to its usable IPv6 addresses with their prefixes."""
+    interfaces: Dict[str, List[ipaddress.IPv6Interface]] = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 6 or fields[5] == "lo":
+                    continue
+                if int(fields[4], 16) & (_IFA_F_TENTATIVE | _IFA_F_DADFAILED):
+                    continue
+                address = ipaddress.IPv6Address(bytes.fromhex(fields[0]))
+                interfaces.setdefault(fields[5], []).append(
+                    ipaddress.IPv6Interface((address, int(fields[2], 16))))
+    except OSError:
+        pass
+    return interfaces
+
+
+def _link_option(options: bytes, kind: int) -> Optional[str]:
+    """MAC in the source/target link-layer address option of an NDP message, if it has one."""
+    offset = 0
+    while offset + 2 <= len(options):
+        option, length = options[offset], options[offset + 1] * 8
+        if length == 0:
+            return None  # Malformed
+        if option == kind and length >= 8:
+            return format_mac(options[offset + 2:offset + 8])
+        offset += length
+    return None
+
+
+class NdpSweeper:
+    """All-nodes echo and neighbor discovery listener bound to one interface.
+
+    sweep() sends the echo from every address of the interface, listens
+    `timeout` seconds for echo replies, Neighbor Solicitations and
+    Advertisements, and then adds the interface's entries of the kernel
+    neighbor table. Replies and solicitations come back at link speed, so
+    there is nothing to retry or adapt. The interface's own addresses are
+    never reported.
+    """
+
+    def __init__(self, interface: str, timeout: float = 1.0):
+        self.interface = interface
+        self.timeout = max(0.05, float(timeout))
+        self.ifindex = socket.if_nametoindex(interface)
+        self.addresses = interface_addresses6().get(interface, [])
+        if not self.addresses:
+            raise OSError(f"{interface} has no IPv6 address")
+        self._own = {str(address.ip) for address in self.addresses}
+        self._ident = int.from_bytes(os.urandom(2), "big")
+        self._sock: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sent: Dict[int, float] = {}  # Echo sequence number -> send time
+        self._macs: Dict[str, str] = {}
+        self._rtts: Dict[str, float] = {}
+        self.control = None  # Optional ScanControl: waited on before each echo
+        self.metrics = None  # Optional ScanMetrics: counts echoes and replies
+
+    def _open(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._sock is not None and self._loop is loop:
+            return
+        self.close()
+        try:
+            sock = socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_ICMPV6)
+        except PermissionError as e:
+            raise PermissionError("NDP discovery needs root (CAP_NET_RAW)") from e
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, self.interface.encode())
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_LOOP, 0)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._loop = loop
+        loop.add_reader(sock.fileno(), self._on_readable)
+
+    def close(self) -> None:
+        if self._sock is None:
+            return
+        try:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(self._sock.fileno())
+        except (ValueError, RuntimeError):
+            pass
+        self._sock.close()
+        self._sock = None
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                packet, addr = self._sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            now = time.perf_counter()
+            if len(packet) < 8:
+                continue
+            source = addr[0].split("%")[0]
+            kind = packet[0]
+            if kind == ICMPV6_ECHO_REPLY:
+                _, _, _, ident, seq = _ECHO_HEADER.unpack_from(packet)
+                sent = self._sent.get(seq)
+                if ident != self._ident or sent is None or source in self._own or source in self._rtts:
+                    continue
+                self._rtts[source] = (now - sent) * 1000.0
+                if self.metrics:
+                    self.metrics.inc("ipscan_probe_replies_total", probe="ndp")
+            elif kind == ND_NEIGHBOR_SOLICIT and len(packet) >= 24:
+                # A solicitation from :: is duplicate address detection: the sender has no address yet
+                mac = _link_option(packet[24:], _SOURCE_LLADDR)
+                if mac is not None and source != "::" and source not in self._own:
+                    self._macs[source] = mac
+            elif kind == ND_NEIGHBOR_ADVERT and len(packet) >= 24:
+                target = socket.inet_ntop(socket.AF_INET6, packet[8:24])
+                mac = _link_option(packet[24:], _TARGET_LLADDR)
+                if mac is not None and target not in self._own:
+                    self._macs[target] = mac
+
+    async def _send(self, packet: bytes, source: ipaddress.IPv6Address) -> None:
+        # IPV6_PKTINFO picks the source address (and interface) of this one datagram
+        pktinfo = source.packed + struct.pack("@I", self.ifindex)
+        while True:
+            try:
+                self._sock.sendmsg([packet], [(socket.IPPROTO_IPV6, socket.IPV6_PKTINFO, pktinfo)],
+                                   0, (ALL_NODES, 0, 0, self.ifindex))
+                return
+            except (BlockingIOError, InterruptedError):
+                await asyncio.sleep(0.001)
+
+    async def sweep(self) -> Dict[str, Sighting]:
+        """Find the IPv6 neighbors on this interface. Returns {ip: (mac, rtt_ms)}.
+
+        The MAC is "-" if neither NDP, the neighbor table nor an EUI-64
+        interface identifier gave it away; the RTT is None for addresses
+        that did not answer the echo.
+        """
+        self._open()
+        self._sent = {}
+        self._macs = {}
+        self._rtts = {}
+        for seq, address in enumerate(self.addresses):
+            if self.control:
+                await self.control.wait()
+            self._sent[seq] = time.perf_counter()  # The kernel fills in the ICMPv6 checksum
+            try:
+                await self._send(_ECHO_HEADER.pack(ICMPV6_ECHO_REQUEST, 0, 0, self._ident, seq) + _PAYLOAD,
+                                 address.ip)
+            except OSError:
+                continue  # The address went away since it was read
+            if self.metrics:
+                self.metrics.inc("ipscan_probes_sent_total", probe="ndp")
+        await asyncio.sleep(self.timeout)
+        for ip, mac, ifindex, state in read_neighbors(socket.AF_INET6):
+            if ifindex == self.ifindex and not state & _NUD_FAILED and ip not in self._own:
+                self._macs.setdefault(ip, mac)
+        found: Dict[str, Sighting] = {}
+        for ip in sorted(self._macs.keys() | self._rtts.keys(), key=ipaddress.IPv6Address):
+            if ipaddress.IPv6Address(ip).is_multicast:
+                continue
+            found[ip] = (self._macs.get(ip) or eui64_mac(ip) or "-", self._rtts.get(ip))
+        return found
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="IPv6 neighbor discovery through all-nodes echo and NDP")
+    parser.add_argument("--interface", action="append",
+                        help="Interface to sweep (repeatable; default: every interface with IPv6)")
+    parser.add_argument("--timeout", type=int, default=1000, help="Wait for replies, in ms (default: 1000)")
+    args = parser.parse_args(argv)
+
+    interfaces = args.interface or sorted(interface_addresses6())
+    if not interfaces:
+        parser.error("no interface has an IPv6 address")
+
+    async def run() -> Dict[str, Sighting]:
+        found: Dict[str, Sighting] = {}
+        sweepers = [NdpSweeper(interface, timeout=args.timeout / 1000.0) for interface in interfaces]
+        try:
+            for sighted in await asyncio.gather(*(sweeper.sweep() for sweeper in sweepers)):
+                found.update(sighted)
+        finally:
+            for sweeper in sweepers:
+                sweeper.close()
+        return found
+
+    try:
+        found = asyncio.run(run())
+    except (PermissionError, OSError) as e:
+        print(f"ndp_sweep: {e}", file=sys.stderr)
+        return 1
+    for ip, (mac, rtt) in found.items():
+        # Format: NDP|IP|MAC|RTT_MS
+        print(f"NDP|{ip}|{mac}|{f'{rtt:.3f}' if rtt is not None else '-'}", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
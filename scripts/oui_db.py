@@ -0,0 +1,224 @@
+"""oui_db.py — Indexed OUI vendor database for MAC → vendor lookups
+
+Builds a compact binary table of IEEE MA-L (24-bit), MA-M (28-bit) and MA-S
+(36-bit) assignments from the vendor lists already installed on the system
+(IEEE CSVs, Wireshark manuf, arp-scan, nmap), and looks MACs up in it through
+mmap with a binary search on each prefix length, most specific first.
+
+File layout (big-endian): header (magic, record count, string table offset),
+fixed-size records sorted by key = prefix_bits << 48 | masked prefix, each
+with an offset into a table of NUL-terminated vendor names.
+
+Usage: python3 scripts/oui_db.py build [--output FILE] [SOURCE ...]
+       python3 scripts/oui_db.py lookup [--db FILE] MAC [MAC ...]
+       lookup prints one VENDOR|MAC|VENDOR line per MAC.
+"""
+import argparse
+import bisect
+import csv
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "oui.db")
+
+# Vendor lists searched by `build` when no sources are given; earlier files win on duplicates
+DEFAULT_SOURCES = [
+    "/usr/share/ieee-data/oui36.csv",
+    "/usr/share/ieee-data/mam.csv",
+    "/usr/share/ieee-data/oui.csv",
+    "/usr/share/wireshark/manuf",
+    "/usr/share/arp-scan/ieee-oui.txt",
+    "/usr/share/nmap/nmap-mac-prefixes",
+]
+
+# Assignment sizes, most specific first (MA-S, MA-M, MA-L)
+PREFIX_BITS = (36, 28, 24)
+
+_MAGIC = b"IPSCOUI1"
+_HEADER = struct.Struct("!8sII")  # magic, record count, string table offset
+_RECORD = struct.Struct("!QI")    # key, vendor offset in the string table
+
+# (prefix bits, 48-bit prefix value, vendor)
+OuiEntry = Tuple[int, int, str]
+
+
+def mac_to_int(mac: str) -> Optional[int]:
+    """Parse aa:bb:cc:dd:ee:ff / aa-bb-... / aabb.ccdd.eeff into a 48-bit int."""
+    digits = mac.replace(":", "").replace("-", "").replace(".", "")
+    if len(digits) != 12:
+        return None
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+def _mask(value: int, bits: int) -> int:
+    return value & (((1 << bits) - 1) << (48 - bits))
+
+
+def _parse_prefix(key: str) -> Optional[Tuple[int, int]]:
+    """Parse "00:1B:C5:00:00:00/36", "001BC5", "0050C2A" ... into (bits, prefix value)."""
+    key, _, bits_text = key.partition("/")
+    digits = key.replace(":", "").replace("-", "").replace(".", "")
+    if not digits or len(digits) > 12:
+        return None
+    try:
+        value = int(digits, 16) << (48 - 4 * len(digits))
+        bits = int(bits_text) if bits_text else 4 * len(digits)
+    except ValueError:
+        return None
+    if bits not in PREFIX_BITS:
+        return None
+    return bits, _mask(value, bits)
+
+
+def iter_source(path: str) -> Iterator[OuiEntry]:
+    """Yield the entries of one vendor list (IEEE CSV, manuf, arp-scan or nmap format)."""
+    with open(path, encoding="utf-8", errors="replace", newline="") as f:
+        if path.endswith(".csv"):
+            # Registry,Assignment,Organization Name,Organization Address
+            for row in csv.reader(f):
+                if len(row) >= 3:
+                    prefix = _parse_prefix(row[1].strip())
+                    if prefix and row[2].strip():
+                        yield prefix[0], prefix[1], row[2].strip()
+            return
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split(None, 1)
+            if len(parts) < 2:
+                continue
+            prefix = _parse_prefix(parts[0])
+            # manuf has "short<TAB>long" names; prefer the long one
+            vendor = parts[1].split("\t")[-1].split("#")[0].strip()
+            if prefix and vendor:
+                yield prefix[0], prefix[1], vendor
+
+
+def build(sources: Iterable[str], output: str = DEFAULT_DB) -> int:
+    """Merge vendor lists into a binary database at `output`. Returns the entry count."""
+    entries: Dict[int, str] = {}
+    for path in sources:
+        try:
+            for bits, value, vendor in iter_source(path):
+                entries.setdefault(bits << 48 | value, vendor)
+        except OSError:
+            continue
+    strings = bytearray()
+    offsets: Dict[str, int] = {}
+    records = bytearray()
+    for key in sorted(entries):
+        vendor = entries[key]
+        if vendor not in offsets:
+            offsets[vendor] = len(strings)
+            strings += vendor.encode("utf-8") + b"\0"
+        records += _RECORD.pack(key, offsets[vendor])
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(entries), _HEADER.size + len(records)))
+        f.write(records)
+        f.write(strings)
+    os.replace(tmp, output)  # Readers holding the old file keep their mapping
+    return len(entries)
+
+
+class _Keys:
+    """Sequence view of the record keys in the mapped file, for bisect."""
+
+    def __init__(self, buf: mmap.mmap, count: int):
+        self._buf = buf
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> int:
+        return _RECORD.unpack_from(self._buf, _HEADER.size + index * _RECORD.size)[0]
+
+
+class OuiDatabase:
+    """Read-only, memory-mapped OUI table (see build()). Raises OSError/ValueError if unusable."""
+
+    def __init__(self, path: str = DEFAULT_DB):
+        with open(path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._strings = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC or self._strings != _HEADER.size + self._count * _RECORD.size:
+            self._buf.close()
+            raise ValueError(f"{path}: not an OUI database")
+        self._keys = _Keys(self._buf, self._count)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        self._buf.close()
+
+    def _vendor_at(self, index: int) -> str:
+        _, offset = _RECORD.unpack_from(self._buf, _HEADER.size + index * _RECORD.size)
+        start = self._strings + offset
+        end = self._buf.find(b"\0", start)
+        return self._buf[start:end].decode("utf-8", errors="replace")
+
+    def lookup(self, mac: str) -> Optional[str]:
+        """Vendor of the most specific assignment covering this MAC, or None."""
+        value = mac_to_int(mac)
+        if value is None:
+            return None
+        for bits in PREFIX_BITS:
+            key = bits << 48 | _mask(value, bits)
+            index = bisect.bisect_left(self._keys, key)
+            if index < self._count and self._keys[index] == key:
+                return self._vendor_at(index)
+        return None
+
+
+def open_default(path: str = DEFAULT_DB) -> Optional[OuiDatabase]:
+    """Open the vendor database if it has been built, else None."""
+    try:
+        return OuiDatabase(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="OUI vendor database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_cmd = commands.add_parser("build", help="Build the database from installed vendor lists")
+    build_cmd.add_argument("sources", nargs="*", help=f"Vendor lists (default: {', '.join(DEFAULT_SOURCES)})")
+    build_cmd.add_argument("--output", default=DEFAULT_DB, help=f"Database file (default: {DEFAULT_DB})")
+    lookup_cmd = commands.add_parser("lookup", help="Look up MAC vendors")
+    lookup_cmd.add_argument("macs", nargs="+", help="MAC addresses")
+    lookup_cmd.add_argument("--db", default=DEFAULT_DB, help=f"Database file (default: {DEFAULT_DB})")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        sources = args.sources or [path for path in DEFAULT_SOURCES if os.path.exists(path)]
+        if not sources:
+            print("oui_db: no vendor lists found (install arp-scan, nmap or ieee-data)", file=sys.stderr)
+            return 1
+        count = build(sources, args.output)
+        print(f"Wrote {count} prefixes from {len(sources)} file(s) to {args.output}")
+        return 0
+
+    try:
+        db = OuiDatabase(args.db)
+    except (OSError, ValueError) as e:
+        print(f"oui_db: {e} (run: python3 scripts/oui_db.py build)", file=sys.stderr)
+        return 1
+    for mac in args.macs:
+        # Format: VENDOR|MAC|VENDOR
+        print(f"VENDOR|{mac}|{db.lookup(mac) or '-'}")
+    db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""port_scanner.py — Native asyncio TCP-connect port scanner
+
+Checks every (host, port) pair of a scan concurrently from one event loop,
+using non-blocking connects and a single global in-flight limit instead of
+one nmap process per host. With an RttEstimator, connect timeouts follow each
+host's measured RTT and unanswered connects are retried with backoff.
+
+Usage: python3 scripts/port_scanner.py [--ports LIST] [--threads N] [--timeout MS] [--fixed-timeout] [host ...]
+       (hosts are read from stdin, one per line, when none are given)
+"""
+import argparse
+import asyncio
+import errno
+import itertools
+import socket
+import struct
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from rtt_estimator import RttEstimator
+
+# Port states, named after nmap's so log output reads the same
+OPEN = "open"
+CLOSED = "closed"
+FILTERED = "filtered"
+
+# Top 10 most common ports worldwide (matches scan_subnets_enhanced.sh)
+TOP_PORTS = [22, 80, 443, 3389, 3306, 8080, 21, 25, 110, 143]
+
+# connect() errors that mean "something answered, but the port is closed"
+_CLOSED_ERRNOS = {errno.ECONNREFUSED, errno.ECONNRESET}
+
+# RST on close: skips TIME_WAIT so large scans don't exhaust local ports
+_LINGER_RST = struct.pack("ii", 1, 0)
+
+ResultCallback = Callable[[str, int, str], None]
+
+
+def parse_ports(spec: str) -> List[int]:
+    """Parse a port list like "22,80,8000-8100" (or "top") into unique ports, keeping order."""
+    spec = (spec or "").strip()
+    if not spec or spec.lower() == "top":
+        return list(TOP_PORTS)
+
+    ports: List[int] = []
+    seen = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start_s, end_s = part.split("-", 1)
+            start, end = int(start_s), int(end_s)
+            if start > end:
+                raise ValueError(f"Invalid port range: {part}")
+            chunk = range(start, end + 1)
+        else:
+            chunk = range(int(part), int(part) + 1)
+        for port in chunk:
+            if not 1 <= port <= 65535:
+                raise ValueError(f"Port out of range: {port}")
+            if port not in seen:
+                seen.add(port)
+                ports.append(port)
+    return ports
+
+
+def format_ports(states: Dict[int, str]) -> str:
+    """Format a host's port states for the Ports column: open ports, comma-separated, or "-"."""
+    open_ports = sorted(port for port, state in states.items() if state == OPEN)
+    return ",".join(str(port) for port in open_ports) if open_ports else "-"
+
+
+class PortScanner:
+    """TCP-connect scanner with a global limit on in-flight connects.
+
+    `concurrency` bounds the number of connects outstanding across all hosts
+    (the TUI's Threads value) and `timeout` is the per-connect timeout in
+    seconds (the TUI's Timeout value). A connect that completes is "open",
+    one refused or reset is "closed", and one that times out or gets an ICMP
+    unreachable is "filtered". With an `rtt` estimator, each connect waits
+    the host's adaptive timeout, timed-out connects are retried as often as
+    the estimator says, and completed connects feed it.
+    """
+
+    def __init__(self, concurrency: int = 50, timeout: float = 1.0,
+                 rtt: Optional[RttEstimator] = None):
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = max(0.05, float(timeout))
+        self.rtt = rtt
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop = None
+        self.control = None  # Optional ScanControl: waited on before each connect
+        self.metrics = None  # Optional ScanMetrics: counts connects, answers and connects in flight
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Semaphores bind to the loop they are first used on; the TUI runs each
+        # scan in a fresh worker loop, so create one per loop.
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._sem_loop is not loop:
+            self._sem = asyncio.Semaphore(self.concurrency)
+            self._sem_loop = loop
+        return self._sem
+
+    async def probe(self, ip: str, port: int) -> str:
+        """Connect to ip:port (retrying timeouts when adaptive) and classify the port."""
+        attempts = self.rtt.retries_for(ip) + 1 if self.rtt else 1
+        for attempt in range(attempts):
+            async with self._semaphore():
+                if self.control:
+                    await self.control.wait()
+                state = await self._connect(ip, port, attempt)
+            if state is not None:
+                return state
+        return FILTERED
+
+    async def _connect(self, ip: str, port: int, attempt: int = 0) -> Optional[str]:
+        """Classify ip:port from one connect; None if it timed out."""
+        loop = asyncio.get_running_loop()
+        family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+        try:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+        except OSError:
+            # Out of file descriptors: treat as unknown rather than open
+            return FILTERED
+        timeout = self.rtt.timeout(ip, attempt) if self.rtt else self.timeout
+        start = time.perf_counter()
+        if self.metrics:
+            self.metrics.inc("ipscan_probes_sent_total", probe="tcp")
+            self.metrics.add("ipscan_probes_in_flight", 1, probe="tcp")
+        try:
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RST)
+            await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout)
+            state = OPEN
+        except asyncio.TimeoutError:
+            return None
+        except OSError as e:
+            if e.errno not in _CLOSED_ERRNOS:
+                return FILTERED
+            state = CLOSED
+        finally:
+            sock.close()
+            if self.metrics:
+                self.metrics.add("ipscan_probes_in_flight", -1, probe="tcp")
+        if self.metrics:
+            self.metrics.inc("ipscan_probe_replies_total", probe="tcp")
+        if self.rtt:
+            # SYN/ACK or RST: one round trip
+            self.rtt.observe(ip, time.perf_counter() - start, retransmitted=attempt > 0)
+        return state
+
+    async def scan_host(self, ip: str, ports: Iterable[int],
+                        on_result: Optional[ResultCallback] = None) -> Dict[int, str]:
+        """Scan one host's ports concurrently, sharing the global in-flight limit.
+
+        on_result(ip, port, state) is called as each port's probe finishes, so
+        work on an open port (e.g. service detection) can start right away.
+        """
+        ports = list(ports)
+
+        async def probe(port: int) -> str:
+            state = await self.probe(ip, port)
+            if on_result:
+                on_result(ip, port, state)
+            return state
+
+        states = await asyncio.gather(*(probe(port) for port in ports))
+        return dict(zip(ports, states))
+
+    async def scan(self, hosts: Iterable[str], ports: Iterable[int],
+                   on_result: Optional[ResultCallback] = None) -> Dict[str, Dict[int, str]]:
+        """Scan all hosts x ports, calling on_result(ip, port, state) as each probe finishes.
+
+        Work is pulled lazily from the hosts x ports product by `concurrency`
+        workers, so memory stays flat no matter how many targets there are.
+        """
+        ports = list(ports)
+        results: Dict[str, Dict[int, str]] = {}
+        targets = itertools.product(hosts, ports)
+
+        async def worker():
+            for ip, port in targets:
+                state = await self.probe(ip, port)
+                results.setdefault(ip, {})[port] = state
+                if on_result:
+                    on_result(ip, port, state)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Asyncio TCP-connect port scanner")
+    parser.add_argument("hosts", nargs="*", help="Hosts to scan (default: read from stdin)")
+    parser.add_argument("--ports", default="top", help="Port list, e.g. 22,80,8000-8100 (default: top 10)")
+    parser.add_argument("--threads", type=int, default=50, help="Max in-flight connects (default: 50)")
+    parser.add_argument("--timeout", type=int, default=1000, help="Connect timeout in ms (default: 1000)")
+    parser.add_argument("--fixed-timeout", action="store_true",
+                        help="Always wait the full timeout instead of adapting it to measured RTTs")
+    parser.add_argument("--all", action="store_true", help="Print closed/filtered ports too")
+    args = parser.parse_args(argv)
+
+    try:
+        ports = parse_ports(args.ports)
+    except ValueError as e:
+        parser.error(str(e))
+
+    hosts = args.hosts or [line.strip() for line in sys.stdin if line.strip()]
+    rtt = None if args.fixed_timeout else RttEstimator(timeout=args.timeout / 1000.0)
+    scanner = PortScanner(concurrency=args.threads, timeout=args.timeout / 1000.0, rtt=rtt)
+
+    def report(ip: str, port: int, state: str) -> None:
+        if args.all or state == OPEN:
+            # Format: PORT|IP|PORT|STATE
+            print(f"PORT|{ip}|{port}|{state}", flush=True)
+
+    asyncio.run(scanner.scan(hosts, ports, on_result=report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""range_router.py — Map scan results to the configured range that contains them
+
+Ranges are flattened into a sorted list of disjoint address intervals, each
+owned by the most specific (longest-prefix) range covering it, so a lookup
+is one binary search regardless of how many ranges are configured.
+
+Usage: python3 scripts/range_router.py CIDR [CIDR ...] < ips.txt
+       Prints one ROUTE|IP|CIDR line per input IP ("-" if no range contains it).
+"""
+import argparse
+import bisect
+import ipaddress
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (first address, last address, range index) as integers
+Interval = Tuple[int, int, int]
+
+
+def parse_ranges(text: str) -> List[str]:
+    """Split an input like "10.0.0.0/8, 192.168.1.0/24" into normalized CIDRs (ValueError if invalid)."""
+    ranges = []
+    for part in text.replace(",", " ").split():
+        ranges.append(str(ipaddress.ip_network(part, strict=False)))
+    return ranges
+
+
+def outermost_ranges(ranges: Iterable[str]) -> List[str]:
+    """Drop ranges nested inside another configured range, so overlapping input is probed once."""
+    networks = sorted({ipaddress.ip_network(r, strict=False) for r in ranges},
+                      key=lambda n: (n.version, int(n.network_address), n.prefixlen))
+    kept: List = []
+    for network in networks:
+        if kept and kept[-1].version == network.version and network.subnet_of(kept[-1]):
+            continue
+        kept.append(network)
+    return [str(network) for network in kept]
+
+
+def split_families(ranges: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """(IPv4, IPv6) CIDRs of `ranges`, each in the given order."""
+    ipv4: List[str] = []
+    ipv6: List[str] = []
+    for spec in ranges:
+        (ipv6 if ipaddress.ip_network(spec, strict=False).version == 6 else ipv4).append(spec)
+    return ipv4, ipv6
+
+
+def _flatten(networks: List[Interval]) -> List[Interval]:
+    """Turn nested/disjoint CIDR intervals into disjoint ones owned by the innermost range."""
+    # Outer networks first at equal start, so nested ones are pushed on top of them
+    networks = sorted(networks, key=lambda n: (n[0], n[0] - n[1], n[2]))
+    flat: List[Interval] = []
+    stack: List[Interval] = []
+    cursor = 0
+
+    def emit(first: int, last: int, index: int) -> None:
+        if first <= last:
+            flat.append((first, last, index))
+
+    for first, last, index in networks:
+        # Close every open network that ends before this one starts
+        while stack and stack[-1][1] < first:
+            _, top_last, top_index = stack.pop()
+            emit(cursor, top_last, top_index)
+            cursor = top_last + 1
+        if stack:
+            if stack[-1][0] == first and stack[-1][1] == last:
+                continue  # Same network configured twice: the first one keeps it
+            emit(cursor, first - 1, stack[-1][2])
+        stack.append((first, last, index))
+        cursor = first
+    while stack:
+        _, top_last, top_index = stack.pop()
+        emit(cursor, top_last, top_index)
+        cursor = top_last + 1
+    return flat
+
+
+class RangeRouter:
+    """Longest-prefix lookup of IPs against the configured scan ranges.
+
+    `lookup(ip)` returns the index (into `ranges`) of the most specific range
+    containing the address, or None. IPv4 and IPv6 ranges are kept apart.
+    """
+
+    def __init__(self, ranges: Iterable[str]):
+        self.ranges: List[str] = list(ranges)
+        by_version: Dict[int, List[Interval]] = {4: [], 6: []}
+        for index, spec in enumerate(self.ranges):
+            network = ipaddress.ip_network(spec, strict=False)
+            by_version[network.version].append(
+                (int(network.network_address), int(network.broadcast_address), index)
+            )
+        self._intervals: Dict[int, List[Interval]] = {}
+        self._starts: Dict[int, List[int]] = {}
+        for version, networks in by_version.items():
+            flat = _flatten(networks)
+            self._intervals[version] = flat
+            self._starts[version] = [interval[0] for interval in flat]
+
+    def __len__(self) -> int:
+        return len(self.ranges)
+
+    def lookup(self, ip: str) -> Optional[int]:
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        value = int(addr)
+        starts = self._starts[addr.version]
+        pos = bisect.bisect_right(starts, value) - 1
+        if pos < 0:
+            return None
+        first, last, index = self._intervals[addr.version][pos]
+        return index if value <= last else None
+
+    def range_for(self, ip: str) -> Optional[str]:
+        index = self.lookup(ip)
+        return self.ranges[index] if index is not None else None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Route IPs to the most specific configured range")
+    parser.add_argument("ranges", nargs="+", help="CIDRs (nested ranges allowed)")
+    args = parser.parse_args(argv)
+
+    try:
+        router = RangeRouter(r for spec in args.ranges for r in parse_ranges(spec))
+    except ValueError as e:
+        parser.error(str(e))
+
+    for line in sys.stdin:
+        ip = line.strip()
+        if ip:
+            # Format: ROUTE|IP|CIDR
+            print(f"ROUTE|{ip}|{router.range_for(ip) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""rtt_estimator.py — Adaptive probe timeouts from measured round-trip times
+
+Keeps a smoothed RTT and RTT variance (SRTT/RTTVAR, as TCP does per RFC 6298)
+for every host that answered and for the subnet around it. Probe engines ask
+it how long to wait for a reply and how many times to retransmit: a host with
+its own samples gets SRTT + 4·RTTVAR, a silent address gets its subnet's
+value, and an address with no samples nearby gets the configured timeout,
+which is also the upper bound. Each retransmission doubles the timeout.
+
+Usage: python3 scripts/rtt_estimator.py [--timeout MS] [--retries N] [IP RTT_MS ...]
+       Reads IP RTT_MS pairs (arguments or stdin) and prints one
+       RTO|SUBNET|SRTT_MS|RTTVAR_MS|RTO_MS|LOSS|SAMPLES line per subnet.
+"""
+import argparse
+import math
+import socket
+import sys
+from typing import Dict, List, Optional
+
+# RFC 6298 gains and variance multiplier
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+
+# Floor for adaptive timeouts (seconds); keeps LAN timeouts above scheduling jitter
+MIN_TIMEOUT = 0.05
+
+# Subnet size estimates are pooled over
+IPV4_PREFIX = 24
+IPV6_PREFIX = 64
+
+# Replies a subnet needs before its loss rate replaces the default retry count
+LOSS_MIN_SAMPLES = 8
+
+# Target probability of missing a live host because every attempt was lost
+MISS_TARGET = 0.01
+
+
+class RttStats:
+    """SRTT/RTTVAR of one host or subnet, plus how many replies needed a retransmission."""
+
+    __slots__ = ("srtt", "rttvar", "samples", "retransmitted")
+
+    def __init__(self):
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self.samples = 0
+        self.retransmitted = 0
+
+    def update(self, rtt: float, retransmitted: bool = False) -> None:
+        if self.samples == 0:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        self.samples += 1
+        if retransmitted:
+            self.retransmitted += 1
+
+    @property
+    def rto(self) -> float:
+        return self.srtt + K * self.rttvar
+
+    @property
+    def loss(self) -> float:
+        """Estimated probe loss rate (Laplace-smoothed so a clean run is never exactly 0)."""
+        return (self.retransmitted + 1) / (self.samples + 2)
+
+
+class RttEstimator:
+    """Per-host and per-subnet RTT estimates shared by the probes of one scan.
+
+    `timeout` (seconds) is the user's Timeout: the starting value and the
+    upper bound. `retries` is used until a subnet has enough replies to
+    estimate its loss rate; after that each address gets just enough
+    retransmissions to keep the chance of missing a live host under
+    MISS_TARGET, between 1 and `max_retries`. Must be used from one thread.
+    """
+
+    def __init__(self, timeout: float = 1.0, retries: int = 2, max_retries: int = 4,
+                 min_timeout: float = MIN_TIMEOUT):
+        self.max_timeout = max(0.05, float(timeout))
+        self.min_timeout = min(float(min_timeout), self.max_timeout)
+        self.retries = max(0, int(retries))
+        self.max_retries = max(self.retries, int(max_retries))
+        self._hosts: Dict[str, RttStats] = {}
+        self._subnets: Dict[str, RttStats] = {}
+
+    @staticmethod
+    def subnet(ip: str) -> str:
+        # Called for every probe: masking the packed address is far cheaper than ipaddress
+        family, bits, prefix = ((socket.AF_INET6, 128, IPV6_PREFIX) if ":" in ip
+                                else (socket.AF_INET, 32, IPV4_PREFIX))
+        try:
+            packed = socket.inet_pton(family, ip)
+        except OSError:
+            raise ValueError(f"invalid IP address: {ip!r}") from None
+        network = int.from_bytes(packed, "big") >> (bits - prefix) << (bits - prefix)
+        return f"{socket.inet_ntop(family, network.to_bytes(bits // 8, 'big'))}/{prefix}"
+
+    def observe(self, ip: str, rtt: float, retransmitted: bool = False) -> None:
+        """Record a reply from `ip` after `rtt` seconds; `retransmitted` if an earlier probe got no answer."""
+        self._hosts.setdefault(ip, RttStats()).update(rtt, retransmitted)
+        self._subnets.setdefault(self.subnet(ip), RttStats()).update(rtt, retransmitted)
+
+    def _stats(self, ip: str) -> Optional[RttStats]:
+        stats = self._hosts.get(ip)
+        if stats is None:
+            stats = self._subnets.get(self.subnet(ip))
+        return stats
+
+    def timeout(self, ip: str, attempt: int = 0) -> float:
+        """Seconds to wait for a reply to attempt `attempt` (0 = first probe) to `ip`."""
+        stats = self._stats(ip)
+        if stats is None:
+            return self.max_timeout
+        rto = max(self.min_timeout, stats.rto) * (2 ** attempt)
+        return min(rto, self.max_timeout)
+
+    def retries_for(self, ip: str) -> int:
+        """Retransmissions worth sending to `ip` before giving up on it."""
+        stats = self._subnets.get(self.subnet(ip))
+        if stats is None or stats.samples < LOSS_MIN_SAMPLES:
+            return self.retries
+        attempts = math.ceil(math.log(MISS_TARGET) / math.log(stats.loss))
+        return max(1, min(self.max_retries, attempts - 1))
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Per-subnet estimates: srtt/rttvar/rto in ms, loss, samples, retries."""
+        return {
+            subnet: {
+                "srtt": stats.srtt * 1000.0,
+                "rttvar": stats.rttvar * 1000.0,
+                "rto": min(max(self.min_timeout, stats.rto), self.max_timeout) * 1000.0,
+                "loss": stats.loss,
+                "samples": stats.samples,
+                "retries": self.retries_for(subnet.split("/")[0]),
+            }
+            for subnet, stats in sorted(self._subnets.items())
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Show adaptive timeouts for measured RTTs")
+    parser.add_argument("samples", nargs="*", help="IP RTT_MS pairs (default: read from stdin)")
+    parser.add_argument("--timeout", type=int, default=1000, help="Upper bound in ms (default: 1000)")
+    parser.add_argument("--retries", type=int, default=2, help="Retries before loss is known (default: 2)")
+    args = parser.parse_args(argv)
+
+    tokens = args.samples or sys.stdin.read().split()
+    if len(tokens) % 2:
+        parser.error("samples must be IP RTT_MS pairs")
+    estimator = RttEstimator(timeout=args.timeout / 1000.0, retries=args.retries)
+    try:
+        for ip, rtt in zip(tokens[::2], tokens[1::2]):
+            estimator.observe(ip, float(rtt) / 1000.0)
+    except ValueError as e:
+        parser.error(str(e))
+
+    for subnet, stats in estimator.metrics().items():
+        # Format: RTO|SUBNET|SRTT_MS|RTTVAR_MS|RTO_MS|LOSS|SAMPLES
+        print(f"RTO|{subnet}|{stats['srtt']:.2f}|{stats['rttvar']:.2f}|{stats['rto']:.2f}|"
+              f"{stats['loss']:.3f}|{stats['samples']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
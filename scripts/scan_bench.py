@@ -0,0 +1,403 @@
+"""scan_bench.py — End-to-end scan benchmark on a synthetic network
+
+Builds a throwaway network out of Linux network namespaces: the scanner gets
+a namespace with a bridge, and the live hosts are spread over a few more
+namespaces attached to it with veth pairs. Every live host answers ARP and
+ping (the kernel does that) and runs dummy TCP listeners on a seeded random
+subset of the benchmark ports; `tc netem` adds latency, jitter and loss to
+the hosts' replies. scan_cli.py then scans the range from the scanner's
+namespace, and the run is scored against the known layout: duration, time to
+first result, addresses and live hosts per second, recall of live hosts and
+open ports, and the scanner's CPU time and peak RSS. Results are saved as
+JSON under results/bench/; --compare prints the change against an earlier
+file, so regressions between versions show up. Needs root, ip and tc.
+
+Usage: sudo python3 scripts/scan_bench.py [--range CIDR] [--hosts N] [--ports LIST] [--open-ratio R]
+                                          [--delay MS] [--jitter MS] [--loss PCT] [--namespaces N]
+                                          [--repeat N] [--seed N] [--scanner PATH] [--output FILE]
+                                          [--compare FILE] [-- SCANNER_ARG ...]
+       Prints one RUN|N|DURATION_S|FIRST_RESULT_S|ADDRESSES_PER_S|HOST_RECALL|PORT_RECALL|CPU_S|MAX_RSS_MB
+       line per run, then SUMMARY and SAVED lines (and METRIC|NAME|BASE|NOW|CHANGE_PCT|VERDICT lines with --compare).
+"""
+import argparse
+import ipaddress
+import json
+import os
+import platform
+import random
+import resource
+import selectors
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from port_scanner import parse_ports
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCANNER = os.path.join(SCRIPTS_DIR, "scan_cli.py")
+DEFAULT_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "results", "bench")
+
+# Bumped when the result file layout changes
+BENCH_VERSION = 1
+
+# Seconds a scan may take before the run is abandoned
+RUN_TIMEOUT = 600
+
+# Metrics summarized over runs (median) and compared with --compare; True if higher is better
+METRICS = {
+    "duration_s": False,
+    "first_result_s": False,
+    "addresses_per_s": True,
+    "live_hosts_per_s": True,
+    "host_recall": True,
+    "port_recall": True,
+    "cpu_s": False,
+    "max_rss_mb": False,
+}
+
+
+def _ip(*args: str, batch: Optional[List[str]] = None) -> None:
+    """Run an ip(8) command, or a batch of them (one subprocess for thousands of addresses)."""
+    if batch is not None:
+        subprocess.run(["ip", *args, "-batch", "-"], input="\n".join(batch) + "\n",
+                       text=True, check=True, capture_output=True)
+    else:
+        subprocess.run(["ip", *args], check=True, capture_output=True, text=True)
+
+
+def neighbor_limit() -> Optional[int]:
+    """Most neighbor entries a namespace may hold (net.ipv4.neigh.default.gc_thresh3, system-wide)."""
+    try:
+        with open("/proc/sys/net/ipv4/neigh/default/gc_thresh3") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+class BenchNetwork:
+    """The synthetic network: built by setup(), removed by teardown() (also after a failed setup).
+
+    `hosts` maps each live host to its open ports. The scanner's address is
+    the first host address of the range and is not one of the live hosts.
+    """
+
+    def __init__(self, network: ipaddress.IPv4Network, hosts: Dict[str, List[int]], namespaces: int = 4,
+                 delay: float = 0.0, jitter: float = 0.0, loss: float = 0.0):
+        self.network = network
+        self.hosts = hosts
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.prefix = f"ipsb{os.getpid()}"
+        self.scanner_ns = f"{self.prefix}-scan"
+        self.host_ns = [f"{self.prefix}-h{i}" for i in range(max(1, min(namespaces, len(hosts) or 1)))]
+        self.scanner_ip = str(next(network.hosts()))
+        self._created: List[str] = []
+        self._servers: List[subprocess.Popen] = []
+
+    def placement(self) -> Dict[str, List[str]]:
+        """Live hosts of each host namespace (round robin)."""
+        groups: Dict[str, List[str]] = {ns: [] for ns in self.host_ns}
+        for index, ip in enumerate(sorted(self.hosts, key=lambda a: int(ipaddress.ip_address(a)))):
+            groups[self.host_ns[index % len(self.host_ns)]].append(ip)
+        return groups
+
+    def setup(self) -> None:
+        plen = self.network.prefixlen
+        _ip("netns", "add", self.scanner_ns)
+        self._created.append(self.scanner_ns)
+        _ip("-n", self.scanner_ns, batch=[
+            "link set lo up",
+            "link add br0 type bridge",
+            f"addr add {self.scanner_ip}/{plen} dev br0",
+            "link set br0 up",
+        ])
+
+        for index, (ns, ips) in enumerate(self.placement().items()):
+            _ip("netns", "add", ns)
+            self._created.append(ns)
+            _ip("-n", self.scanner_ns, "link", "add", f"h{index}", "type", "veth",
+                "peer", "name", "eth0", "netns", ns)
+            _ip("-n", self.scanner_ns, batch=[f"link set h{index} master br0", f"link set h{index} up"])
+            _ip("-n", ns, batch=["link set lo up", "link set eth0 up"]
+                + [f"addr add {ip}/{plen} dev eth0" for ip in ips])
+            if self.delay or self.jitter or self.loss:
+                netem = ["tc", "-n", ns, "qdisc", "add", "dev", "eth0", "root", "netem", "limit", "100000"]
+                if self.delay or self.jitter:
+                    netem += ["delay", f"{self.delay}ms", f"{self.jitter}ms"]
+                if self.loss:
+                    netem += ["loss", f"{self.loss}%"]
+                result = subprocess.run(netem, capture_output=True, text=True)
+                if result.returncode != 0:
+                    raise RuntimeError(f"tc netem failed ({result.stderr.strip()}); "
+                                       "--delay, --jitter and --loss need the sch_netem kernel module")
+            listeners = [[ip, port] for ip in ips for port in self.hosts[ip]]
+            if listeners:
+                self._start_server(ns, listeners)
+
+    def _start_server(self, ns: str, listeners: List[List[object]]) -> None:
+        server = subprocess.Popen(
+            ["ip", "netns", "exec", ns, sys.executable, os.path.abspath(__file__), "--serve"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self._servers.append(server)
+        server.stdin.write(json.dumps(listeners))
+        server.stdin.close()
+        if server.stdout.readline().strip() != "READY":
+            raise RuntimeError(f"TCP listeners in {ns} failed to start")
+
+    def scanner_command(self, command: List[str]) -> List[str]:
+        return ["ip", "netns", "exec", self.scanner_ns, *command]
+
+    def teardown(self) -> None:
+        for server in self._servers:
+            if server.poll() is None:
+                server.terminate()
+                try:
+                    server.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+        self._servers.clear()
+        # Deleting a namespace removes its veth ends and the bridge with it
+        for ns in reversed(self._created):
+            subprocess.run(["ip", "netns", "del", ns], check=False, capture_output=True)
+        self._created.clear()
+
+
+def serve(listeners: List[List[object]]) -> int:
+    """Accept and close connections on each (ip, port) until terminated (runs inside a host namespace)."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < len(listeners) + 64:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, len(listeners) + 64), hard))
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    selector = selectors.DefaultSelector()
+    for ip, port in listeners:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((str(ip), int(port)))
+        sock.listen(128)
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+    print("READY", flush=True)
+    while True:
+        for key, _ in selector.select():
+            try:
+                conn, _ = key.fileobj.accept()
+                conn.close()
+            except OSError:
+                pass
+
+
+def build_layout(network: ipaddress.IPv4Network, count: int, ports: List[int], open_ratio: float,
+                 seed: int) -> Dict[str, List[int]]:
+    """Seeded random live hosts of `network` (never the scanner's address) and their open ports."""
+    rng = random.Random(seed)
+    first = int(network.network_address) + 2  # .0 is the network, .1 the scanner
+    last = int(network.broadcast_address) - 1
+    if count > last - first + 1:
+        raise ValueError(f"{network} has room for {max(0, last - first + 1)} live hosts, not {count}")
+    picked = rng.sample(range(first, last + 1), count)
+    return {str(ipaddress.IPv4Address(value)): sorted(p for p in ports if rng.random() < open_ratio)
+            for value in sorted(picked)}
+
+
+def _scanner_commit(scanner: str) -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "-C", os.path.dirname(os.path.abspath(scanner)), "describe",
+                                 "--always", "--dirty"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_scan(net: BenchNetwork, command: List[str], truth: Dict[str, List[int]]) -> Dict[str, object]:
+    """Run one scan in the scanner's namespace and score it against `truth`."""
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        started = time.monotonic()
+        proc = subprocess.Popen(net.scanner_command(command), stdout=subprocess.PIPE, stderr=stderr, text=True)
+        watchdog = threading.Timer(RUN_TIMEOUT, proc.kill)
+        watchdog.start()
+        first: Optional[float] = None
+        found: Dict[str, Set[int]] = {}
+        for line in proc.stdout:
+            if first is None:
+                first = time.monotonic() - started
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            found[row["ip"]] = set(row.get("ports") or [])
+        # wait4() gives the scanner's own CPU time and peak RSS (ip netns exec execs into it)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        duration = time.monotonic() - started
+        watchdog.cancel()
+        stderr.seek(0)
+        errors = [line.rstrip() for line in stderr if "[ERROR]" in line or "Traceback" in line]
+
+    found.pop(net.scanner_ip, None)  # The scanner answers its own ping
+    live = set(truth)
+    expected_ports = {(ip, port) for ip, ports in truth.items() for port in ports}
+    found_ports = {(ip, port) for ip, ports in found.items() for port in ports}
+    return {
+        "exit_code": proc.returncode,
+        "duration_s": round(duration, 3),
+        "first_result_s": round(first, 3) if first is not None else None,
+        "addresses_per_s": round(net.network.num_addresses / duration, 1),
+        "live_hosts_per_s": round(len(live & set(found)) / duration, 1),
+        "hosts_found": len(found),
+        "host_recall": round(len(live & set(found)) / len(live), 4) if live else 1.0,
+        "false_hosts": len(set(found) - live),
+        "port_recall": round(len(expected_ports & found_ports) / len(expected_ports), 4) if expected_ports else 1.0,
+        "false_ports": len(found_ports - expected_ports),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+        "max_rss_mb": round(usage.ru_maxrss / 1024.0, 1),
+        "errors": errors[-5:],
+    }
+
+
+def summarize(runs: List[Dict[str, object]]) -> Dict[str, Optional[float]]:
+    summary: Dict[str, Optional[float]] = {}
+    for metric in METRICS:
+        values = [run[metric] for run in runs if run.get(metric) is not None]
+        summary[metric] = round(statistics.median(values), 4) if values else None
+    return summary
+
+
+def compare(base: Dict[str, object], now: Dict[str, Optional[float]]) -> List[Tuple[str, object, object, Optional[float], str]]:
+    """(metric, base, now, change %, "better"/"worse"/"") for each metric of both summaries."""
+    rows = []
+    for metric, higher_is_better in METRICS.items():
+        old, new = base.get("summary", {}).get(metric), now.get(metric)
+        change = round((new - old) / old * 100.0, 1) if old and new is not None else None
+        verdict = ""
+        if change:
+            verdict = "better" if (change > 0) == higher_is_better else "worse"
+        rows.append((metric, old, new, change, verdict))
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark a scan of a synthetic netns network")
+    parser.add_argument("--range", default="10.250.0.0/24", help="Range of the synthetic network (default: 10.250.0.0/24)")
+    parser.add_argument("--hosts", type=int, default=64, help="Live hosts (default: 64)")
+    parser.add_argument("--ports", default="22,80,443,8080", help="Ports scanned; each live host listens on some (default: 22,80,443,8080)")
+    parser.add_argument("--open-ratio", type=float, default=0.5, help="Chance of each port being open on a host (default: 0.5)")
+    parser.add_argument("--delay", type=float, default=0.0, help="Added reply latency in ms (default: 0)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency jitter in ms (default: 0)")
+    parser.add_argument("--loss", type=float, default=0.0, help="Reply loss in percent (default: 0)")
+    parser.add_argument("--namespaces", type=int, default=4, help="Host namespaces the live hosts are spread over (default: 4)")
+    parser.add_argument("--repeat", type=int, default=3, help="Scans of the same network (default: 3)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the host/port layout (default: 1)")
+    parser.add_argument("--scanner", default=DEFAULT_SCANNER, help="scan_cli.py to benchmark (e.g. of another checkout)")
+    parser.add_argument("--output", "-o", help=f"Result file (default: {DEFAULT_DIR}/bench-<time>.json)")
+    parser.add_argument("--compare", metavar="FILE", help="Earlier result file to compare with")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("scanner_args", nargs=argparse.REMAINDER,
+                        help="Extra scan_cli.py arguments after --, e.g. -- --workers 2 --fixed-timeout")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        return serve(json.load(sys.stdin))
+
+    try:
+        network = ipaddress.ip_network(args.range, strict=False)
+        if network.version != 4 or network.num_addresses < 4:
+            raise ValueError("--range must be an IPv4 range of at least 4 addresses")
+        ports = parse_ports(args.ports)
+        if not 0.0 <= args.open_ratio <= 1.0 or not 0.0 <= args.loss <= 100.0:
+            raise ValueError("--open-ratio must be within 0-1 and --loss within 0-100")
+        layout = build_layout(network, args.hosts, ports, args.open_ratio, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot read {args.compare}: {e}")
+    if os.geteuid() != 0:
+        print("scan_bench: needs root (network namespaces)", file=sys.stderr)
+        return 1
+    for tool in ("ip", "tc"):
+        if shutil.which(tool) is None:
+            print(f"scan_bench: {tool} not found (install iproute2)", file=sys.stderr)
+            return 1
+
+    limit = neighbor_limit()
+    if limit is not None and network.num_addresses > limit:
+        print(f"scan_bench: {network} has more addresses than the neighbor table holds ({limit}, "
+              "net.ipv4.neigh.default.gc_thresh3); replies beyond that are lost", file=sys.stderr)
+
+    extra = args.scanner_args[1:] if args.scanner_args[:1] == ["--"] else args.scanner_args
+    command = [sys.executable, os.path.abspath(args.scanner), "--format", "jsonl", "--quiet",
+               "--no-checkpoint", "--ports", ",".join(map(str, ports)), *extra, str(network)]
+    net = BenchNetwork(network, layout, args.namespaces, args.delay, args.jitter, args.loss)
+
+    runs: List[Dict[str, object]] = []
+    try:
+        net.setup()
+        for number in range(1, args.repeat + 1):
+            run = run_scan(net, command, layout)
+            runs.append(run)
+            # Format: RUN|N|DURATION_S|FIRST_RESULT_S|ADDRESSES_PER_S|HOST_RECALL|PORT_RECALL|CPU_S|MAX_RSS_MB
+            print(f"RUN|{number}|{run['duration_s']}|{run['first_result_s']}|{run['addresses_per_s']}|"
+                  f"{run['host_recall']}|{run['port_recall']}|{run['cpu_s']}|{run['max_rss_mb']}", flush=True)
+            for error in run["errors"]:
+                print(f"scan_bench: run {number}: {error}", file=sys.stderr)
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        detail = e.stderr.strip() if isinstance(e, subprocess.CalledProcessError) and e.stderr else e
+        print(f"scan_bench: {detail}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        net.teardown()
+
+    summary = summarize(runs)
+    result = {
+        "version": BENCH_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "scanner": {"path": os.path.abspath(args.scanner), "commit": _scanner_commit(args.scanner),
+                    "args": extra},
+        "system": {"python": platform.python_version(), "kernel": platform.release(),
+                   "cpus": os.cpu_count(), "neighbor_limit": limit},
+        "network": {"range": str(network), "addresses": network.num_addresses, "hosts": len(layout),
+                    "ports": ports, "open_ports": sum(len(p) for p in layout.values()),
+                    "open_ratio": args.open_ratio, "delay_ms": args.delay, "jitter_ms": args.jitter,
+                    "loss_pct": args.loss, "namespaces": len(net.host_ns), "seed": args.seed},
+        "runs": runs,
+        "summary": summary,
+    }
+    print("SUMMARY|" + "|".join(f"{metric}={value}" for metric, value in summary.items()))
+
+    path = args.output or os.path.join(DEFAULT_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+    except OSError as e:
+        print(f"scan_bench: cannot write {path}: {e}", file=sys.stderr)
+        return 1
+    print(f"SAVED|{path}")
+
+    if baseline is not None:
+        if baseline.get("network") != result["network"]:
+            print("scan_bench: the compared file benchmarked another network, numbers may not match",
+                  file=sys.stderr)
+        for metric, old, new, change, verdict in compare(baseline, summary):
+            # Format: METRIC|NAME|BASE|NOW|CHANGE_PCT|VERDICT
+            print(f"METRIC|{metric}|{old}|{new}|{'' if change is None else change}|{verdict}")
+    return 0 if all(run["exit_code"] in (0, 1) for run in runs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
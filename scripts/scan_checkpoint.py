@@ -0,0 +1,290 @@
+"""scan_checkpoint.py — Resumable scan checkpoints
+
+A checkpoint records how far a scan of a set of ranges has got, so a scan
+that was stopped or crashed continues where it was instead of starting over:
+the ICMP sweep's cursor in each range (every address before it has been
+probed), the hosts whose enrichment is complete, the hosts found but still
+waiting for enrichment, and for sharded scans the address blocks that are
+done. Each set of ranges has one small JSON file under results/checkpoints/,
+rewritten atomically every few seconds while its scan runs and removed when
+the scan completes.
+
+Usage: python3 scripts/scan_checkpoint.py [--dir DIR] [--discard] [RANGE ...]
+       Prints one CHECKPOINT|RANGES|SAVED|HOSTS_DONE|QUEUED|SWEPT|BLOCKS_DONE line per checkpoint
+       (for the given ranges, or all of them); --discard deletes them instead.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import ipaddress
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from range_router import outermost_ranges, parse_ranges
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "results", "checkpoints")
+
+# Bumped when the file layout changes; older checkpoints are not resumed
+CHECKPOINT_VERSION = 1
+
+# Seconds between saves while a scan runs (only if something changed)
+SAVE_INTERVAL = 2.0
+
+LogCallback = Callable[[str, str], None]
+
+
+def _no_log(message: str, level: str = "info") -> None:
+    pass
+
+
+def checkpoint_path(ranges: Iterable[str], directory: str = DEFAULT_DIR) -> str:
+    """Checkpoint file of a scan of `ranges` (the same for any order or nesting of them)."""
+    key = ",".join(outermost_ranges(ranges))
+    return os.path.join(directory, hashlib.sha1(key.encode()).hexdigest()[:16] + ".json")
+
+
+def _intervals(values: Iterable[int]) -> List[List[int]]:
+    """[[first, last], ...] runs of consecutive numbers."""
+    runs: List[List[int]] = []
+    for value in sorted(values):
+        if runs and value == runs[-1][1] + 1:
+            runs[-1][1] = value
+        else:
+            runs.append([value, value])
+    return runs
+
+
+class ScanCheckpoint:
+    """Progress of one scan of `ranges`, saved to `path`.
+
+    `hosts` maps every host found so far to its record and `completed`
+    holds the IPs whose enrichment finished; the scan may put its live
+    records in `hosts`, they are copied on save. `cursors` maps each range
+    to the number of its addresses the ICMP sweep has finished, in order;
+    `blocks` holds the numbers of the done blocks of a sharded scan (with
+    `block_prefix`). `discovered` is set once every probe method finished,
+    and `seen_by` maps hosts to the probe methods that found them.
+    `ports` is the scan's port list: a scan of other ports does not resume
+    from it. Must be used from one thread.
+    """
+
+    def __init__(self, ranges: Iterable[str], ports: Optional[List[int]] = None, path: Optional[str] = None):
+        self.ranges = outermost_ranges(ranges)
+        self.path = path or checkpoint_path(self.ranges)
+        self.ports = ",".join(map(str, ports)) if ports else None
+        self.started = time.time()
+        self.saved: Optional[float] = None
+        self.discovered = False
+        self.seen_by: Dict[str, Set[str]] = {}
+        self.cursors: Dict[str, int] = {}
+        self.hosts: Dict[str, Dict[str, str]] = {}
+        self.completed: Set[str] = set()
+        self.block_prefix: Optional[int] = None
+        self.blocks: Set[int] = set()
+        self.dirty = False
+        self._inflight: Dict[str, Tuple[str, int]] = {}
+        self._done: Dict[str, Set[int]] = {}
+
+    # --- Progress ---
+
+    def targets(self, ranges: Iterable[str], whole: bool = False) -> Iterator[str]:
+        """Addresses of `ranges` as expand_targets() yields them, starting at each range's cursor.
+
+        Report each one to probed() once its probe is finished.
+        """
+        for spec in ranges:
+            network = ipaddress.ip_network(spec, strict=False)
+            first, count = 0, network.num_addresses
+            if not whole and count > 2:
+                first, count = 1, count - 2  # Skip the network and broadcast addresses
+            base = int(network.network_address) + first
+            address = type(network.network_address)
+            for offset in range(self.cursors.setdefault(spec, 0), count):
+                ip = str(address(base + offset))
+                self._inflight[ip] = (spec, offset)
+                yield ip
+
+    def probed(self, ip: str) -> None:
+        """Mark a target from targets() as probed; moves its range's cursor past every finished address."""
+        entry = self._inflight.pop(ip, None)
+        if entry is None:
+            return
+        spec, offset = entry
+        done = self._done.setdefault(spec, set())
+        done.add(offset)
+        cursor = self.cursors[spec]
+        while cursor in done:
+            done.remove(cursor)
+            cursor += 1
+        self.cursors[spec] = cursor
+        self.dirty = True
+
+    def block_done(self, index: int, records: List[Dict[str, str]]) -> None:
+        self.blocks.add(index)
+        for record in records:
+            self.hosts[record["ip"]] = record
+            self.completed.add(record["ip"])
+        self.dirty = True
+
+    @property
+    def swept(self) -> int:
+        """Addresses the ICMP sweep has finished, over all ranges."""
+        return sum(self.cursors.values())
+
+    def describe(self) -> str:
+        saved = datetime.fromtimestamp(self.saved or self.started).strftime("%Y-%m-%d %H:%M:%S")
+        progress = f"{len(self.blocks)} blocks done" if self.blocks else f"{self.swept} addresses swept"
+        queued = len(self.hosts) - len(self.completed)
+        return (f"saved {saved}: {len(self.completed)} hosts done, {queued} waiting for enrichment, "
+                f"{progress}{', discovery finished' if self.discovered else ''}")
+
+    # --- Persistence ---
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "version": CHECKPOINT_VERSION,
+            "ranges": self.ranges,
+            "ports": self.ports,
+            "started": self.started,
+            "saved": self.saved,
+            "discovered": self.discovered,
+            "seen_by": {ip: sorted(methods) for ip, methods in self.seen_by.items() if ip in self.hosts},
+            "cursors": self.cursors,
+            "block_prefix": self.block_prefix,
+            "blocks": _intervals(self.blocks),
+            "hosts": [dict(record) for ip, record in self.hosts.items() if ip in self.completed],
+            "queue": [dict(record) for ip, record in self.hosts.items() if ip not in self.completed],
+        }
+
+    def save(self) -> None:
+        """Write the checkpoint atomically (a crash mid-write leaves the previous one)."""
+        self.saved = time.time()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+        os.replace(temp, self.path)
+        self.dirty = False
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self, finished: bool, log: LogCallback = _no_log) -> None:
+        """Remove the checkpoint of a completed scan; save it one last time otherwise."""
+        try:
+            if finished:
+                self.remove()
+                return
+            self.save()
+            log(f"Checkpoint saved ({self.describe()}); resume to continue", "info")
+        except OSError as e:
+            log(f"Cannot save checkpoint {self.path}: {e}", "error")
+
+    async def autosave(self, log: LogCallback = _no_log, interval: float = SAVE_INTERVAL) -> None:
+        """Save every `interval` seconds while there is progress; runs until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            if self.dirty:
+                try:
+                    self.save()
+                except OSError as e:
+                    log(f"Cannot save checkpoint {self.path}: {e}", "error")
+
+    @classmethod
+    def load(cls, path: str) -> Optional["ScanCheckpoint"]:
+        """Read a checkpoint; None if there is none, ValueError if it cannot be used."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            raise ValueError(f"corrupt checkpoint {path}: {e}") from None
+        if not isinstance(data, dict) or data.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"checkpoint {path} has an unsupported format")
+        try:
+            checkpoint = cls(data["ranges"], path=path)
+            checkpoint.ports = data["ports"]
+            checkpoint.started = float(data["started"])
+            checkpoint.saved = data["saved"]
+            checkpoint.discovered = bool(data["discovered"])
+            # Absent from sharded checkpoints: their hosts are reported as found by an earlier run
+            checkpoint.seen_by = {str(ip): set(methods) for ip, methods in data.get("seen_by", {}).items()}
+            checkpoint.cursors = {str(spec): int(offset) for spec, offset in data["cursors"].items()}
+            checkpoint.block_prefix = data["block_prefix"]
+            checkpoint.blocks = {index for first, last in data["blocks"] for index in range(first, last + 1)}
+            for record in data["hosts"]:
+                checkpoint.hosts[record["ip"]] = record
+                checkpoint.completed.add(record["ip"])
+            for record in data["queue"]:
+                checkpoint.hosts[record["ip"]] = record
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"checkpoint {path} is incomplete: {e}") from None
+        return checkpoint
+
+
+def open_checkpoint(ranges: Iterable[str], ports: Optional[List[int]] = None, resume: bool = False,
+                    log: LogCallback = _no_log, directory: str = DEFAULT_DIR) -> ScanCheckpoint:
+    """Checkpoint for a scan of `ranges`: with `resume`, the saved one if it fits, else a fresh one."""
+    fresh = ScanCheckpoint(ranges, ports, checkpoint_path(ranges, directory))
+    if not resume:
+        return fresh
+    try:
+        saved = ScanCheckpoint.load(fresh.path)
+    except (OSError, ValueError) as e:
+        log(f"Cannot resume, starting over: {e}", "error")
+        return fresh
+    if saved is None:
+        log("No stopped scan of these ranges to resume, starting over", "info")
+        return fresh
+    if saved.ports != fresh.ports:
+        log(f"Stopped scan probed other ports ({saved.ports or 'none'}), starting over", "info")
+        return fresh
+    log(f"Resuming stopped scan ({saved.describe()})", "info")
+    return saved
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="List or discard checkpoints of stopped scans")
+    parser.add_argument("ranges", nargs="*", help="Ranges of the scan (default: every checkpoint)")
+    parser.add_argument("--dir", default=DEFAULT_DIR, help=f"Checkpoint directory (default: {DEFAULT_DIR})")
+    parser.add_argument("--discard", action="store_true", help="Delete the checkpoints instead of listing them")
+    args = parser.parse_args(argv)
+
+    try:
+        ranges = [cidr for spec in args.ranges for cidr in parse_ranges(spec)]
+    except ValueError as e:
+        parser.error(str(e))
+    paths = [checkpoint_path(ranges, args.dir)] if ranges else sorted(glob.glob(os.path.join(args.dir, "*.json")))
+
+    status = 0
+    for path in paths:
+        try:
+            checkpoint = ScanCheckpoint.load(path)
+        except (OSError, ValueError) as e:
+            print(f"scan_checkpoint: {e}", file=sys.stderr)
+            status = 1
+            continue
+        if checkpoint is None:
+            continue
+        if args.discard:
+            checkpoint.remove()
+            continue
+        saved = datetime.fromtimestamp(checkpoint.saved or checkpoint.started).strftime("%Y-%m-%d %H:%M:%S")
+        # Format: CHECKPOINT|RANGES|SAVED|HOSTS_DONE|QUEUED|SWEPT|BLOCKS_DONE
+        print(f"CHECKPOINT|{','.join(checkpoint.ranges)}|{saved}|{len(checkpoint.completed)}|"
+              f"{len(checkpoint.hosts) - len(checkpoint.completed)}|{checkpoint.swept}|{len(checkpoint.blocks)}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
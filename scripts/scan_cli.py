@@ -0,0 +1,290 @@
+"""scan_cli.py — Headless network scan with JSONL/CSV output
+
+Runs the same scan as the TUI without loading it, for cron jobs and
+pipelines: results stream to stdout (or --output) one host at a time as
+JSON lines or CSV, and log lines go to stderr. With --store, hosts that are
+new or gone since the previous scan are marked in a "change" column, and
+with --services the service on each open port fills a "services" column.
+With IPv6 ranges or --ipv6, IPv6 hosts on the scanned links are found
+through NDP: the "ipv6" column lists a host's IPv6 addresses, and devices
+without an IPv4 address get rows of their own under an IPv6 address.
+--format events writes the scan's versioned event stream instead (hosts as
+found, field updates, progress per range, phase changes and stats; see
+scan_events.py) for programs that follow a scan as it runs.
+Progress is checkpointed; after an interruption, --resume continues the scan
+of the same ranges (writing every host again, including those found before).
+With --metrics-file, probe counts, queue depths and phase timings are kept in
+a Prometheus text file (for node exporter's textfile collector).
+With --monitor, the ranges are watched after the scan until interrupted
+(see scan_monitor.py): a host that comes up is written again, enriched, with
+change "up", a host that goes down with change "down".
+
+Usage: python3 scripts/scan_cli.py [--format jsonl|csv|events] [--output FILE]
+                                   [--threads N] [--timeout MS] [--fixed-timeout]
+                                   [--ports LIST | --no-ports] [--syn] [--syn-rate PPS]
+                                   [--services] [--arp-rate PPS] [--ipv6] [--workers N]
+                                   [--store [FILE]] [--incremental]
+                                   [--resume | --no-checkpoint] [--metrics-file FILE]
+                                   [--monitor [--monitor-interval S] [--monitor-budget N]]
+                                   [--exit-on-change] [--quiet | --debug] [--log-file FILE]
+                                   RANGE [RANGE ...]
+
+Exit status:
+  0    scan finished and found live hosts
+  1    scan finished and found no live hosts
+  2    invalid arguments
+  3    scan failed (or probes failed and nothing was found)
+  4    --exit-on-change: hosts appeared or disappeared since the previous stored scan
+  130  interrupted by SIGINT/SIGTERM (hosts found so far were written; --resume continues)
+  With --monitor, interrupting ends monitoring and the status is that of the scan.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import signal
+import sys
+from typing import Callable, Dict, List, Optional, TextIO
+
+from arp_sweep import DEFAULT_RATE as DEFAULT_ARP_RATE
+from port_scanner import parse_ports
+from scan_engine import ScanConfig, ScanEngine
+from scan_events import ScanEvent, encode
+from scan_log import ScanLogger
+from scan_metrics import textfile_path
+from scan_monitor import DEFAULT_BUDGET as DEFAULT_MONITOR_BUDGET, DEFAULT_INTERVAL as DEFAULT_MONITOR_INTERVAL, DOWN
+from scan_store import DEFAULT_STORE
+from service_detect import parse_services
+from syn_scan import DEFAULT_RATE as DEFAULT_SYN_RATE
+
+EXIT_OK = 0
+EXIT_NO_HOSTS = 1
+EXIT_USAGE = 2
+EXIT_FAILED = 3
+EXIT_CHANGED = 4
+EXIT_INTERRUPTED = 130
+
+CSV_COLUMNS = ("ip", "ipv6", "hostname", "mac", "vendor", "ports", "services", "rtt_ms", "change")
+
+
+def _rtt_ms(ping: str) -> Optional[float]:
+    try:
+        return float(ping[:-2]) if ping.endswith("ms") else None
+    except ValueError:
+        return None
+
+
+def _known(value: Optional[str]) -> Optional[str]:
+    return None if value in (None, "", "-") else value
+
+
+def host_row(host: Dict[str, str], change: Optional[str] = None,
+             ports_scanned: bool = True, services_detected: bool = False) -> Dict[str, object]:
+    """Output record of a host: unknown fields are None, open ports a list of ints, RTT in ms.
+
+    Services map each open port (as a string, like JSON object keys) to its fingerprint;
+    IPv6 addresses are a list (empty if none were found).
+    """
+    ports = _known(host.get("ports"))
+    ipv6 = _known(host.get("ipv6"))
+    return {
+        "ip": host["ip"],
+        "ipv6": ipv6.split(",") if ipv6 else [],
+        "hostname": _known(host.get("hostname")),
+        "mac": _known(host.get("mac")),
+        "vendor": _known(host.get("vendor")),
+        "ports": ([int(p) for p in ports.split(",") if p.isdigit()] if ports else []) if ports_scanned else None,
+        "services": {str(port): fingerprint for port, fingerprint in
+                     parse_services(host.get("services", "-")).items()} if services_detected else None,
+        "rtt_ms": _rtt_ms(host.get("ping", "-")),
+        "change": change,
+    }
+
+
+class JsonLinesWriter:
+    def __init__(self, out: TextIO):
+        self.out = out
+
+    def write(self, row: Dict[str, object]) -> None:
+        self.out.write(json.dumps(row, separators=(",", ":")) + "\n")
+        self.out.flush()
+
+
+class CsvWriter:
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.writer = csv.DictWriter(out, fieldnames=CSV_COLUMNS, lineterminator="\n")
+        self.writer.writeheader()
+        out.flush()
+
+    def write(self, row: Dict[str, object]) -> None:
+        row = dict(row)
+        row["ipv6"] = ",".join(row["ipv6"])
+        if row["ports"] is not None:
+            row["ports"] = ",".join(map(str, row["ports"]))
+        if row["services"] is not None:
+            row["services"] = ", ".join(f"{port}/{fingerprint}" for port, fingerprint in row["services"].items())
+        self.writer.writerow({k: "" if v is None else v for k, v in row.items()})
+        self.out.flush()
+
+
+class EventWriter:
+    """Writes protocol events as they come, in place of host rows."""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+
+    def write(self, event: ScanEvent) -> None:
+        self.out.write(encode(event))
+        self.out.flush()
+
+
+WRITERS = {"jsonl": JsonLinesWriter, "csv": CsvWriter}
+EVENTS_FORMAT = "events"
+
+
+async def _run(engine: ScanEngine, scanned: Callable[[], None]) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, engine.stop)
+    await engine.run()
+    scanned()
+    if engine.config.monitor:
+        await engine.monitor()
+
+
+def _scan(args: argparse.Namespace, config: ScanConfig, log: ScanLogger) -> int:
+    """Run the scan main() configured, writing its output; returns the exit status."""
+    try:
+        out = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    except OSError as e:
+        log(f"Cannot write {args.output}: {e}", "error")
+        return EXIT_FAILED
+    events = args.format == EVENTS_FORMAT
+    writer = EventWriter(out) if events else WRITERS[args.format](out)
+    engine: Optional[ScanEngine] = None
+
+    def report(host: Dict[str, str]) -> None:
+        change = None
+        if engine.monitoring:
+            change = "up"
+        elif engine.previous is not None:
+            change = "seen" if host["ip"] in engine.previous else "new"
+        writer.write(host_row(host, change, config.ports is not None, config.services))
+
+    def state_changed(ip: str, state: str) -> None:
+        if state == DOWN:
+            writer.write(host_row(engine.hosts[ip], DOWN, config.ports is not None, config.services))
+
+    def scanned() -> None:
+        if engine.previous is not None and not events:
+            for record in engine.gone.values():
+                writer.write(host_row(dict(record, ping="-"), "gone", config.ports is not None, config.services))
+
+    if events:
+        engine = ScanEngine(config, log=log, on_scan_event=writer.write)
+    else:
+        engine = ScanEngine(config, on_host=report, log=log, on_state=state_changed)
+    log(f"Scanning {', '.join(config.ranges)} ({config.describe()})", "info")
+    try:
+        asyncio.run(_run(engine, scanned))
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        log(f"Interrupted after {engine.duration:.1f}s", "error")
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        log(f"Scan failed: {e}", "error")
+        return EXIT_FAILED
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    hosts = engine.hosts
+    changed = engine.previous is not None and bool(engine.new or engine.gone)
+    if engine.previous is not None:
+        log(f"Since the last scan: {len(engine.new)} new, {len(engine.gone)} gone", "info")
+    log(f"Scan finished in {engine.duration:.1f}s: {len(hosts)} live hosts", "info")
+
+    if not hosts:
+        return EXIT_FAILED if engine.errors else EXIT_NO_HOSTS
+    if args.exit_on_change and changed:
+        return EXIT_CHANGED
+    return EXIT_OK
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Headless network scan with JSONL/CSV output")
+    parser.add_argument("ranges", nargs="+", help="CIDR ranges to scan (a range may list several, comma-separated)")
+    parser.add_argument("--format", choices=sorted(WRITERS) + [EVENTS_FORMAT], default="jsonl",
+                        help="Output format: host rows as jsonl or csv, or the scan's event stream (default: jsonl)")
+    parser.add_argument("--output", "-o", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--threads", type=int, default=50, help="Hosts enriched in parallel (default: 50)")
+    parser.add_argument("--timeout", type=int, default=1000, help="Probe timeout in ms (default: 1000)")
+    parser.add_argument("--fixed-timeout", action="store_true",
+                        help="Always wait the full timeout instead of adapting it to measured RTTs")
+    parser.add_argument("--ports", default="top", help="Port list, e.g. 22,80,8000-8100 (default: top 10)")
+    parser.add_argument("--no-ports", action="store_true", help="Skip port scanning")
+    parser.add_argument("--syn", action="store_true", help="Scan ports half-open from a raw socket (needs root)")
+    parser.add_argument("--syn-rate", type=int, default=DEFAULT_SYN_RATE,
+                        help=f"SYNs per second with --syn (default: {DEFAULT_SYN_RATE})")
+    parser.add_argument("--services", action="store_true", help="Identify the service on each open port")
+    parser.add_argument("--arp-rate", type=int, default=DEFAULT_ARP_RATE,
+                        help=f"ARP frames per second per interface (default: {DEFAULT_ARP_RATE})")
+    parser.add_argument("--ipv6", action="store_true",
+                        help="Also discover IPv6 hosts on the scanned links (implied by IPv6 ranges)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Scan processes (default: one per core for ranges of 16384+ addresses)")
+    parser.add_argument("--store", nargs="?", const=DEFAULT_STORE, metavar="FILE",
+                        help=f"Save results to a SQLite store and mark changes (default file: {DEFAULT_STORE})."
+                             " A range right after a bare --store is taken as FILE: name FILE or put the ranges first.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse fresh stored hostname/vendor/ports/services for unchanged hosts (implies --store)")
+    checkpoints = parser.add_mutually_exclusive_group()
+    checkpoints.add_argument("--resume", action="store_true",
+                             help="Continue a stopped or crashed scan of these ranges")
+    checkpoints.add_argument("--no-checkpoint", action="store_true", help="Do not save progress while scanning")
+    parser.add_argument("--metrics-file", metavar="FILE", default=textfile_path(),
+                        help="Write scan metrics to this Prometheus text file while scanning "
+                             "(default: $IP_SCANNER_METRICS or the node_exporter textfile collector)")
+    parser.add_argument("--monitor", action="store_true",
+                        help="After the scan, keep watching the ranges for hosts coming up or going down")
+    parser.add_argument("--monitor-interval", type=float, default=DEFAULT_MONITOR_INTERVAL,
+                        help=f"Seconds between checks of an up host with --monitor "
+                             f"(default: {DEFAULT_MONITOR_INTERVAL:g})")
+    parser.add_argument("--monitor-budget", type=int, default=DEFAULT_MONITOR_BUDGET,
+                        help=f"Echo requests per second at most with --monitor (default: {DEFAULT_MONITOR_BUDGET})")
+    parser.add_argument("--exit-on-change", action="store_true",
+                        help=f"Exit with {EXIT_CHANGED} if hosts are new or gone since the last stored scan")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("--quiet", "-q", action="store_true", help="Only log errors")
+    verbosity.add_argument("--debug", action="store_true", help="Verbose logging")
+    parser.add_argument("--log-file", metavar="FILE",
+                        help="Also append log lines to FILE (written in batches by a background thread)")
+    args = parser.parse_args(argv)
+
+    try:
+        ports = None if args.no_ports else parse_ports(args.ports)
+        config = ScanConfig(args.ranges, threads=args.threads, timeout=args.timeout, ports=ports,
+                            arp_rate=args.arp_rate, store=args.store, incremental=args.incremental,
+                            adaptive=not args.fixed_timeout, workers=args.workers,
+                            checkpoint=not args.no_checkpoint, resume=args.resume,
+                            metrics_file=args.metrics_file, services=args.services, syn=args.syn,
+                            syn_rate=args.syn_rate, monitor=args.monitor,
+                            monitor_interval=args.monitor_interval, monitor_budget=args.monitor_budget,
+                            ipv6=args.ipv6)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.exit_on_change and config.store is None:
+        parser.error("--exit-on-change needs --store")
+
+    try:
+        log = ScanLogger(debug=args.debug, quiet=args.quiet, stream=sys.stderr, path=args.log_file)
+    except OSError as e:
+        parser.error(f"cannot write log file: {e}")
+    try:
+        return _scan(args, config, log)
+    finally:
+        log.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
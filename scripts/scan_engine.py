@@ -0,0 +1,380 @@
+"""scan_engine.py — Scan orchestration shared by the TUI and headless runs
+
+A ScanEngine runs one scan end to end: it opens the result store, streams
+discovery and enrichment for the configured ranges, then records which hosts
+are new or gone since the previous scan. Progress is checkpointed as the
+scan goes, so a stopped or crashed scan can be resumed, and probe counts,
+queue depths and phase timings are collected as it runs (scan_metrics.py).
+Hosts, field updates, progress per range, phase changes and stats are
+published as protocol events (scan_events.py). After the scan, monitor()
+keeps watching the ranges (scan_monitor.py), reporting hosts that come up or
+go down as host-state events. Pause, resume and stop can be called from any
+thread while it runs. Nothing here imports textual or rich, so headless runs
+(scan_cli.py) start as fast as the probes themselves.
+"""
+import asyncio
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from arp_sweep import DEFAULT_RATE as DEFAULT_ARP_RATE
+from discovery import NEW, EventCallback, LogCallback, ScanControl, count_addresses, open_syn_scanner, stream_scan
+from dns_resolver import ReverseResolver
+from enrichment import HostEnricher
+from icmp_sweep import IcmpSweeper
+from range_router import outermost_ranges, parse_ranges, split_families
+from scan_checkpoint import checkpoint_path, open_checkpoint
+from scan_events import (FINISHED, STARTED, STOPPED, EventSink, ScanEvent, ScanProgress, field_update_event,
+                         host_discovered_event, host_state_event, phase_event, progress_event, stats_event)
+from scan_metrics import ScanMetrics
+from scan_monitor import DEFAULT_BUDGET, DEFAULT_INTERVAL, HostMonitor, StateCallback
+from scan_store import DEFAULT_STORE, ScanStore
+from service_detect import ServiceDetector
+from shard_scan import auto_workers, sharded_scan
+from syn_scan import DEFAULT_RATE as DEFAULT_SYN_RATE
+
+HostCallback = Callable[[Dict[str, str]], None]
+
+# Seconds between progress events, and between stats events
+PROGRESS_INTERVAL = 0.5
+STATS_INTERVAL = 1.0
+
+
+def _no_log(message: str, level: str = "info") -> None:
+    pass
+
+
+class ScanConfig:
+    """Options of one scan, validated on construction (raises ValueError).
+
+    Each entry of `ranges` may hold several comma-separated CIDRs. `timeout`
+    is in milliseconds (the upper bound of adaptive timeouts, or the fixed
+    wait without `adaptive`), `ports=None` skips port scanning. `store` is
+    the result store file (None to keep nothing); `incremental` implies the
+    default store when none is given. `workers` is the number of scan
+    processes; 0 picks one per core for large ranges and one otherwise.
+    With `checkpoint`, progress is saved under results/checkpoints/ while
+    the scan runs; `resume` continues from the checkpoint a stopped scan of
+    the same ranges left (or starts over if there is none). `metrics_file`
+    is a Prometheus text file kept up to date with the scan's metrics. With
+    `services`, the service on each open port is identified (needs `ports`).
+    With `syn`, ports are scanned half-open at `syn_rate` SYNs per second
+    (per worker process). With `monitor`, the ranges are watched after the
+    scan: up hosts are checked every `monitor_interval` seconds, with at
+    most `monitor_budget` echo requests per second (see scan_monitor.py).
+    With `ipv6` (implied by IPv6 ranges), IPv6 hosts on the scanned links are
+    discovered through NDP (ndp_sweep.py), in unsharded scans only.
+    """
+
+    def __init__(self, ranges: Iterable[str], threads: int = 50, timeout: int = 1000,
+                 ports: Optional[List[int]] = None, arp_rate: int = DEFAULT_ARP_RATE,
+                 store: Optional[str] = None, incremental: bool = False, adaptive: bool = True,
+                 workers: int = 0, checkpoint: bool = True, resume: bool = False,
+                 metrics_file: Optional[str] = None, services: bool = False, syn: bool = False,
+                 syn_rate: int = DEFAULT_SYN_RATE, monitor: bool = False,
+                 monitor_interval: float = DEFAULT_INTERVAL, monitor_budget: int = DEFAULT_BUDGET,
+                 ipv6: bool = False):
+        self.ranges: List[str] = []
+        for spec in ranges:
+            for cidr in parse_ranges(spec):
+                if cidr not in self.ranges:
+                    self.ranges.append(cidr)
+        if not self.ranges:
+            raise ValueError("no IP ranges specified")
+        if threads < 1:
+            raise ValueError(f"threads must be at least 1, got {threads}")
+        if timeout < 1:
+            raise ValueError(f"timeout must be at least 1ms, got {timeout}")
+        if arp_rate < 1:
+            raise ValueError(f"ARP rate must be at least 1 pps, got {arp_rate}")
+        if workers < 0:
+            raise ValueError(f"workers must be 0 (auto) or more, got {workers}")
+        if syn_rate < 1:
+            raise ValueError(f"SYN rate must be at least 1 pps, got {syn_rate}")
+        if monitor_interval < 1:
+            raise ValueError(f"monitor interval must be at least 1s, got {monitor_interval:g}")
+        if monitor_budget < 1:
+            raise ValueError(f"monitor budget must be at least 1 probe/s, got {monitor_budget}")
+        self.threads = threads
+        self.timeout = timeout
+        self.ports = list(ports) if ports else None
+        self.services = services and self.ports is not None
+        self.syn = syn and self.ports is not None
+        self.syn_rate = syn_rate
+        self.arp_rate = arp_rate
+        self.incremental = incremental
+        self.adaptive = adaptive
+        self.store = store or (DEFAULT_STORE if incremental else None)
+        self.workers = workers or auto_workers(self.ranges)
+        self.checkpoint = checkpoint or resume
+        self.resume = resume
+        self.metrics_file = metrics_file
+        self.monitor = monitor
+        self.monitor_interval = monitor_interval
+        self.monitor_budget = monitor_budget
+        self.ipv6 = ipv6 or bool(split_families(self.ranges)[1])
+
+    def describe(self) -> str:
+        ports = f"{len(self.ports)} ports{' (SYN)' if self.syn else ''}" if self.ports else "no port scan"
+        timeout = f"{self.timeout}ms {'max ' if self.adaptive else ''}timeout"
+        shards = f", {self.workers} worker processes" if self.workers > 1 else ""
+        services = ", service detection" if self.services else ""
+        ipv6 = ", IPv6 discovery" if self.ipv6 and self.workers == 1 else ""
+        monitor = f", then monitoring every {self.monitor_interval:g}s ({self.monitor_budget} probes/s max)" \
+            if self.monitor else ""
+        return (f"{self.threads} threads, {timeout}, {ports}{services}{ipv6}{shards}"
+                f"{', incremental' if self.incremental else ''}{', resumed' if self.resume else ''}{monitor}")
+
+    def can_resume(self) -> bool:
+        """Whether a stopped scan of these ranges left a checkpoint."""
+        return os.path.exists(checkpoint_path(self.ranges))
+
+
+class ScanEngine:
+    """Runs the scan described by a ScanConfig.
+
+    `await engine.run()` returns the host records by IP; `on_event`,
+    `on_host` and `log` are called on the scan's event loop as in
+    stream_scan(). Pass a `resolver` kept between scans to reuse its DNS
+    cache. Once the store is open, `previous` holds the hosts that were up
+    after the last stored scan of these ranges (None if there was none);
+    after run(), `new` lists hosts not in it and `gone` maps each host that
+    no longer answers to its stored record. `errors` collects error-level
+    log messages (e.g. probes that lacked permissions). `metrics` collects
+    the scan's probe counts, queue depths and timings; its snapshot() may be
+    read from any thread. `on_scan_event` receives the scan as protocol
+    events (scan_events.py): host-discovered and field-update as they
+    happen, progress of the ranges that moved and stats at a fixed interval,
+    and phase-change when a phase (or the whole "scan") starts and ends;
+    `progress` holds the addresses done per range. With more than one worker
+    the ranges are scanned by sharded_scan() and `resolver` is unused (each
+    worker process resolves on its own). `await engine.monitor()` then
+    watches the ranges until stop(), keeping `hosts` current; on_state(ip,
+    state) and host-state events report hosts that come up or go down.
+    """
+
+    def __init__(self, config: ScanConfig, on_event: Optional[EventCallback] = None,
+                 on_host: Optional[HostCallback] = None, log: LogCallback = _no_log,
+                 resolver: Optional[ReverseResolver] = None, on_scan_event: Optional[EventSink] = None,
+                 on_state: Optional[StateCallback] = None):
+        self.config = config
+        self.on_event = on_event
+        self.on_scan_event = on_scan_event
+        self.on_host = on_host
+        self.on_state = on_state
+        self._log = log
+        self.resolver = resolver
+        self.control: Optional[ScanControl] = None
+        self.metrics = ScanMetrics()
+        self.progress: Optional[ScanProgress] = None
+        self.hosts: Dict[str, Dict[str, str]] = {}
+        self.previous: Optional[Set[str]] = None
+        self.new: List[str] = []
+        self.gone: Dict[str, Dict[str, str]] = {}
+        self.errors: List[str] = []
+        self.duration = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Future] = None
+        self._stopped = False  # stop() was called (monitor() then ends normally, or does not start)
+        self.monitoring = False
+
+    def log(self, message: str, level: str = "info") -> None:
+        if level == "error":
+            self.errors.append(message)
+        self._log(message, level)
+
+    def _publish(self, event: ScanEvent) -> None:
+        if self.on_scan_event is not None:
+            self.on_scan_event(event)
+
+    def _host_event(self, kind: str, ip: str, fields: Dict[str, str]) -> None:
+        if self.on_event:
+            self.on_event(kind, ip, fields)
+        self._publish(host_discovered_event(ip, fields) if kind == NEW else field_update_event(ip, fields))
+
+    def _state_change(self, ip: str, state: str) -> None:
+        if self.on_state:
+            self.on_state(ip, state)
+        self._publish(host_state_event(ip, state))
+
+    def _phase_event(self, phase: str, started: bool) -> None:
+        self._publish(phase_event(phase, STARTED if started else FINISHED))
+
+    def _publish_progress(self) -> None:
+        for spec, done, total in self.progress.changed():
+            self._publish(progress_event(spec, done, total))
+
+    async def _report(self) -> None:
+        """Publish progress every PROGRESS_INTERVAL and stats every STATS_INTERVAL; runs until cancelled."""
+        last_stats = 0.0
+        while True:
+            self._publish_progress()
+            now = time.monotonic()
+            if now - last_stats >= STATS_INTERVAL:
+                self._publish(stats_event(self.metrics.snapshot()))
+                last_stats = now
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _open_store(self) -> Optional[ScanStore]:
+        if self.config.store is None:
+            return None
+        store = None
+        try:
+            store = ScanStore(self.config.store)
+            self.previous = store.begin_scan(self.config.ranges) or None
+            return store
+        except (sqlite3.Error, OSError) as e:
+            self.log(f"Result store unavailable, scanning without it: {e}", "error")
+            if store is not None:
+                store.close()
+            return None
+
+    def _record_changes(self, store: ScanStore) -> None:
+        self.new, gone = store.finish_scan(self.hosts)
+        if gone:
+            stored = store.hosts(self.config.ranges)
+            self.gone = {ip: stored.get(ip, {"ip": ip}) for ip in gone}
+
+    async def run(self) -> Dict[str, Dict[str, str]]:
+        """Scan once; raises CancelledError if stopped."""
+        config = self.config
+        self._loop = asyncio.get_running_loop()
+        self.control = ScanControl()
+        self._stopped = False
+        store = self._open_store()
+        checkpoint = open_checkpoint(config.ranges, config.ports, config.resume, self.log) if config.checkpoint else None
+        ranges = outermost_ranges(config.ranges)
+        self.progress = ScanProgress({spec: count_addresses([spec]) for spec in ranges})
+        publishing = self.on_scan_event is not None
+        on_event = self._host_event if publishing else self.on_event
+        self.metrics.on_phase = self._phase_event if publishing else None
+        if config.workers > 1:
+            scan = sharded_scan(
+                config.ranges, workers=config.workers, threads=config.threads,
+                timeout=config.timeout / 1000.0, ports=config.ports, on_event=on_event,
+                on_host=self.on_host, control=self.control, log=self.log,
+                arp_rate=config.arp_rate, store=store, incremental=config.incremental,
+                adaptive=config.adaptive, checkpoint=checkpoint, metrics=self.metrics,
+                progress=self.progress, services=config.services, syn=config.syn, syn_rate=config.syn_rate,
+            )
+        else:
+            scan = stream_scan(
+                config.ranges, threads=config.threads, timeout=config.timeout / 1000.0,
+                ports=config.ports, on_event=on_event, on_host=self.on_host,
+                control=self.control, log=self.log, resolver=self.resolver,
+                arp_rate=config.arp_rate, store=store, incremental=config.incremental,
+                adaptive=config.adaptive, checkpoint=checkpoint, metrics=self.metrics,
+                progress=self.progress, services=config.services, syn=config.syn, syn_rate=config.syn_rate,
+                ipv6=config.ipv6,
+            )
+        addresses = count_addresses(ranges)
+        self._task = asyncio.ensure_future(self.metrics.track_scan(scan, addresses, config.metrics_file, self.log))
+        reporter = asyncio.ensure_future(self._report()) if publishing else None
+        self._publish(phase_event("scan", STARTED))
+        start = time.monotonic()
+        finished = False
+        try:
+            self.hosts = await self._task
+            finished = True
+            if store is not None:
+                self._record_changes(store)
+        finally:
+            self.duration = time.monotonic() - start
+            if not self._task.done():
+                self._task.cancel()
+            if reporter is not None:
+                reporter.cancel()
+                self._publish_progress()
+                self._publish(stats_event(self.metrics.snapshot()))
+                self._publish(phase_event("scan", FINISHED if finished else STOPPED))
+            if store is not None:
+                store.close()
+            self._loop = None
+        return self.hosts
+
+    async def monitor(self) -> None:
+        """Watch the ranges of the scan run() just finished until stop(), which ends it normally."""
+        config = self.config
+        self._loop = asyncio.get_running_loop()
+        if self._stopped:
+            self._loop = None
+            return  # Stopped between the scan and monitoring
+        timeout = config.timeout / 1000.0
+        # One echo request per check: a miss is confirmed by the next check instead of a retry
+        sweeper = IcmpSweeper(concurrency=config.monitor_budget, timeout=timeout, retries=0)
+        detector = ServiceDetector() if config.services else None
+        syn_scanner = open_syn_scanner(config.syn_rate, timeout, None, self.log) if config.syn else None
+        enricher = HostEnricher(workers=config.threads, timeout=timeout, ports=config.ports, pinger=sweeper,
+                                resolver=self.resolver, services=detector, port_scanner=syn_scanner)
+        publishing = self.on_scan_event is not None
+        monitor = HostMonitor(config.ranges, sweeper, enricher, self.hosts, interval=config.monitor_interval,
+                              budget=config.monitor_budget, on_state=self._state_change,
+                              on_event=self._host_event if publishing else self.on_event,
+                              on_host=self.on_host, log=self.log)
+        for engine in (sweeper, enricher, enricher.port_scanner, detector, monitor):
+            if engine is not None:
+                engine.control = self.control
+                engine.metrics = self.metrics
+        self._task = asyncio.ensure_future(monitor.run())
+        reporter = asyncio.ensure_future(self._report()) if publishing else None
+        writer = asyncio.ensure_future(self.metrics.write_periodically(config.metrics_file, self.log)) \
+            if config.metrics_file else None
+        self.monitoring = True
+        self._publish(phase_event("monitor", STARTED))
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            if not self._stopped:
+                raise
+        finally:
+            self.monitoring = False
+            if not self._task.done():
+                self._task.cancel()
+            for task in (reporter, writer):
+                if task is not None:
+                    task.cancel()
+            if reporter is not None:
+                self._publish(stats_event(self.metrics.snapshot()))
+                self._publish(phase_event("monitor", STOPPED))
+            enricher.close()
+            sweeper.close()
+            if syn_scanner is not None:
+                syn_scanner.close()
+            self._loop = None
+
+    # --- Control (thread-safe) ---
+
+    def _call(self, callback: Callable[[], None]) -> bool:
+        """Run `callback` on the scan loop; False if no scan is running."""
+        loop = self._loop
+        if loop is None:
+            return False
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            return False  # Scan loop already closed
+        return True
+
+    def pause(self) -> bool:
+        """Hold back new probes; in-flight ones finish."""
+        return self._call(lambda: self.control.pause())
+
+    def resume(self) -> bool:
+        return self._call(lambda: self.control.resume())
+
+    def _stop(self) -> None:
+        self._stopped = True
+        self._task.cancel()
+
+    def stop(self) -> bool:
+        """Cancel the scan, saving its checkpoint; probe and worker processes are killed with it.
+        Monitoring just ends, and a stop between run() and monitor() keeps it from starting."""
+        if self._call(self._stop):
+            return True
+        self._stopped = True  # No loop: seen by monitor() if it is about to start
+        return self._call(self._stop)  # Unless it set its loop just now
@@ -0,0 +1,235 @@
+"""scan_events.py — Versioned JSON-lines event protocol between a scan and its consumers
+
+Everything a running scan reports is one event: a JSON object on its own
+line with the protocol version "v", its "type" and the time it was made.
+Values are JSON strings, so a vendor name containing "|" or a comma is
+carried as is. Event types:
+
+  host-discovered  {"ip", "fields"}          first sighting of a host, with what is known so far
+  field-update     {"ip", "fields"}          only the fields of a host that changed
+  progress         {"range", "done", "total"} addresses probed in one scanned range
+  phase-change     {"phase", "state"}        a scan phase started, finished or was stopped
+  stats            {"stats"}                 probe, host and queue counters (scan_metrics.py)
+  host-state       {"ip", "state"}           while monitoring, a host came "up" or went "down"
+
+Host fields are hostname, mac, vendor, ports, services, ping and ipv6 (the
+device's IPv6 addresses, comma-separated); "-" means not known (yet).
+Consumers ignore keys they do not know; new event types or changes to
+existing ones bump PROTOCOL_VERSION, and decode() rejects events of any
+other version. ScanEngine (scan_engine.py) publishes these events in-process
+to the TUI; `scan_cli.py --format events` writes them to stdout.
+
+Usage: python3 scripts/scan_cli.py --format events RANGE | python3 scripts/scan_events.py [FILE]
+       Checks an event stream and prints one EVENT|TYPE|... line per event (bad lines go to stderr).
+"""
+import argparse
+import ipaddress
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from range_router import RangeRouter
+from scan_metrics import MetricsSnapshot
+
+PROTOCOL_VERSION = 2
+
+# Event types
+HOST_DISCOVERED = "host-discovered"
+FIELD_UPDATE = "field-update"
+PROGRESS = "progress"
+PHASE_CHANGE = "phase-change"
+STATS = "stats"
+HOST_STATE = "host-state"
+
+# type -> keys every event of that type carries
+EVENT_FIELDS = {
+    HOST_DISCOVERED: ("ip", "fields"),
+    FIELD_UPDATE: ("ip", "fields"),
+    PROGRESS: ("range", "done", "total"),
+    PHASE_CHANGE: ("phase", "state"),
+    STATS: ("stats",),
+    HOST_STATE: ("ip", "state"),
+}
+
+# Phase states
+STARTED = "started"
+FINISHED = "finished"
+STOPPED = "stopped"
+
+ScanEvent = Dict[str, Any]
+EventSink = Callable[[ScanEvent], None]
+
+
+def _event(kind: str, **payload: Any) -> ScanEvent:
+    event: ScanEvent = {"v": PROTOCOL_VERSION, "type": kind, "time": round(time.time(), 3)}
+    event.update(payload)
+    return event
+
+
+def host_discovered_event(ip: str, fields: Dict[str, str]) -> ScanEvent:
+    return _event(HOST_DISCOVERED, ip=ip, fields={k: v for k, v in fields.items() if k != "ip"})
+
+
+def field_update_event(ip: str, fields: Dict[str, str]) -> ScanEvent:
+    return _event(FIELD_UPDATE, ip=ip, fields={k: v for k, v in fields.items() if k != "ip"})
+
+
+def progress_event(spec: str, done: int, total: int) -> ScanEvent:
+    return _event(PROGRESS, range=spec, done=done, total=total)
+
+
+def phase_event(phase: str, state: str) -> ScanEvent:
+    return _event(PHASE_CHANGE, phase=phase, state=state)
+
+
+def host_state_event(ip: str, state: str) -> ScanEvent:
+    return _event(HOST_STATE, ip=ip, state=state)
+
+
+def stats_event(snapshot: MetricsSnapshot) -> ScanEvent:
+    """Stats event with the counters of a metrics snapshot that a progress display needs."""
+    def by_probe(name: str) -> Dict[str, int]:
+        return {probe: int(snapshot.value(name, probe=probe))
+                for probe in snapshot.label_values(name, "probe")}
+
+    return _event(STATS, stats={
+        "probes_sent": by_probe("ipscan_probes_sent_total"),
+        "probe_replies": by_probe("ipscan_probe_replies_total"),
+        "probes_in_flight": by_probe("ipscan_probes_in_flight"),
+        "queue_depth": {queue: int(snapshot.value("ipscan_queue_depth", queue=queue))
+                        for queue in snapshot.label_values("ipscan_queue_depth", "queue")},
+        "hosts_found": int(snapshot.value("ipscan_hosts_found_total")),
+        "hosts_enriched": int(snapshot.value("ipscan_hosts_enriched_total")),
+        "duration": round(snapshot.value("ipscan_scan_duration_seconds"), 3),
+    })
+
+
+def encode(event: ScanEvent) -> str:
+    """One event as a JSON line (newline included)."""
+    return json.dumps(event, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+def decode(line: str) -> ScanEvent:
+    """Parse and check one event line; raises ValueError if it is not a valid event of this version."""
+    try:
+        event = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"not JSON: {e}") from None
+    if not isinstance(event, dict) or "v" not in event or "type" not in event:
+        raise ValueError("not a scan event (no version or type)")
+    if event["v"] != PROTOCOL_VERSION:
+        raise ValueError(f"unsupported event protocol version {event['v']!r} (expected {PROTOCOL_VERSION})")
+    required = EVENT_FIELDS.get(event["type"])
+    if required is None:
+        raise ValueError(f"unknown event type {event['type']!r}")
+    missing = [key for key in required if key not in event]
+    if missing:
+        raise ValueError(f"{event['type']} event without {', '.join(missing)}")
+    return event
+
+
+def read_events(lines: Iterable[str],
+                on_error: Optional[Callable[[int, str, ValueError], None]] = None) -> Iterator[ScanEvent]:
+    """Decode an event stream, skipping blank lines; bad lines go to on_error(line_number, line, error)."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield decode(line)
+        except ValueError as e:
+            if on_error is not None:
+                on_error(number, line, e)
+
+
+class ScanProgress:
+    """Addresses probed so far in each scanned range, out of its total.
+
+    `totals` maps each (outermost) range to its number of addresses. The scan
+    reports single addresses with probed(), the CIDRs of a shard block with
+    block_done() and the end of discovery with finish(). changed() returns
+    the ranges that moved since it was last called. Used from the scan's
+    event loop only.
+    """
+
+    def __init__(self, totals: Dict[str, int]):
+        self.totals = dict(totals)
+        self.done: Dict[str, int] = {spec: 0 for spec in self.totals}
+        self._router = RangeRouter(self.totals)
+        self._changed = set(self.totals)  # Every range is reported once, even at 0
+
+    def advance(self, spec: str, count: int = 1) -> None:
+        if spec not in self.done:
+            return
+        self.done[spec] = min(self.totals[spec], self.done[spec] + count)
+        self._changed.add(spec)
+
+    def probed(self, ip: str) -> None:
+        spec = self._router.range_for(ip)
+        if spec is not None:
+            self.advance(spec)
+
+    def block_done(self, cidrs: Iterable[str]) -> None:
+        for cidr in cidrs:
+            network = ipaddress.ip_network(cidr, strict=False)
+            spec = self._router.range_for(str(network.network_address))
+            if spec is not None:
+                self.advance(spec, network.num_addresses)
+
+    def finish(self) -> None:
+        """Discovery is over: every address counts as probed."""
+        for spec, total in self.totals.items():
+            self.advance(spec, total)
+
+    def changed(self) -> List[Tuple[str, int, int]]:
+        """(range, done, total) of every range that moved since the last call."""
+        moved = [(spec, self.done[spec], self.totals[spec]) for spec in self.totals if spec in self._changed]
+        self._changed.clear()
+        return moved
+
+    @property
+    def fraction(self) -> float:
+        total = sum(self.totals.values())
+        return sum(self.done.values()) / total if total else 1.0
+
+
+def _describe(event: ScanEvent) -> str:
+    kind = event["type"]
+    if kind in (HOST_DISCOVERED, FIELD_UPDATE):
+        fields = ",".join(f"{name}={value}" for name, value in sorted(event["fields"].items()))
+        return f"{event['ip']}|{fields}"
+    if kind == PROGRESS:
+        total = event["total"]
+        return f"{event['range']}|{event['done']}|{total}|{event['done'] / total if total else 1.0:.1%}"
+    if kind == PHASE_CHANGE:
+        return f"{event['phase']}|{event['state']}"
+    if kind == HOST_STATE:
+        return f"{event['ip']}|{event['state']}"
+    return json.dumps(event["stats"], separators=(",", ":"), sort_keys=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check and print a scan event stream")
+    parser.add_argument("file", nargs="?", default="-", help="Event stream (default: stdin)")
+    args = parser.parse_args(argv)
+
+    bad = 0
+
+    def report(number: int, line: str, error: ValueError) -> None:
+        nonlocal bad
+        bad += 1
+        print(f"[ERROR] line {number}: {error}", file=sys.stderr)
+
+    stream = sys.stdin if args.file == "-" else open(args.file)
+    try:
+        for event in read_events(stream, report):
+            # Format: EVENT|TYPE|DETAILS
+            print(f"EVENT|{event['type']}|{_describe(event)}", flush=True)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""scan_log.py — Bounded, low-overhead logging for scans and the TUI
+
+A ScanLogger decides from a cached level threshold whether a message is
+wanted before anything is formatted, so a debug call with debug off costs
+one dictionary lookup and a comparison. Wanted messages go to the logger's
+sinks (e.g. the TUI's update queue), to a stream and to a LogFileWriter as
+"[LEVEL] HH:MM:SS - message" lines; the timestamp is formatted at most once
+a second. The LogFileWriter appends to its file from a background thread in
+batches, holding at most a fixed number of pending lines (the oldest are
+dropped and counted), and LogRing keeps the last N lines in memory, so a
+long scan's logging uses constant memory.
+
+Usage: python3 scripts/scan_log.py [--lines N] FILE
+       Prints the last N lines of a scan log (default: 20) without reading the whole file into memory.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Iterable, List, Optional, TextIO
+
+# Level name -> severity; "success" is an info message the TUI shows in green
+LEVELS = {"debug": 10, "info": 20, "success": 20, "error": 40}
+TAGS = {"debug": "DEBUG", "error": "ERROR"}
+INFO = LEVELS["info"]
+
+# Log file writer: seconds between flushes, lines that trigger an early flush, pending lines kept
+FLUSH_INTERVAL = 0.5
+FLUSH_LINES = 256
+MAX_PENDING = 10000
+
+LogSink = Callable[[str, str], None]
+
+
+class LogRing:
+    """The last `size` log lines; older ones are dropped and counted."""
+
+    def __init__(self, size: int = 1000):
+        self._lines: Deque[str] = deque(maxlen=max(1, int(size)))
+        self.dropped = 0
+
+    def append(self, line: str) -> None:
+        if len(self._lines) == self._lines.maxlen:
+            self.dropped += 1
+        self._lines.append(line)
+
+    def lines(self) -> List[str]:
+        return list(self._lines)
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+
+class LogFileWriter:
+    """Appends lines to a file from a background thread, in batches.
+
+    write() only queues the line; the thread writes what is pending every
+    `interval` seconds, or sooner once FLUSH_LINES are waiting. At most
+    `max_pending` lines wait at a time; if the disk falls that far behind,
+    the oldest are dropped and counted in `dropped`. close() writes the rest.
+    Safe to call from any thread. Raises OSError if the file cannot be opened.
+    """
+
+    def __init__(self, path: str, interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.interval = interval
+        self.dropped = 0
+        self._file = open(path, "a")
+        self._pending: Deque[str] = deque(maxlen=max(1, int(max_pending)))
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, line: str) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(line)
+            if len(self._pending) == FLUSH_LINES:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or len(self._pending) >= FLUSH_LINES, self.interval)
+                batch = list(self._pending)
+                self._pending.clear()
+                closed = self._closed
+            if batch:
+                try:
+                    self._file.write("\n".join(batch) + "\n")
+                    self._file.flush()
+                except OSError:
+                    self.dropped += len(batch)  # Disk full or gone: keep scanning without the log
+            if closed:
+                return
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._file.close()
+
+
+class ScanLogger:
+    """Callable `log(message, level)` with a cached threshold and several outputs.
+
+    With `debug` every level is logged, with `quiet` only errors, otherwise
+    info and up. Wanted messages are passed as is to each of `sinks`, and
+    written as formatted lines to `stream` and to the file at `path`
+    (through a LogFileWriter). set_debug() changes the threshold while
+    running; enabled(level) lets callers skip building expensive messages.
+    """
+
+    def __init__(self, debug: bool = False, quiet: bool = False, stream: Optional[TextIO] = None,
+                 path: Optional[str] = None, sinks: Iterable[LogSink] = ()):
+        self.quiet = quiet
+        self.threshold = INFO
+        self.set_debug(debug)
+        self.stream = stream
+        self.file = LogFileWriter(path) if path else None
+        self.sinks = list(sinks)
+        self._second = -1
+        self._clock = ""
+
+    def set_debug(self, debug: bool) -> None:
+        self.debug = debug
+        self.threshold = LEVELS["error"] if self.quiet else LEVELS["debug"] if debug else INFO
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS.get(level, INFO) >= self.threshold
+
+    def timestamp(self) -> str:
+        now = time.time()
+        second = int(now)
+        if second != self._second:
+            self._clock = time.strftime("%H:%M:%S", time.localtime(now))
+            self._second = second
+        return self._clock
+
+    def format(self, message: str, level: str = "info") -> str:
+        return f"[{TAGS.get(level, 'INFO')}] {self.timestamp()} - {message}"
+
+    def __call__(self, message: str, level: str = "info") -> None:
+        if LEVELS.get(level, INFO) < self.threshold:
+            return
+        for sink in self.sinks:
+            sink(message, level)
+        if self.stream is None and self.file is None:
+            return
+        line = self.format(message, level)
+        if self.stream is not None:
+            print(line, file=self.stream, flush=True)
+        if self.file is not None:
+            self.file.write(line)
+
+    def close(self) -> None:
+        """Write out what the log file still has pending."""
+        if self.file is not None:
+            self.file.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Show the end of a scan log")
+    parser.add_argument("file", help="Log file, e.g. logs/enhanced_scan_2026-01-14_10-32-05.log")
+    parser.add_argument("--lines", "-n", type=int, default=20, help="Lines to show (default: 20)")
+    args = parser.parse_args(argv)
+
+    ring = LogRing(args.lines)
+    try:
+        with open(args.file, errors="replace") as f:
+            for line in f:
+                ring.append(line.rstrip("\n"))
+    except OSError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    for line in ring.lines():
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
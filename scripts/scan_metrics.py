@@ -0,0 +1,387 @@
+"""scan_metrics.py — Scan instrumentation: counters, histograms and phase timers
+
+A ScanMetrics collects what a scan is doing while it runs: probes sent and
+answered per probe type, probes in flight, queue depths, time spent in each
+phase (NDP/ICMP/ARP/Nmap discovery, enrichment) and per-host enrichment latency
+as histograms. Engines update it from the scan's event loop; snapshot() can
+be taken from any thread (the TUI's stats panel reads one every second).
+Shard worker processes send their state() to the parent, which merge()s it.
+Snapshots render in the Prometheus text format, written atomically to a
+file for node exporter's textfile collector.
+
+Usage: python3 scripts/scan_metrics.py [FILE]
+       Prints the metrics FILE holds (default: the node exporter textfile) as METRIC|NAME|LABELS|VALUE lines.
+"""
+import argparse
+import asyncio
+import bisect
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+# node exporter's textfile collector reads *.prom files from its directory
+TEXTFILE_DIR = "/var/lib/node_exporter/textfile_collector"
+DEFAULT_TEXTFILE = os.path.join(TEXTFILE_DIR, "ip_scanner.prom")
+
+# Overrides where the TUI writes its metrics
+TEXTFILE_ENV = "IP_SCANNER_METRICS"
+
+# Seconds between textfile rewrites while a scan runs
+WRITE_INTERVAL = 5.0
+
+# Histogram bucket bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help); every metric written to the textfile is listed here
+METRICS = {
+    "ipscan_probes_sent_total": ("counter", "Probes sent, by probe type (ndp, icmp, arp, tcp, syn, dns, service)"),
+    "ipscan_probe_replies_total": ("counter", "Probes answered, by probe type"),
+    "ipscan_probes_in_flight": ("gauge", "Probes sent and still waiting for an answer, by probe type"),
+    "ipscan_queue_depth": ("gauge", "Items waiting in a scan queue (enrichment: hosts, events: stream events)"),
+    "ipscan_hosts_found_total": ("counter", "Live hosts, by the probe method that found them first"),
+    "ipscan_hosts_enriched_total": ("counter", "Hosts whose enrichment finished"),
+    "ipscan_phase_seconds_total": ("counter", "Time spent in each scan phase (summed over blocks scanned at once and shard workers)"),
+    "ipscan_host_enrichment_seconds": ("histogram", "Time to enrich one host"),
+    "ipscan_enrichment_step_seconds": ("histogram", "Time of one enrichment lookup, by step (dns, mac, ping, ports, services)"),
+    "ipscan_addresses": ("gauge", "Addresses in the ranges of the current or last scan"),
+    "ipscan_scan_running": ("gauge", "1 while a scan runs"),
+    "ipscan_scan_duration_seconds": ("gauge", "Duration of the current or last scan"),
+    "ipscan_last_scan_timestamp_seconds": ("gauge", "Unix time the last completed scan finished"),
+    "ipscan_monitor_hosts": ("gauge", "Hosts watched by monitoring, by state (up, down)"),
+    "ipscan_monitor_changes_total": ("counter", "Hosts that came up or went down while monitoring, by new state"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+Key = Tuple[str, Labels]
+T = TypeVar("T")
+
+
+def _key(name: str, labels: Dict[str, str]) -> Key:
+    return name, tuple(sorted(labels.items()))
+
+
+def textfile_path() -> Optional[str]:
+    """Where the TUI writes metrics: $IP_SCANNER_METRICS, else node exporter's textfile if it is installed."""
+    path = os.environ.get(TEXTFILE_ENV)
+    if path:
+        return path
+    return DEFAULT_TEXTFILE if os.path.isdir(TEXTFILE_DIR) else None
+
+
+class MetricsSnapshot:
+    """Frozen metric values; value() and quantile() sum every series matching the given labels."""
+
+    def __init__(self, counters: Dict[Key, float], gauges: Dict[Key, float],
+                 histograms: Dict[Key, List[float]], taken: float):
+        self.counters = counters
+        self.gauges = gauges
+        self.histograms = histograms
+        self.taken = taken
+
+    @staticmethod
+    def _matching(series: Dict[Key, Any], name: str, labels: Dict[str, str]) -> Iterator[Any]:
+        wanted = set(labels.items())
+        for (metric, pairs), value in series.items():
+            if metric == name and wanted <= set(pairs):
+                yield value
+
+    def value(self, name: str, **labels: str) -> float:
+        series = self.gauges if METRICS.get(name, ("counter", ""))[0] == "gauge" else self.counters
+        return sum(self._matching(series, name, labels))
+
+    def label_values(self, name: str, label: str) -> List[str]:
+        values = set()
+        for series in (self.counters, self.gauges, self.histograms):
+            for metric, pairs in series:
+                if metric == name:
+                    values.update(v for k, v in pairs if k == label)
+        return sorted(values)
+
+    def rate(self, previous: Optional["MetricsSnapshot"], name: str, **labels: str) -> float:
+        """Per-second increase of a counter since `previous`."""
+        if previous is None or self.taken <= previous.taken:
+            return 0.0
+        return max(0.0, self.value(name, **labels) - previous.value(name, **labels)) / (self.taken - previous.taken)
+
+    def count(self, name: str, **labels: str) -> int:
+        return int(sum(h[-1] for h in self._matching(self.histograms, name, labels)))
+
+    def quantile(self, name: str, q: float, **labels: str) -> Optional[float]:
+        """Estimate of the q-quantile in seconds, interpolated within buckets like histogram_quantile()."""
+        counts = [0.0] * (len(BUCKETS) + 3)
+        for histogram in self._matching(self.histograms, name, labels):
+            for i, value in enumerate(histogram):
+                counts[i] += value
+        total = counts[-1]
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0.0
+        for i, bound in enumerate(BUCKETS):
+            if cumulative + counts[i] >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (bound - lower) * (rank - cumulative) / counts[i]
+            cumulative += counts[i]
+        return BUCKETS[-1]  # In the +Inf bucket
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines: List[str] = []
+        for name, (kind, help_text) in METRICS.items():
+            if kind == "histogram":
+                series = {pairs: h for (metric, pairs), h in self.histograms.items() if metric == name}
+            else:
+                source = self.counters if kind == "counter" else self.gauges
+                series = {pairs: v for (metric, pairs), v in source.items() if metric == name}
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for pairs, value in sorted(series.items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+                    continue
+                cumulative = 0.0
+                for bound, count in zip(BUCKETS, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(pairs + (('le', repr(bound)),))} {_format_value(cumulative)}")
+                lines.append(f"{name}_bucket{_format_labels(pairs + (('le', '+Inf'),))} {_format_value(value[-1])}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {_format_value(value[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+
+def describe_timing(snapshot: MetricsSnapshot) -> str:
+    """One line on where a scan's time went: phases, then per-host and per-step enrichment latency."""
+    def phase(name: str) -> str:
+        return f"{name} {snapshot.value('ipscan_phase_seconds_total', phase=name):.1f}s"
+
+    present = set(snapshot.label_values("ipscan_phase_seconds_total", "phase"))
+    probes = [name for name in ("ndp", "icmp", "arp", "nmap") if name in present]
+    parts = []
+    if "discovery" in present:
+        parts.append(phase("discovery") + (f" ({', '.join(map(phase, probes))})" if probes else ""))
+    parts += [phase(name) for name in sorted(present - {"discovery", *probes})]
+    line = f"Phases: {', '.join(parts) or 'none'}"
+    hosts = snapshot.count("ipscan_host_enrichment_seconds")
+    if hosts:
+        steps = ", ".join(f"{step} {_ms(snapshot.quantile('ipscan_enrichment_step_seconds', 0.95, step=step))}"
+                          for step in snapshot.label_values("ipscan_enrichment_step_seconds", "step"))
+        line += (f"; host enrichment p50 {_ms(snapshot.quantile('ipscan_host_enrichment_seconds', 0.5))}, "
+                 f"p95 {_ms(snapshot.quantile('ipscan_host_enrichment_seconds', 0.95))} ({hosts} hosts)")
+        if steps:
+            line += f"; p95 by step: {steps}"
+    return line
+
+
+def _format_labels(pairs: Labels) -> str:
+    if not pairs:
+        return ""
+    escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class ScanMetrics:
+    """Live metrics of one scan. Updated from the scan's event loop only.
+
+    Histograms keep one count per bucket of BUCKETS, then an overflow count,
+    the sum and the total count. Phases are timed with `with metrics.phase(name)`
+    (or `await metrics.timed(name, awaitable)`); phases still running count
+    up to the moment of a snapshot; `on_phase(name, started)` is called when
+    one starts and ends. Queues registered with track_queue() are sampled
+    for their depth. track_scan() runs a whole scan, keeping the scan-level
+    gauges (and optionally a textfile) up to date.
+    """
+
+    def __init__(self):
+        self.counters: Dict[Key, float] = {}
+        self.gauges: Dict[Key, float] = {}
+        self.histograms: Dict[Key, List[float]] = {}
+        self._phases: Dict[int, Tuple[str, float]] = {}
+        self._phase_ids = 0
+        self._queues: Dict[int, Tuple[str, Any]] = {}
+        self._remote: Dict[Any, Dict[str, Dict]] = {}
+        self._scan_started: Optional[float] = None
+        self.on_phase: Optional[Callable[[str, bool], None]] = None
+
+    # --- Updates ---
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def add(self, name: str, delta: float, **labels: str) -> None:
+        """Move a gauge up or down (e.g. probes in flight)."""
+        key = _key(name, labels)
+        self.gauges[key] = self.gauges.get(key, 0.0) + delta
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [0.0] * (len(BUCKETS) + 3)
+        histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self._phase_ids += 1
+        token = self._phase_ids
+        self._phases[token] = (name, time.monotonic())
+        if self.on_phase is not None:
+            self.on_phase(name, True)
+        try:
+            yield
+        finally:
+            _, started = self._phases.pop(token)
+            self.inc("ipscan_phase_seconds_total", time.monotonic() - started, phase=name)
+            if self.on_phase is not None:
+                self.on_phase(name, False)
+
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        with self.phase(name):
+            return await awaitable
+
+    def track_queue(self, name: str, queue: Any) -> None:
+        """Report `queue.qsize()` as the depth of queue `name` until untrack_queue()."""
+        self._queues[id(queue)] = (name, queue)
+
+    def untrack_queue(self, queue: Any) -> None:
+        self._queues.pop(id(queue), None)
+
+    async def track_scan(self, scan: Awaitable[T], addresses: int, path: Optional[str] = None,
+                         log: Any = None) -> T:
+        """Await `scan`, recording its addresses, duration and completion; with `path`, the textfile
+        is rewritten while it runs and once more when it ends (also if it fails or is cancelled).
+        """
+        self.set("ipscan_addresses", addresses)
+        self.set("ipscan_scan_running", 1)
+        self._scan_started = time.monotonic()
+        writer = asyncio.ensure_future(self.write_periodically(path, log)) if path else None
+        completed = False
+        try:
+            result = await scan
+            completed = True
+            return result
+        finally:
+            self.set("ipscan_scan_duration_seconds", time.monotonic() - self._scan_started)
+            self.set("ipscan_scan_running", 0)
+            self._scan_started = None
+            if completed:
+                self.set("ipscan_last_scan_timestamp_seconds", time.time())
+                if log is not None:
+                    log(describe_timing(self.snapshot()), "info")
+            if writer is not None:
+                writer.cancel()
+                try:
+                    self.write_textfile(path)
+                except OSError as e:
+                    if log is not None:
+                        log(f"Cannot write metrics to {path}: {e}", "error")
+
+    def merge(self, source: Any, state: Dict[str, Dict]) -> None:
+        """Take the latest state() of another process (e.g. a shard worker) into this one's totals."""
+        self._remote[source] = state
+
+    # --- Reading ---
+
+    def state(self) -> Dict[str, Dict]:
+        """Plain-dict copy of this process's metrics (picklable), running phases and queue depths included."""
+        now = time.monotonic()
+        counters = dict(self.counters)
+        gauges = dict(self.gauges)
+        for name, started in list(self._phases.values()):
+            key = _key("ipscan_phase_seconds_total", {"phase": name})
+            counters[key] = counters.get(key, 0.0) + now - started
+        for name, queue in list(self._queues.values()):
+            key = _key("ipscan_queue_depth", {"queue": name})
+            gauges[key] = gauges.get(key, 0.0) + queue.qsize()
+        started = self._scan_started
+        if started is not None:
+            gauges[_key("ipscan_scan_duration_seconds", {})] = now - started
+        return {"counters": counters, "gauges": gauges,
+                "histograms": {key: list(h) for key, h in list(self.histograms.items())}}
+
+    def snapshot(self) -> MetricsSnapshot:
+        """Totals of this process and every merged one."""
+        own = self.state()
+        counters, gauges, histograms = own["counters"], own["gauges"], own["histograms"]
+        for state in list(self._remote.values()):
+            for key, value in state["counters"].items():
+                counters[key] = counters.get(key, 0.0) + value
+            for key, value in state["gauges"].items():
+                gauges[key] = gauges.get(key, 0.0) + value
+            for key, value in state["histograms"].items():
+                mine = histograms.get(key)
+                histograms[key] = list(value) if mine is None else [a + b for a, b in zip(mine, value)]
+        return MetricsSnapshot(counters, gauges, histograms, time.monotonic())
+
+    def write_textfile(self, path: str) -> None:
+        """Write the current snapshot atomically (node exporter never reads a half-written file)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as f:
+            f.write(self.snapshot().render())
+        os.replace(temp, path)
+
+    async def write_periodically(self, path: str, log: Any = None, interval: float = WRITE_INTERVAL) -> None:
+        """Rewrite the textfile every `interval` seconds; runs until cancelled. Errors are logged once."""
+        failed = False
+        while True:
+            try:
+                self.write_textfile(path)
+            except OSError as e:
+                if not failed and log is not None:
+                    log(f"Cannot write metrics to {path}: {e}", "error")
+                failed = True
+            await asyncio.sleep(interval)
+
+
+def read_textfile(path: str) -> List[Tuple[str, str, str]]:
+    """(name, labels, value) of each sample in a Prometheus text file."""
+    samples = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            series, _, value = line.rpartition(" ")
+            name, _, labels = series.partition("{")
+            samples.append((name, labels.rstrip("}"), value))
+    return samples
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Show the metrics of the last scan")
+    parser.add_argument("file", nargs="?", default=textfile_path() or DEFAULT_TEXTFILE,
+                        help=f"Metrics file (default: ${TEXTFILE_ENV} or {DEFAULT_TEXTFILE})")
+    args = parser.parse_args(argv)
+
+    try:
+        samples = read_textfile(args.file)
+    except OSError as e:
+        print(f"scan_metrics: {e}", file=sys.stderr)
+        return 1
+    for name, labels, value in samples:
+        # Format: METRIC|NAME|LABELS|VALUE
+        print(f"METRIC|{name}|{labels}|{value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
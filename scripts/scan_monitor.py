@@ -0,0 +1,354 @@
+"""scan_monitor.py — Continuous monitoring of scanned ranges with delta-only probing
+
+After a full scan, a HostMonitor keeps watching the same ranges, one tick a
+second. A MonitorSchedule decides what each tick probes, never more than
+`budget` echo requests: hosts known to be up get one echo request every
+`interval` seconds; a host that misses DOWN_AFTER checks in a row is down,
+and is then re-checked with exponential backoff (up to `max_backoff`); the
+rest of the ranges is swept in the background, a slice per tick so that one
+pass takes about `sweep_period` (longer when the budget is the limit). Only
+hosts whose state changes cost more than an echo request: a host that comes
+up, new or back, is enriched again (hostname, MAC/vendor, ports, services);
+a host that goes down is only reported. Hosts that never answered an echo
+request (found by ARP or Nmap only) are left alone, as an echo request cannot
+tell whether they are still up; so are IPv6 hosts and ranges, as the echo
+requests are IPv4 only.
+
+Usage: python3 scripts/scan_monitor.py [--interval S] [--sweep-period S] [--budget N] [--timeout MS]
+                                       [--ports LIST | --no-ports] [--services] CIDR [CIDR ...]
+       Sweeps the ranges once, then prints UP|IP|RTT_MS and DOWN|IP lines as hosts change state
+       (and a LIVE|IP|HOSTNAME|MAC|VENDOR|PORTS|PING line once a host that came up is enriched).
+"""
+import argparse
+import asyncio
+import heapq
+import ipaddress
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from discovery import HOST_FIELDS, NEW, UPDATE, EventCallback, LogCallback, count_addresses
+from enrichment import HostEnricher, HostRecord, format_live_line, format_rtt
+from icmp_sweep import IcmpSweeper, expand_targets
+from port_scanner import parse_ports
+from scan_log import ScanLogger
+from service_detect import ServiceDetector
+
+# Host states reported on a change
+UP = "up"
+DOWN = "down"
+
+# Seconds between scheduling rounds; the probe budget is per tick
+TICK = 1.0
+
+DEFAULT_INTERVAL = 30.0  # Seconds between echo requests to an up host
+DEFAULT_SWEEP_PERIOD = 600.0  # Seconds for one background pass over the ranges
+DEFAULT_BUDGET = 100  # Echo requests per tick at most
+MAX_BACKOFF = 3600.0  # Longest wait between checks of a down host
+
+# Missed checks in a row before an up host counts as down
+DOWN_AFTER = 2
+
+StateCallback = Callable[[str, str], None]
+
+
+def _no_log(message: str, level: str = "info") -> None:
+    pass
+
+
+class _Watch:
+    __slots__ = ("state", "misses", "due")
+
+    def __init__(self, state: str, due: float):
+        self.state = state
+        self.misses = 0
+        self.due = due
+
+
+class MonitorSchedule:
+    """Which addresses to probe when, from the answers so far (no I/O; times are time.monotonic()).
+
+    `up` are the hosts up at the start. plan(now) returns the addresses to
+    probe this tick: due checks of up hosts first, then of down hosts, then
+    the next addresses of the background sweep; each probed address must be
+    reported back with result(). `ignored` addresses are neither checked
+    nor swept.
+    """
+
+    def __init__(self, ranges: Iterable[str], up: Iterable[str] = (), ignored: Iterable[str] = (),
+                 interval: float = DEFAULT_INTERVAL, sweep_period: float = DEFAULT_SWEEP_PERIOD,
+                 budget: int = DEFAULT_BUDGET, max_backoff: float = MAX_BACKOFF, tick: float = TICK,
+                 now: Optional[float] = None):
+        if interval <= 0 or sweep_period <= 0:
+            raise ValueError("monitor interval and sweep period must be positive")
+        if budget < 1:
+            raise ValueError(f"probe budget must be at least 1, got {budget}")
+        self.ranges = list(ranges)
+        self.interval = interval
+        self.budget = budget
+        self.max_backoff = max(max_backoff, interval)
+        self.tick = tick
+        self.hosts: Dict[str, _Watch] = {}
+        self.ignored: Set[str] = set(ignored)
+        self.down = 0  # Watched hosts that are down
+        # (due, ip) heaps; a host is in at most one of them, and in none while its check is out
+        self._live: List[Tuple[float, str]] = []
+        self._down: List[Tuple[float, str]] = []
+        self._addresses = count_addresses(self.ranges)
+        self._sweep_rate = self._addresses * tick / sweep_period  # Addresses per tick
+        self._sweep_credit = 0.0
+        self._sweep = self._cycle()
+        now = time.monotonic() if now is None else now
+        # Spread the first checks over one interval, so a large scan's hosts are not all due at once
+        up = [ip for ip in dict.fromkeys(up) if ip not in self.ignored]
+        for i, ip in enumerate(up):
+            self._schedule(ip, _Watch(UP, now + interval * (i + 1) / len(up)))
+
+    def _cycle(self) -> Iterator[str]:
+        while True:
+            yield from expand_targets(self.ranges)
+
+    def _schedule(self, ip: str, watch: _Watch) -> None:
+        self.hosts[ip] = watch
+        heapq.heappush(self._live if watch.state == UP else self._down, (watch.due, ip))
+
+    @property
+    def addresses(self) -> int:
+        return self._addresses
+
+    @property
+    def up(self) -> int:
+        return len(self.hosts) - self.down
+
+    def plan(self, now: float) -> List[str]:
+        """Addresses to probe now: due checks, then sweep addresses, `budget` at most."""
+        probes: List[str] = []
+        for heap in (self._live, self._down):
+            while heap and heap[0][0] <= now and len(probes) < self.budget:
+                probes.append(heapq.heappop(heap)[1])
+        self._sweep_credit = min(self._sweep_credit + self._sweep_rate, float(self.budget))
+        room = min(int(self._sweep_credit), self.budget - len(probes))
+        if room > 0:
+            swept = 0
+            for _ in range(self._addresses):  # One pass at most, in case every address is known
+                ip = next(self._sweep)
+                if ip in self.hosts or ip in self.ignored:
+                    continue
+                probes.append(ip)
+                swept += 1
+                if swept == room:
+                    break
+            self._sweep_credit -= swept
+        return probes
+
+    def _backoff(self, misses: int) -> float:
+        return min(self.max_backoff, self.interval * 2 ** (misses - DOWN_AFTER))
+
+    def result(self, ip: str, alive: bool, now: float) -> Optional[str]:
+        """Record the answer to a probe of `ip`; returns UP or DOWN if its state changed, else None."""
+        watch = self.hosts.get(ip)
+        if watch is None:
+            if not alive:
+                return None  # Swept address, still empty
+            self._schedule(ip, _Watch(UP, now + self.interval))
+            return UP
+        changed: Optional[str] = None
+        if alive:
+            if watch.state == DOWN:
+                changed = UP
+                self.down -= 1
+            watch.state, watch.misses, watch.due = UP, 0, now + self.interval
+        else:
+            watch.misses += 1
+            if watch.state == UP and watch.misses >= DOWN_AFTER:
+                watch.state = changed = DOWN
+                self.down += 1
+            # An up host that missed once is checked again next tick, before it counts as down
+            watch.due = now + (self._backoff(watch.misses) if watch.state == DOWN else self.tick)
+        self._schedule(ip, watch)
+        return changed
+
+
+class HostMonitor:
+    """Watches the ranges of a finished scan until cancelled (see the module docstring).
+
+    `hosts` maps each host of the scan to its record and is kept up to date:
+    records of new hosts are added, a host that goes down gets ping "down".
+    Probes go through `sweeper` (one echo request per check, so use no
+    retries) and hosts that come up are enriched by `enricher`. on_state(ip,
+    state) reports each change, on_event(kind, ip, fields) the record
+    changes as in stream_scan() (NEW for a host not seen before) and
+    on_host(record) each host whose enrichment finished. Set `control` to
+    pause the monitor with a scan, and `metrics` to count its probes and
+    the hosts up and down.
+    """
+
+    def __init__(self, ranges: Iterable[str], sweeper: IcmpSweeper, enricher: HostEnricher,
+                 hosts: Optional[Dict[str, HostRecord]] = None, interval: float = DEFAULT_INTERVAL,
+                 sweep_period: float = DEFAULT_SWEEP_PERIOD, budget: int = DEFAULT_BUDGET,
+                 on_state: Optional[StateCallback] = None, on_event: Optional[EventCallback] = None,
+                 on_host: Optional[Callable[[HostRecord], None]] = None, log: LogCallback = _no_log):
+        self.hosts = hosts if hosts is not None else {}
+        pinged = [ip for ip, record in self.hosts.items()
+                  if ":" not in ip and record.get("ping", "-").endswith("ms")]
+        self.schedule = MonitorSchedule(ranges, up=pinged, ignored=set(self.hosts) - set(pinged),
+                                        interval=interval, sweep_period=sweep_period, budget=budget)
+        self.sweeper = sweeper
+        self.enricher = enricher
+        self.on_state = on_state
+        self.on_event = on_event
+        self.on_host = on_host
+        self.log = log
+        self._known: Dict[str, HostRecord] = {}  # Hosts waiting for enrichment -> the RTT just measured
+        self.control = None  # Optional ScanControl: waited on before each tick
+        self.metrics = None  # Optional ScanMetrics: probes, hosts up/down and state changes
+
+    def _emit(self, kind: str, ip: str, fields: Dict[str, str]) -> None:
+        if self.on_event:
+            self.on_event(kind, ip, fields)
+
+    def _came_up(self, ip: str, rtt: float, queue: asyncio.Queue) -> None:
+        ping = format_rtt(rtt)
+        record = self.hosts.get(ip)
+        if record is None:
+            record = self.hosts[ip] = {"ip": ip, **{name: "-" for name in HOST_FIELDS}, "ping": ping}
+            self._emit(NEW, ip, dict(record))
+        else:
+            record["ping"] = ping
+            self._emit(UPDATE, ip, {"ping": ping})
+        self._known[ip] = {"ping": ping}  # Everything else is looked up again
+        queue.put_nowait(ip)
+
+    def _went_down(self, ip: str) -> None:
+        self.hosts[ip]["ping"] = DOWN
+        self._emit(UPDATE, ip, {"ping": DOWN})
+
+    def _changed(self, ip: str, state: str) -> None:
+        if self.metrics:
+            self.metrics.inc("ipscan_monitor_changes_total", state=state)
+        if self.on_state:
+            self.on_state(ip, state)
+
+    def _updated(self, ip: str, fields: Dict[str, str]) -> None:
+        """Enrichment result: only fields that differ from the host's record are reported."""
+        record = self.hosts[ip]
+        changed = {name: value for name, value in fields.items() if record.get(name) != value}
+        if changed:
+            record.update(changed)
+            self._emit(UPDATE, ip, changed)
+
+    def _enriched(self, record: HostRecord) -> None:
+        self._known.pop(record["ip"], None)
+        if self.on_host:
+            self.on_host(dict(self.hosts[record["ip"]]))
+
+    async def _probe(self, probes: List[str], queue: asyncio.Queue) -> None:
+        alive: Dict[str, float] = {}
+
+        def done(ip: str) -> None:
+            state = self.schedule.result(ip, ip in alive, time.monotonic())
+            if state == UP:
+                self._came_up(ip, alive[ip], queue)
+            elif state == DOWN:
+                self._went_down(ip)
+            if state is not None:
+                self._changed(ip, state)
+
+        await self.sweeper.sweep(probes, on_alive=alive.__setitem__, on_done=done)
+
+    async def run(self) -> None:
+        """Probe tick by tick until cancelled."""
+        queue: asyncio.Queue = asyncio.Queue()
+        enriching = asyncio.ensure_future(self.enricher.run(queue, self._enriched, self._updated, known=self._known))
+        if self.metrics:
+            self.metrics.track_queue("enrichment", queue)
+        schedule = self.schedule
+        unwatched = f" ({len(schedule.ignored)} without echo replies are not watched)" if schedule.ignored else ""
+        self.log(f"Monitoring {len(schedule.hosts)} hosts every {schedule.interval:g}s{unwatched}, "
+                 f"sweeping {schedule.addresses} addresses, {schedule.budget} probes/s at most", "info")
+        try:
+            while True:
+                started = time.monotonic()
+                if self.control:
+                    await self.control.wait()
+                probes = schedule.plan(time.monotonic())
+                if probes:
+                    await self._probe(probes, queue)
+                if self.metrics:
+                    self.metrics.set("ipscan_monitor_hosts", schedule.up, state=UP)
+                    self.metrics.set("ipscan_monitor_hosts", schedule.down, state=DOWN)
+                if enriching.done():
+                    enriching.result()  # Enrichment failed: stop monitoring with its error
+                await asyncio.sleep(max(0.0, schedule.tick - (time.monotonic() - started)))
+        finally:
+            enriching.cancel()
+            if self.metrics:
+                self.metrics.untrack_queue(queue)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Continuous host monitoring with delta-only probing")
+    parser.add_argument("ranges", nargs="+", help="CIDR ranges to monitor")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help=f"Seconds between checks of an up host (default: {DEFAULT_INTERVAL:g})")
+    parser.add_argument("--sweep-period", type=float, default=DEFAULT_SWEEP_PERIOD,
+                        help=f"Seconds per background sweep of the ranges (default: {DEFAULT_SWEEP_PERIOD:g})")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET,
+                        help=f"Echo requests per second at most (default: {DEFAULT_BUDGET})")
+    parser.add_argument("--timeout", type=int, default=1000, help="Probe timeout in ms (default: 1000)")
+    parser.add_argument("--threads", type=int, default=50, help="Hosts enriched in parallel (default: 50)")
+    parser.add_argument("--ports", default="top", help="Port list, e.g. 22,80,8000-8100 (default: top 10)")
+    parser.add_argument("--no-ports", action="store_true", help="Skip port scanning")
+    parser.add_argument("--services", action="store_true", help="Identify the service on each open port")
+    args = parser.parse_args(argv)
+
+    try:
+        ports = None if args.no_ports else parse_ports(args.ports)
+        for spec in args.ranges:
+            ipaddress.ip_network(spec, strict=False)
+        MonitorSchedule(args.ranges, interval=args.interval, sweep_period=args.sweep_period, budget=args.budget)
+    except ValueError as e:
+        parser.error(str(e))
+
+    timeout = args.timeout / 1000.0
+    sweeper = IcmpSweeper(concurrency=args.budget, timeout=timeout, retries=0)
+    enricher = HostEnricher(workers=args.threads, timeout=timeout, ports=ports, pinger=sweeper,
+                            services=ServiceDetector() if args.services and ports else None)
+    log = ScanLogger(stream=sys.stderr)
+    hosts: Dict[str, HostRecord] = {}
+
+    def changed(ip: str, state: str) -> None:
+        # Format: UP|IP|RTT_MS or DOWN|IP
+        print(f"UP|{ip}|{hosts[ip]['ping'][:-2]}" if state == UP else f"DOWN|{ip}", flush=True)
+
+    def report(host: HostRecord) -> None:
+        print(format_live_line(host), flush=True)
+
+    async def run():
+        try:
+            found = await sweeper.sweep(expand_targets(args.ranges))
+            for ip, rtt in sorted(found.items(), key=lambda item: ipaddress.ip_address(item[0])):
+                print(f"UP|{ip}|{rtt:.3f}", flush=True)
+                hosts[ip] = {"ip": ip, **{name: "-" for name in HOST_FIELDS}, "ping": format_rtt(rtt)}
+            monitor = HostMonitor(args.ranges, sweeper, enricher, hosts, interval=args.interval,
+                                  sweep_period=args.sweep_period, budget=args.budget, on_state=changed,
+                                  on_host=report, log=log)
+            await monitor.run()
+        finally:
+            enricher.close()
+            sweeper.close()
+
+    try:
+        asyncio.run(run())
+    except PermissionError as e:
+        print(f"scan_monitor: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""scan_store.py — Persistent SQLite store of scan results
+
+Keeps every host seen by past scans (keyed by IP, with its MAC) and each of
+its fields with the time it was last looked up, in a WAL-mode SQLite file.
+Incremental scans reuse fields that are still fresh for hosts whose MAC has
+not changed, and each finished scan reports which hosts are new or gone
+since the previous scan of the same ranges. Service fingerprints are kept
+by (MAC, port), so they follow a device to a new address.
+
+Usage: python3 scripts/scan_store.py [--store FILE] [RANGE ...]
+       Prints one HOST|IP|HOSTNAME|MAC|VENDOR|PORTS|PING|LAST_SEEN line per stored host.
+"""
+import argparse
+import ipaddress
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from range_router import RangeRouter, parse_ranges
+
+DEFAULT_STORE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "results", "scan_store.db")
+
+# Fields kept per host besides the MAC; only the enrichment ones are ever reused
+STORED_FIELDS = ("hostname", "vendor", "ports", "services", "ping", "ipv6")
+CACHED_FIELDS = ("hostname", "vendor", "ports", "services")
+
+# Stored fields younger than this (seconds) are reused by incremental scans
+DEFAULT_MAX_AGE = 6 * 3600
+
+# Remembers which port list produced the stored "ports" (and "services") value
+_PORT_LIST_FIELD = "port_list"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    ip TEXT PRIMARY KEY,
+    mac TEXT NOT NULL DEFAULT '-',
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    present INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS hosts_mac ON hosts (mac);
+CREATE TABLE IF NOT EXISTS host_fields (
+    ip TEXT NOT NULL REFERENCES hosts (ip) ON DELETE CASCADE,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (ip, field)
+);
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL,
+    ranges TEXT NOT NULL,
+    hosts INTEGER,
+    new INTEGER,
+    gone INTEGER
+);
+CREATE TABLE IF NOT EXISTS services (
+    mac TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    service TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (mac, port)
+);
+"""
+
+
+def _ip_key(ip: str) -> Tuple[int, int]:
+    addr = ipaddress.ip_address(ip)
+    return addr.version, int(addr)
+
+
+class ScanStore:
+    """Result store shared by successive scans.
+
+    Call begin_scan() before a scan, save_host() as hosts complete and
+    finish_scan() at the end. A store must be used from the thread that
+    opened it (SQLite connections are per-thread).
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE, max_age: float = DEFAULT_MAX_AGE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_age = float(max_age)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # WAL keeps this crash-safe
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(_SCHEMA)
+        self._scan_id: Optional[int] = None
+        self._router: Optional[RangeRouter] = None
+        self.previous: Set[str] = set()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # --- Reading ---
+
+    def hosts(self, ranges: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, str]]:
+        """Stored host records (optionally only those inside `ranges`), ordered by IP."""
+        router = RangeRouter(ranges) if ranges is not None else None
+        records: Dict[str, Dict[str, str]] = {}
+        for ip, mac, last_seen in self.conn.execute("SELECT ip, mac, last_seen FROM hosts"):
+            if router is None or router.lookup(ip) is not None:
+                records[ip] = {"ip": ip, "hostname": "-", "mac": mac, "vendor": "-", "ports": "-",
+                               "services": "-", "ping": "-", "ipv6": "-", "last_seen": f"{datetime.fromtimestamp(last_seen):%Y-%m-%d %H:%M:%S}"}
+        for ip, field, value in self.conn.execute("SELECT ip, field, value FROM host_fields"):
+            if ip in records and field in STORED_FIELDS:
+                records[ip][field] = value
+        return dict(sorted(records.items(), key=lambda item: _ip_key(item[0])))
+
+    def cached_fields(self, ip: str, mac: str = "-", port_list: Optional[str] = None) -> Dict[str, str]:
+        """Enrichment fields of `ip` that are fresh enough to reuse.
+
+        Nothing is reused if the host is unknown or now answers with a
+        different MAC (another device took the address). The stored ports
+        and services are reused only if they were scanned with the same
+        `port_list`.
+        """
+        row = self.conn.execute("SELECT mac FROM hosts WHERE ip = ?", (ip,)).fetchone()
+        if row is None or (mac != "-" and row[0] != "-" and row[0] != mac):
+            return {}
+        fresh = {field: value for field, value in self.conn.execute(
+            "SELECT field, value FROM host_fields WHERE ip = ? AND updated >= ?",
+            (ip, time.time() - self.max_age))}
+        cached = {field: fresh[field] for field in CACHED_FIELDS if field in fresh}
+        if port_list is None or fresh.get(_PORT_LIST_FIELD) != port_list:
+            cached.pop("ports", None)
+            cached.pop("services", None)
+        return cached
+
+    def fingerprints(self) -> Dict[Tuple[str, int], str]:
+        """Service fingerprints identified recently enough to reuse, by (MAC, port)."""
+        return {(mac, port): service for mac, port, service in self.conn.execute(
+            "SELECT mac, port, service FROM services WHERE updated >= ?", (time.time() - self.max_age,))}
+
+    # --- Writing ---
+
+    def begin_scan(self, ranges: Iterable[str]) -> Set[str]:
+        """Start recording a scan; returns the hosts that were up after the last scan of these ranges."""
+        ranges = list(ranges)
+        self._router = RangeRouter(ranges)
+        self.previous = {ip for ip, in self.conn.execute("SELECT ip FROM hosts WHERE present = 1")
+                         if self._router.lookup(ip) is not None}
+        cur = self.conn.execute("INSERT INTO scans (started, ranges) VALUES (?, ?)",
+                                (time.time(), ",".join(ranges)))
+        self._scan_id = cur.lastrowid
+        self.conn.commit()
+        return set(self.previous)
+
+    def save_host(self, record: Dict[str, str], refreshed: Iterable[str],
+                  port_list: Optional[str] = None) -> None:
+        """Store a completed host. Only `refreshed` fields get a new timestamp."""
+        now = time.time()
+        ip, mac = record["ip"], record.get("mac", "-")
+        row = self.conn.execute("SELECT mac FROM hosts WHERE ip = ?", (ip,)).fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO hosts (ip, mac, first_seen, last_seen) VALUES (?, ?, ?, ?)",
+                              (ip, mac, now, now))
+        else:
+            if mac != "-" and row[0] != "-" and row[0] != mac:
+                # A different device now has this IP; the old one's details no longer apply
+                self.conn.execute("DELETE FROM host_fields WHERE ip = ?", (ip,))
+            self.conn.execute("UPDATE hosts SET mac = ?, last_seen = ?, present = 1 WHERE ip = ?",
+                              (mac if mac != "-" else row[0], now, ip))
+        refreshed = set(refreshed)
+        values = [(ip, field, record.get(field, "-"), now) for field in STORED_FIELDS if field in refreshed]
+        if "ports" in refreshed and port_list is not None:
+            values.append((ip, _PORT_LIST_FIELD, port_list, now))
+        self.conn.executemany(
+            "INSERT INTO host_fields (ip, field, value, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (ip, field) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+            values,
+        )
+        self.conn.commit()
+
+    def save_fingerprint(self, mac: str, port: int, service: str) -> None:
+        """Store the service identified on a device's port (committed with the device's host)."""
+        self.conn.execute(
+            "INSERT INTO services (mac, port, service, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (mac, port) DO UPDATE SET service = excluded.service, updated = excluded.updated",
+            (mac, port, service, time.time()),
+        )
+
+    def finish_scan(self, seen: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Close the scan; returns (new, gone) hosts compared with the previous scan, sorted by IP.
+
+        Hosts outside the scanned ranges (IPv6 neighbors found on their links) are stored but not compared.
+        """
+        seen = {ip for ip in seen if self._router is None or self._router.lookup(ip) is not None}
+        new = sorted(seen - self.previous, key=_ip_key)
+        gone = sorted(self.previous - seen, key=_ip_key)
+        self.conn.executemany("UPDATE hosts SET present = 0 WHERE ip = ?", [(ip,) for ip in gone])
+        if self._scan_id is not None:
+            self.conn.execute("UPDATE scans SET finished = ?, hosts = ?, new = ?, gone = ? WHERE id = ?",
+                              (time.time(), len(seen), len(new), len(gone), self._scan_id))
+        self.conn.commit()
+        self._scan_id = None
+        self.previous = seen
+        return new, gone
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Show stored scan results")
+    parser.add_argument("ranges", nargs="*", help="Only show hosts inside these CIDRs")
+    parser.add_argument("--store", default=DEFAULT_STORE, help=f"Store file (default: {DEFAULT_STORE})")
+    args = parser.parse_args(argv)
+
+    try:
+        ranges = [r for spec in args.ranges for r in parse_ranges(spec)] or None
+    except ValueError as e:
+        parser.error(str(e))
+    if not os.path.exists(args.store):
+        print(f"scan_store: {args.store} does not exist yet", file=sys.stderr)
+        return 1
+
+    store = ScanStore(args.store)
+    try:
+        for host in store.hosts(ranges).values():
+            # Format: HOST|IP|HOSTNAME|MAC|VENDOR|PORTS|PING|LAST_SEEN
+            print("HOST|{ip}|{hostname}|{mac}|{vendor}|{ports}|{ping}|{last_seen}".format(**host))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
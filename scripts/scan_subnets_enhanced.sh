@@ -1,7 +1,7 @@
 #!/bin/bash
 # scan_subnets_enhanced.sh — Enhanced multi-tool scan with MAC, vendor, and port detection
 # Created: 2026-01-14
-# Usage: bash scripts/scan_subnets_enhanced.sh [threads] [timeout] [range1] [range2] ... [--debug]
+# Usage: bash scripts/scan_subnets_enhanced.sh [threads] [timeout] [range1] [range2] ... [--ports=LIST] [--no-port-scan] [--syn] [--syn-rate=PPS] [--services] [--arp-rate=PPS] [--store] [--incremental] [--fixed-timeout] [--workers=N] [--resume] [--ipv6] [--metrics-file=FILE] [--debug]
 
 set +e
 
@@ -9,13 +9,19 @@ set +e
 THREADS="${1:-50}"
 TIMEOUT="${2:-1000}"
 DEBUG=false
+PORT_SCAN=true
+SERVICES=false
+SYN=false
+SYN_RATE=""
+ARP_RATE=""
+STORE=false
+INCREMENTAL=false
+ADAPTIVE=true
+WORKERS=""
+RESUME=false
+IPV6=false
+METRICS_FILE=""
 SUBNETS=()
-# Auto-detect network interfaces (exclude loopback)
-INTERFACES=($(ip link show | grep -E "^[0-9]+:" | grep -v "lo:" | awk '{print $2}' | sed 's/:$//' | head -2))
-# Fallback to common interface names if auto-detection fails
-if [ ${#INTERFACES[@]} -eq 0 ]; then
-    INTERFACES=("eth0" "wlan0")
-fi
 # Top 10 most common ports worldwide
 TOP_PORTS="22,80,443,3389,3306,8080,21,25,110,143"
 
@@ -24,8 +30,36 @@ shift 2  # Skip threads and timeout
 for arg in "$@"; do
     if [ "$arg" == "--debug" ] || [ "$arg" == "-d" ]; then
         DEBUG=true
+    elif [[ "$arg" == --ports=* ]]; then
+        TOP_PORTS="${arg#--ports=}"
+    elif [ "$arg" == "--no-port-scan" ]; then
+        PORT_SCAN=false
+    elif [ "$arg" == "--services" ]; then
+        SERVICES=true
+    elif [ "$arg" == "--syn" ]; then
+        SYN=true
+    elif [[ "$arg" == --syn-rate=* ]]; then
+        SYN_RATE="${arg#--syn-rate=}"
+    elif [[ "$arg" == --arp-rate=* ]]; then
+        ARP_RATE="${arg#--arp-rate=}"
+    elif [ "$arg" == "--store" ]; then
+        STORE=true
+    elif [ "$arg" == "--incremental" ]; then
+        INCREMENTAL=true
+    elif [ "$arg" == "--fixed-timeout" ]; then
+        ADAPTIVE=false
+    elif [[ "$arg" == --workers=* ]]; then
+        WORKERS="${arg#--workers=}"
+    elif [ "$arg" == "--resume" ]; then
+        RESUME=true
+    elif [ "$arg" == "--ipv6" ]; then
+        IPV6=true
+    elif [[ "$arg" == --metrics-file=* ]]; then
+        METRICS_FILE="${arg#--metrics-file=}"
     elif [[ "$arg" =~ ^[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+/[0-9]+$ ]]; then
         SUBNETS+=("$arg")
+    elif [[ "$arg" =~ ^[0-9A-Fa-f:]*:[0-9A-Fa-f:.]*/[0-9]+$ ]]; then
+        SUBNETS+=("$arg")  # IPv6, e.g. fd00::/64
     fi
 done
 
@@ -36,117 +70,92 @@ fi
 
 # Dynamic paths
 BASE_DIR=$(dirname "$(dirname "$(readlink -f "$0")")")
+SCRIPT_DIR="$BASE_DIR/scripts"
 LOG_DIR="$BASE_DIR/logs"
 mkdir -p "$LOG_DIR"
-TIMESTAMP=$(date +"%Y-%m-%d_%H-%M-%S")
+printf -v TIMESTAMP '%(%Y-%m-%d_%H-%M-%S)T' -1
 LOG_FILE="$LOG_DIR/enhanced_scan_$TIMESTAMP.log"
-RAM_FILE="/dev/shm/discovered_hosts_$TIMESTAMP.txt"
-ARP_DATA="/dev/shm/arp_data_$TIMESTAMP.txt"
 
 # --- Logging Functions ---
-log_info() {
-    echo -e "[INFO] $(date +'%H:%M:%S') - $1" | tee -a "$LOG_FILE" 2>&1
-}
-
-log_debug() {
-    if [ "$DEBUG" = true ]; then
-        echo -e "[DEBUG] $(date +'%H:%M:%S') - $1" | tee -a "$LOG_FILE" 2>&1
-    fi
+# The log file stays open on fd 3 and timestamps come from printf's %(...)T,
+# so a log line forks no date/tee processes. log_debug is a no-op without --debug.
+exec 3>>"$LOG_FILE"
+
+_log() {
+    local line
+    printf -v line '[%s] %(%H:%M:%S)T - %b' "$1" -1 "$2"
+    printf '%s\n' "$line"
+    printf '%s\n' "$line" >&3
 }
 
-log_error() {
-    echo -e "[ERROR] $(date +'%H:%M:%S') - $1" | tee -a "$LOG_FILE" 2>&1
-}
+log_info() { _log INFO "$1"; }
+log_error() { _log ERROR "$1"; }
+if [ "$DEBUG" = true ]; then
+    log_debug() { _log DEBUG "$1"; }
+else
+    log_debug() { :; }
+fi
 
 # --- Main Scan Execution ---
 log_info "=== Enhanced Network Scan Started ==="
 log_info "Configuration: Threads=$THREADS, Timeout=${TIMEOUT}ms, Ports=$TOP_PORTS"
 [ "$DEBUG" = true ] && log_debug "Debug mode ENABLED"
 
-START_TIME=$(date +%s)
-
-# 1. ARP Scan for MAC addresses (Layer 2)
-log_info "Running ARP Scan for MAC addresses..."
-for i in "${!SUBNETS[@]}"; do
-    subnet="${SUBNETS[$i]}"
-    interface="${INTERFACES[$i]}"
-    log_debug "ARP scanning $subnet on $interface"
-    
-    # Run arp-scan and save MAC data
-    arp-scan --interface="$interface" "$subnet" 2>/dev/null | grep -E "^([0-9]{1,3}\.){3}[0-9]{1,3}" >> "$ARP_DATA" || true
-done
-
-# 2. Fast ping sweep with fping
-log_info "Running fast ping sweep..."
-for subnet in "${SUBNETS[@]}"; do
-    log_debug "Pinging subnet $subnet"
-    fping -a -g "$subnet" -r 2 -t "$TIMEOUT" 2>/dev/null >> "$RAM_FILE" || true
-done
-
-# 3. Nmap host discovery
-log_info "Running Nmap host discovery..."
-NMAP_OPTS="-sn -PE -PP -PA80,443 --max-retries 2 --host-timeout 15s -T4 --min-parallelism $THREADS"
-[ "$DEBUG" = true ] && NMAP_OPTS="$NMAP_OPTS -v"
-
-log_debug "Nmap options: $NMAP_OPTS"
-nmap $NMAP_OPTS "${SUBNETS[@]}" -oG - 2>/dev/null | grep "Host: " | awk '{print $2}' >> "$RAM_FILE" || true
-
-# --- Process Live Hosts ---
-log_info "Processing discovered hosts..."
-if [ -f "$RAM_FILE" ]; then
-    sort -u "$RAM_FILE" -o "$RAM_FILE"
-    HOSTS_UP=$(wc -l < "$RAM_FILE")
+START_TIME=$SECONDS
+
+# --- Streaming Discovery + Enrichment ---
+# ICMP sweep, ARP sweep and Nmap discovery run at the same time and feed one
+# deduplicated host stream; each host is enriched (hostname, MAC/vendor, RTT,
+# ports) as soon as it is found and printed when done. --services also names the
+# service on each open port from its banner or a minimal probe (SERVICE lines).
+# --syn scans ports half-open from a raw socket (paced at --syn-rate=PPS), which
+# makes wide lists such as --ports=1-65535 practical. ARP frames go out on the
+# interface whose network overlaps each subnet, paced at --arp-rate. --store
+# saves results to results/scan_store.db; --incremental also reuses fresh
+# stored details for hosts whose MAC has not changed. Probe timeouts adapt to
+# measured RTTs with TIMEOUT as the upper bound unless --fixed-timeout is given.
+# --workers=N (other than 1) shards the subnets into /24 blocks scanned by N
+# processes (0 = one per core) without Nmap discovery; meant for /16 and up.
+# Progress is checkpointed under results/checkpoints/; --resume continues an
+# interrupted scan of the same subnets instead of starting over.
+# --ipv6 (implied by an IPv6 subnet such as fd00::/64) also finds IPv6 hosts on
+# the scanned links with an all-nodes multicast ping and neighbor discovery
+# instead of probing addresses one by one; a host's IPv6 addresses join its
+# IPv4 record by MAC (IPV6 lines), and IPv6-only hosts get LIVE lines of their
+# own. Sharded scans (--workers) skip IPv6.
+# --metrics-file=FILE keeps probe counts, queue depths and per-phase timings in
+# a Prometheus text file while the scan runs (e.g. for node exporter).
+# The scanner appends its own log lines to LOG_FILE in batches (--log-file);
+# LIVE lines only go to stdout.
+SCAN_OPTS=(--threads "$THREADS" --timeout "$TIMEOUT" --ports "$TOP_PORTS" --log-file "$LOG_FILE")
+[ "$PORT_SCAN" = false ] && SCAN_OPTS+=(--no-ports)
+[ "$SERVICES" = true ] && SCAN_OPTS+=(--services)
+[ "$SYN" = true ] && SCAN_OPTS+=(--syn)
+[ -n "$SYN_RATE" ] && SCAN_OPTS+=(--syn-rate "$SYN_RATE")
+[ -n "$ARP_RATE" ] && SCAN_OPTS+=(--arp-rate "$ARP_RATE")
+# The store file is named so a bare --store cannot take the first subnet as its file
+[ "$STORE" = true ] && SCAN_OPTS+=(--store "$BASE_DIR/results/scan_store.db")
+[ "$INCREMENTAL" = true ] && SCAN_OPTS+=(--incremental)
+[ "$ADAPTIVE" = false ] && SCAN_OPTS+=(--fixed-timeout)
+[ "$RESUME" = true ] && SCAN_OPTS+=(--resume)
+[ -n "$METRICS_FILE" ] && SCAN_OPTS+=(--metrics-file "$METRICS_FILE")
+[ "$DEBUG" = true ] && SCAN_OPTS+=(--debug)
+SCANNER="discovery.py"
+if [ -n "$WORKERS" ] && [ "$WORKERS" != 1 ]; then
+    SCANNER="shard_scan.py"
+    SCAN_OPTS+=(--workers "$WORKERS")
 else
-    HOSTS_UP=0
+    [ "$IPV6" = true ] && SCAN_OPTS+=(--ipv6)
 fi
+log_debug "Discovery options ($SCANNER): ${SCAN_OPTS[*]}"
 
-log_info "Found $HOSTS_UP potential live hosts. Scanning ports and gathering details..."
-
-# --- Enhanced Scan for Each Live Host ---
-if [ -f "$RAM_FILE" ] && [ "$HOSTS_UP" -gt 0 ]; then
-    while read -r ip; do
-        [ -z "$ip" ] && continue
-        
-        log_debug "Scanning $ip for details..."
-        
-        # Get hostname
-        hostname=$(getent hosts "$ip" 2>/dev/null | awk '{print $2}' | head -1)
-        [ -z "$hostname" ] && hostname=$(nslookup "$ip" 2>/dev/null | grep "name =" | awk '{print $NF}' | sed 's/\.$//')
-        [ -z "$hostname" ] && hostname="-"
-        
-        # Get MAC and vendor from ARP data
-        mac="-"
-        vendor="-"
-        if [ -f "$ARP_DATA" ]; then
-            arp_line=$(grep "^$ip" "$ARP_DATA" | head -1)
-            if [ -n "$arp_line" ]; then
-                mac=$(echo "$arp_line" | awk '{print $2}')
-                vendor=$(echo "$arp_line" | cut -d$'\t' -f3- | sed 's/^[[:space:]]*//')
-                [ -z "$vendor" ] && vendor="-"
-            fi
-        fi
-        
-        # Get ping time
-        ping_time=$(ping -c 1 -W 1 "$ip" 2>/dev/null | grep "time=" | sed -n 's/.*time=\([0-9.]*\).*/\1/p')
-        [ -z "$ping_time" ] && ping_time="-"
-        [ -n "$ping_time" ] && ping_time="${ping_time}ms"
-        
-        # Quick port scan on top 10 common ports
-        ports="-"
-        open_ports=$(nmap -p "$TOP_PORTS" --open -T4 --max-retries 1 --host-timeout 3s "$ip" 2>/dev/null | grep "^[0-9]" | grep "open" | awk '{print $1}' | cut -d/ -f1 | tr '\n' ',' | sed 's/,$//')
-        [ -n "$open_ports" ] && ports="$open_ports"
-        
-        # Output in parseable format with | delimiter: LIVE|IP|HOSTNAME|MAC|VENDOR|PORTS|PING
-        echo "LIVE|$ip|$hostname|$mac|$vendor|$ports|$ping_time" | tee -a "$LOG_FILE" 2>&1
-        
-    done < "$RAM_FILE"
-fi
+# Output in parseable format with | delimiter: LIVE|IP|HOSTNAME|MAC|VENDOR|PORTS|PING
+# (with --services followed by SERVICE|IP|PORT|NAME|DETAIL per open port, and
+# IPV6|IP|ADDRESSES for hosts with IPv6 addresses)
+python3 "$SCRIPT_DIR/$SCANNER" "${SCAN_OPTS[@]}" "${SUBNETS[@]}" 2>&1
 
 # --- Cleanup ---
-END_TIME=$(date +%s)
-DURATION=$((END_TIME - START_TIME))
+DURATION=$((SECONDS - START_TIME))
 
-[ -f "$RAM_FILE" ] && rm "$RAM_FILE"
-[ -f "$ARP_DATA" ] && rm "$ARP_DATA"
 
 log_info "=== Scan Finished in $DURATION seconds ==="
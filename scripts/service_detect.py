@@ -0,0 +1,333 @@
+"""service_detect.py — Service and banner identification for open ports
+
+Names what listens on an open TCP port with one short connection. Protocols
+whose server speaks first (SSH, FTP, SMTP, POP3, IMAP, MySQL) are named from
+their greeting; HTTP, TLS and RDP from the answer to a minimal probe sent
+right after connecting. Ports with no known protocol get a moment to greet
+before an HTTP probe is tried. At most `concurrency` connections are open at
+once and each has a fixed time budget for connect, probe and reads together.
+Fingerprints are cached by (MAC, port), so rescanning a device does not
+connect again to services already identified (scan_store.py keeps them
+between scans).
+
+Usage: python3 scripts/service_detect.py [--threads N] [--timeout MS] HOST:PORT [HOST:PORT ...]
+       Prints one SERVICE|IP|PORT|NAME|DETAIL line per port.
+"""
+import argparse
+import asyncio
+import os
+import re
+import struct
+import sys
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Identification connections open at once, and each one's time budget in seconds
+DEFAULT_CONCURRENCY = 32
+DEFAULT_BUDGET = 2.0
+
+# Seconds a port with no known protocol may take to greet before it gets an HTTP probe
+GREETING_WAIT = 0.5
+
+# Bytes kept from an answer: enough for a banner, HTTP headers or a ServerHello
+READ_SIZE = 2048
+
+# Longest product/version detail kept from a banner
+MAX_DETAIL = 40
+
+UNKNOWN = "unknown"
+
+# Protocols whose server greets first, by well-known port
+GREETING_PORTS = {21: "ftp", 22: "ssh", 25: "smtp", 110: "pop3", 143: "imap", 587: "smtp", 3306: "mysql"}
+
+
+def _client_hello() -> bytes:
+    """TLS 1.2 ClientHello offering common suites; any TLS server answers it (or with an alert)."""
+    suites = [0x1301, 0x1302, 0x1303, 0xC02B, 0xC02F, 0xC02C, 0xC030, 0x009C, 0x009D, 0x002F, 0x0035]
+    extensions = b"".join([
+        struct.pack("!HHH3H", 0x000A, 8, 6, 0x001D, 0x0017, 0x0018),  # supported_groups
+        struct.pack("!HHBB", 0x000B, 2, 1, 0),  # ec_point_formats: uncompressed
+        struct.pack("!HHH6H", 0x000D, 14, 12, 0x0403, 0x0804, 0x0401, 0x0503, 0x0805, 0x0501),  # signature_algorithms
+    ])
+    body = (struct.pack("!H", 0x0303) + os.urandom(32) + b"\x00"
+            + struct.pack("!H", 2 * len(suites)) + struct.pack(f"!{len(suites)}H", *suites)
+            + b"\x01\x00" + struct.pack("!H", len(extensions)) + extensions)
+    handshake = b"\x01" + struct.pack("!I", len(body))[1:] + body
+    return b"\x16\x03\x01" + struct.pack("!H", len(handshake)) + handshake
+
+
+# Client-first protocols: the probe sent right after connecting, by well-known port
+HTTP_PROBE = b"HEAD / HTTP/1.0\r\n\r\n"
+TLS_PROBE = _client_hello()
+# TPKT + X.224 Connection Request with an RDP Negotiation Request (TLS and CredSSP)
+RDP_PROBE = bytes.fromhex("030000130ee000000000000100080003000000")
+PROBES = {
+    80: ("http", HTTP_PROBE), 8000: ("http", HTTP_PROBE), 8008: ("http", HTTP_PROBE),
+    8080: ("http", HTTP_PROBE), 8888: ("http", HTTP_PROBE),
+    443: ("tls", TLS_PROBE), 465: ("tls", TLS_PROBE), 636: ("tls", TLS_PROBE),
+    993: ("tls", TLS_PROBE), 995: ("tls", TLS_PROBE), 8443: ("tls", TLS_PROBE),
+    3389: ("rdp", RDP_PROBE),
+}
+
+_TLS_VERSIONS = {0x0300: "SSLv3", 0x0301: "TLSv1.0", 0x0302: "TLSv1.1", 0x0303: "TLSv1.2", 0x0304: "TLSv1.3"}
+# RDP negotiation response: selected security protocol
+_RDP_SECURITY = {0: "RDP security", 1: "TLS", 2: "NLA", 8: "NLA"}
+
+IdentifiedCallback = Callable[[str, int, str], None]
+
+
+def _clean(text: str) -> str:
+    """Printable detail without the separators of the Service column, LIVE lines and CSV."""
+    text = re.sub(r"\[[^\]]*\]", " ", text)  # IMAP capability lists and the like
+    text = "".join(c if c.isprintable() and c not in "|,;" else " " for c in text)
+    return " ".join(text.split())[:MAX_DETAIL].strip()
+
+
+def _fingerprint(name: str, detail: str = "") -> str:
+    detail = _clean(detail)
+    return f"{name} {detail}" if detail else name
+
+
+def _tls(data: bytes) -> Optional[str]:
+    if len(data) < 6 or data[0] not in (0x15, 0x16) or data[1] != 0x03:
+        return None
+    if data[0] == 0x15 or data[5] != 0x02:
+        return "tls"  # Alert (e.g. no common cipher) or some other handshake message: still TLS
+    version = None  # ServerHello cut short before its version
+    try:
+        version = struct.unpack_from("!H", data, 9)[0]
+        offset = 43 + data[43] + 1 + 3  # session id, cipher suite, compression
+        end = min(len(data), offset + 2 + struct.unpack_from("!H", data, offset)[0])
+        offset += 2
+        while offset + 4 <= end:
+            kind, size = struct.unpack_from("!HH", data, offset)
+            if kind == 0x002B and size == 2:  # supported_versions: the version really negotiated
+                version = struct.unpack_from("!H", data, offset + 4)[0]
+            offset += 4 + size
+    except (IndexError, struct.error):
+        pass
+    return _fingerprint("tls", _TLS_VERSIONS.get(version, ""))
+
+
+def _rdp(data: bytes) -> Optional[str]:
+    # TPKT version 3, then an X.224 Connection Confirm
+    if len(data) < 11 or data[0] != 0x03 or data[5] != 0xD0:
+        return None
+    if len(data) >= 19 and data[11] == 0x02:
+        return _fingerprint("rdp", _RDP_SECURITY.get(struct.unpack_from("<I", data, 15)[0], ""))
+    return "rdp"
+
+
+def _mysql(data: bytes, hint: Optional[str]) -> Optional[str]:
+    # 3-byte length, sequence 0, then protocol 10 and a NUL-terminated server version
+    if len(data) < 6 or data[3] != 0:
+        return None
+    if data[4] == 0x0A:
+        version, _, _ = data[5:].partition(b"\x00")
+        if version and all(32 <= b < 127 for b in version):
+            return _fingerprint("mysql", version.decode("ascii"))
+    if data[4] == 0xFF and hint == "mysql":
+        return "mysql"  # Error packet, e.g. this host is not allowed to connect
+    return None
+
+
+def _text(data: bytes, hint: Optional[str]) -> Optional[str]:
+    text = data.decode("latin-1")
+    line = text.split("\n", 1)[0].strip()
+    if line.startswith("SSH-"):
+        parts = line.split("-", 2)
+        return _fingerprint("ssh", parts[2] if len(parts) > 2 else "")
+    if line.startswith("HTTP/"):
+        server = re.search(r"^server:[ \t]*(.*)$", text, re.IGNORECASE | re.MULTILINE)
+        return _fingerprint("http", server.group(1) if server else "")
+    if line.startswith("+OK"):
+        return _fingerprint("pop3", line[3:])
+    if line.startswith("* OK"):
+        return _fingerprint("imap", line[4:])
+    if line.startswith("220"):
+        upper = line.upper()
+        if "SMTP" in upper or "MAIL" in upper:
+            name = "smtp"
+        elif "FTP" in upper:
+            name = "ftp"
+        else:
+            name = hint if hint in ("ftp", "smtp") else "ftp"
+        return _fingerprint(name, line[4:])
+    if line and all(c.isprintable() or c in "\r\t" for c in line):
+        return _fingerprint(hint or UNKNOWN, line)
+    return None
+
+
+def classify(port: int, data: bytes) -> str:
+    """Fingerprint ("name" or "name detail") of the answer `data` read from `port`."""
+    hint = GREETING_PORTS.get(port) or PROBES.get(port, (None,))[0]
+    if data:
+        for parse in (_tls, _rdp):
+            found = parse(data)
+            if found:
+                return found
+        found = _mysql(data, hint) or _text(data, hint)
+        if found:
+            return found
+    # Nothing recognisable: the usual protocol of the port, marked as a guess
+    return f"{hint}?" if hint else UNKNOWN
+
+
+def identified(fingerprint: str) -> bool:
+    """Whether a fingerprint comes from the service's own answer rather than its port number."""
+    name = fingerprint.split(" ", 1)[0]
+    return name != UNKNOWN and not name.endswith("?")
+
+
+def format_services(services: Dict[int, str]) -> str:
+    """Format a host's fingerprints for the Service column: "22/ssh OpenSSH_9.6, 80/http nginx", or "-"."""
+    if not services:
+        return "-"
+    return ", ".join(f"{port}/{services[port]}" for port in sorted(services))
+
+
+def parse_services(value: str) -> Dict[int, str]:
+    """Inverse of format_services()."""
+    services: Dict[int, str] = {}
+    for item in (value or "").split(", "):
+        port, _, fingerprint = item.partition("/")
+        if port.isdigit() and fingerprint:
+            services[int(port)] = fingerprint
+    return services
+
+
+class ServiceDetector:
+    """Identifies services on open ports with a strict limit on open connections.
+
+    At most `concurrency` identifications run at once, across all hosts, and
+    each connection gets `budget` seconds for connecting, probing and reading
+    together; a port that says nothing recognisable in that time is named
+    after its well-known protocol with a "?" (or "unknown"). Identified
+    fingerprints are kept in `cache` by (MAC, port), pre-filled with those
+    of earlier scans, and reported to `on_identified(mac, port, fingerprint)`
+    so they can be stored; hosts with no known MAC are always probed.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, budget: float = DEFAULT_BUDGET,
+                 cache: Optional[Dict[Tuple[str, int], str]] = None):
+        self.concurrency = max(1, int(concurrency))
+        self.budget = max(0.1, float(budget))
+        self.cache: Dict[Tuple[str, int], str] = dict(cache or {})
+        self.on_identified: Optional[IdentifiedCallback] = None
+        self.cache_hits = 0
+        self.probed = 0
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop = None
+        self.control = None  # Optional ScanControl: waited on before each connection
+        self.metrics = None  # Optional ScanMetrics: counts connections, answers and connections open
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # One per event loop, as in PortScanner
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._sem_loop is not loop:
+            self._sem = asyncio.Semaphore(self.concurrency)
+            self._sem_loop = loop
+        return self._sem
+
+    async def identify(self, ip: str, port: int, mac: str = "-") -> str:
+        """Fingerprint of the service on ip:port, from the cache if this device's port was identified before."""
+        if mac != "-" and (mac, port) in self.cache:
+            self.cache_hits += 1
+            return self.cache[(mac, port)]
+        async with self._semaphore():
+            if self.control:
+                await self.control.wait()
+            fingerprint = classify(port, await self._exchange(ip, port))
+        self.probed += 1
+        if mac != "-" and identified(fingerprint):
+            self.cache[(mac, port)] = fingerprint
+            if self.on_identified:
+                self.on_identified(mac, port, fingerprint)
+        return fingerprint
+
+    async def identify_host(self, ip: str, ports: Iterable[int], mac: str = "-") -> Dict[int, str]:
+        ports = list(ports)
+        return dict(zip(ports, await asyncio.gather(*(self.identify(ip, port, mac) for port in ports))))
+
+    async def _exchange(self, ip: str, port: int) -> bytes:
+        """Connect, send the port's probe (if the server does not speak first) and read the answer."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget
+        if self.metrics:
+            self.metrics.inc("ipscan_probes_sent_total", probe="service")
+            self.metrics.add("ipscan_probes_in_flight", 1, probe="service")
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.budget)
+            probe = PROBES.get(port, (None, None))[1]
+            if probe is None:
+                wait = self.budget if port in GREETING_PORTS else GREETING_WAIT
+                data = await self._read(reader, min(deadline, loop.time() + wait))
+                if data or port in GREETING_PORTS:
+                    return data
+                probe = HTTP_PROBE  # Silent so far: maybe a web server on an odd port
+            writer.write(probe)
+            await writer.drain()
+            return await self._read(reader, deadline)
+        except (asyncio.TimeoutError, OSError):
+            return b""
+        finally:
+            if writer is not None:
+                writer.close()
+            if self.metrics:
+                self.metrics.add("ipscan_probes_in_flight", -1, probe="service")
+
+    async def _read(self, reader: asyncio.StreamReader, deadline: float) -> bytes:
+        """What arrives before `deadline`: the first chunk, or HTTP headers up to the blank line."""
+        loop = asyncio.get_running_loop()
+        data = b""
+        while len(data) < READ_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(READ_SIZE - len(data)), remaining)
+            except (asyncio.TimeoutError, OSError):
+                break
+            if not chunk:
+                break
+            data += chunk
+            if not data.startswith(b"HTTP/") or b"\r\n\r\n" in data:
+                break
+        if data and self.metrics:
+            self.metrics.inc("ipscan_probe_replies_total", probe="service")
+        return data
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Identify the services on open TCP ports")
+    parser.add_argument("targets", nargs="+", help="HOST:PORT pairs, e.g. 192.168.0.1:22")
+    parser.add_argument("--threads", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Connections open at once (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--timeout", type=int, default=int(DEFAULT_BUDGET * 1000),
+                        help=f"Time budget per connection in ms (default: {int(DEFAULT_BUDGET * 1000)})")
+    args = parser.parse_args(argv)
+
+    targets: List[Tuple[str, int]] = []
+    for target in args.targets:
+        host, _, port = target.rpartition(":")
+        if not host or not port.isdigit() or not 1 <= int(port) <= 65535:
+            parser.error(f"Invalid target (expected HOST:PORT): {target}")
+        targets.append((host.strip("[]"), int(port)))
+
+    detector = ServiceDetector(concurrency=args.threads, budget=args.timeout / 1000.0)
+
+    async def run() -> None:
+        async def one(host: str, port: int) -> None:
+            fingerprint = await detector.identify(host, port)
+            name, _, detail = fingerprint.partition(" ")
+            # Format: SERVICE|IP|PORT|NAME|DETAIL
+            print(f"SERVICE|{host}|{port}|{name}|{detail or '-'}", flush=True)
+
+        await asyncio.gather(*(one(host, port) for host, port in targets))
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
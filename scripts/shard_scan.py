@@ -0,0 +1,520 @@
+"""shard_scan.py — Multi-process sharded scanning for large ranges
+
+Splits the ranges into address blocks (/24 by default) and scans them with
+one worker process per core, each running its own ICMP sweeper, ARP
+sweepers, RTT estimator and enrichment on its own event loop. Blocks are
+handed out by a work-stealing queue in shared memory: every worker starts
+with a contiguous run of blocks and, once its run is empty, steals the back
+half of the largest run left, so dense or slow blocks even out. Workers
+stream host events and their metrics back over one queue, and completed
+hosts are emitted in address order (block by block). Only IPv4 ranges are
+sharded; IPv6 hosts are found by an unsharded scan's NDP discovery.
+
+Usage: python3 scripts/shard_scan.py [--workers N] [--block-prefix N] [--threads N] [--timeout MS] [--fixed-timeout]
+                                     [--ports LIST | --no-ports] [--syn] [--syn-rate PPS] [--services] [--arp-rate PPS]
+                                     [--store [FILE]] [--incremental]
+                                     [--resume] [--metrics-file FILE] [--log-file FILE] [--debug] RANGE [RANGE ...]
+       Prints one LIVE|IP|HOSTNAME|MAC|VENDOR|PORTS|PING line per host, in address order
+       (with --services followed by one SERVICE|IP|PORT|NAME|DETAIL line per open port).
+       Done blocks are checkpointed; --resume continues a stopped scan of the same ranges.
+       --metrics-file keeps a Prometheus text file of every worker's metrics (see scan_metrics.py) up to date.
+       --log-file also appends the log lines to FILE, written in batches (see scan_log.py).
+"""
+import argparse
+import asyncio
+import bisect
+import ipaddress
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from arp_sweep import DEFAULT_RATE as DEFAULT_ARP_RATE
+from discovery import (NEW, EventCallback, LogCallback, ScanControl, count_addresses, log_detection,
+                       open_syn_scanner, stream_scan)
+from enrichment import HostEnricher, format_live_line, format_service_lines
+from icmp_sweep import IcmpSweeper
+from port_scanner import parse_ports
+from range_router import outermost_ranges, split_families
+from rtt_estimator import RttEstimator
+from scan_checkpoint import ScanCheckpoint, open_checkpoint
+from scan_events import ScanProgress
+from scan_log import ScanLogger
+from scan_metrics import ScanMetrics, textfile_path
+from scan_store import DEFAULT_STORE, ScanStore
+from service_detect import ServiceDetector
+from syn_scan import DEFAULT_RATE as DEFAULT_SYN_RATE
+
+# Block size: one /24 per block matches the RTT estimator's subnets and ARP's reach
+BLOCK_PREFIX = 24
+
+# Ranges with at least this many addresses are sharded when workers are left on auto
+AUTO_SHARD_ADDRESSES = 1 << 14
+
+# Outstanding echo requests per worker; big sweeps are bound by waiting, not sending
+SHARD_CONCURRENCY = 2048
+
+# Seconds between checks of the shared pause flag / the result queue
+POLL_INTERVAL = 0.1
+
+# Messages taken off the result queue per hop to the event loop
+RESULT_BATCH = 512
+
+# Seconds between metrics reports of each worker to the parent
+METRICS_INTERVAL = 1.0
+
+
+def _no_log(message: str, level: str = "info") -> None:
+    pass
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on every platform
+        return os.cpu_count() or 1
+
+
+def auto_workers(ranges: List[str]) -> int:
+    """One worker per core for large ranges, a single in-process scan otherwise."""
+    if count_addresses(outermost_ranges(ranges)) < AUTO_SHARD_ADDRESSES:
+        return 1
+    return available_cores()
+
+
+class BlockPlan:
+    """Numbered address blocks covering the ranges, computed the same way in every process.
+
+    Block `i` is found by a binary search over each range's first block
+    number, so a /8 (65536 blocks) is never materialized. `pending` lists
+    the blocks left to scan: all of them, less the `done` ones of a resumed
+    scan; the queue hands out positions in it. IPv6 ranges are left out, as
+    they are not swept address by address (see ndp_sweep.py).
+    """
+
+    def __init__(self, ranges: List[str], prefix: int = BLOCK_PREFIX, done: Optional[Set[int]] = None):
+        self.ranges = split_families(outermost_ranges(ranges))[0]
+        self.prefix = prefix
+        self.done = done or set()
+        self._networks = [ipaddress.ip_network(r, strict=False) for r in self.ranges]
+        self._offsets: List[int] = []
+        self.total = 0
+        for network in self._networks:
+            self._offsets.append(self.total)
+            self.total += 1 << (self._block_prefix(network) - network.prefixlen)
+        self.addresses = count_addresses(self.ranges)
+        self.pending = [i for i in range(self.total) if i not in self.done] if self.done else range(self.total)
+
+    def _block_prefix(self, network) -> int:
+        return max(network.prefixlen, self.prefix)
+
+    def block(self, index: int) -> List[str]:
+        """CIDRs of block `index`, less the network/broadcast addresses of its range."""
+        r = bisect.bisect_right(self._offsets, index) - 1
+        network = self._networks[r]
+        prefix = self._block_prefix(network)
+        size = 1 << (network.max_prefixlen - prefix)
+        block = ipaddress.ip_network((int(network.network_address) + (index - self._offsets[r]) * size, prefix))
+        pieces = [block]
+        if network.num_addresses > 2:
+            for addr in (network.network_address, network.broadcast_address):
+                host = ipaddress.ip_network(addr)
+                pieces = [part for piece in pieces
+                          for part in (piece.address_exclude(host) if host.subnet_of(piece) else [piece])]
+        return [str(piece) for piece in sorted(pieces)]
+
+
+class BlockQueue:
+    """Work-stealing queue of block numbers shared by the worker processes.
+
+    Each worker owns a run [start, end) of block numbers and takes blocks
+    from its front. When its run is empty it steals the back half of the
+    largest remaining run. Runs are a few integers in shared memory under
+    one lock, so taking or stealing never moves any block lists around.
+    """
+
+    def __init__(self, total: int, workers: int, ctx=multiprocessing):
+        self.workers = workers
+        self._runs = ctx.RawArray("q", 2 * workers)
+        self._steals = ctx.RawValue("q", 0)
+        self._lock = ctx.Lock()
+        for w in range(workers):
+            self._runs[2 * w] = total * w // workers
+            self._runs[2 * w + 1] = total * (w + 1) // workers
+
+    @property
+    def steals(self) -> int:
+        return self._steals.value
+
+    def take(self, worker: int) -> Optional[int]:
+        """Next block for `worker`, stealing if its own run is empty; None when all blocks are taken."""
+        runs = self._runs
+        with self._lock:
+            start, end = runs[2 * worker], runs[2 * worker + 1]
+            if start < end:
+                runs[2 * worker] = start + 1
+                return start
+            victim = max(range(self.workers), key=lambda v: runs[2 * v + 1] - runs[2 * v])
+            left = runs[2 * victim + 1] - runs[2 * victim]
+            if left <= 0:
+                return None
+            split = runs[2 * victim + 1] - max(1, left // 2)
+            end = runs[2 * victim + 1]
+            runs[2 * victim + 1] = split
+            runs[2 * worker], runs[2 * worker + 1] = split + 1, end
+            self._steals.value += 1
+            return split
+
+
+# --- Worker process ---
+
+async def _scan_blocks(worker: int, plan: BlockPlan, blocks: BlockQueue, results, running,
+                       options: Dict[str, Any]) -> Dict[str, Any]:
+    timeout = options["timeout"]
+    threads = options["threads"]
+    rtt = RttEstimator(timeout=timeout, retries=2) if options["adaptive"] else None
+    sweeper = IcmpSweeper(concurrency=max(SHARD_CONCURRENCY, threads), timeout=timeout, retries=2, rtt=rtt)
+    control = ScanControl()
+    metrics = ScanMetrics()
+    store = ScanStore(options["store"]) if options["store"] else None
+    found_by: Dict[str, int] = {}
+    scanned = 0
+    reported = set()
+
+    def log(message: str, level: str = "info") -> None:
+        # Per-block progress would drown the parent's log; pass each distinct error once
+        if level == "error" and message not in reported:
+            reported.add(message)
+            results.put(("log", message, level))
+
+    detector = ServiceDetector(cache=store.fingerprints() if store is not None else None) \
+        if options["services"] and options["ports"] else None
+    syn_scanner = open_syn_scanner(options["syn_rate"], timeout, rtt, log) \
+        if options["syn"] and options["ports"] else None
+    enricher = HostEnricher(workers=threads, timeout=timeout, ports=options["ports"], pinger=sweeper, rtt=rtt,
+                            services=detector, port_scanner=syn_scanner)
+
+    def on_event(kind: str, ip: str, fields: Dict[str, str]) -> None:
+        results.put(("event", kind, ip, fields))
+
+    async def follow_pause() -> None:
+        while True:
+            if running.is_set() and control.paused:
+                control.resume()
+            elif not running.is_set() and not control.paused:
+                control.pause()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def report_metrics() -> None:
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            results.put(("metrics", worker, metrics.state()))
+
+    async def scan_next() -> None:
+        nonlocal scanned
+        while True:
+            position = blocks.take(worker)
+            if position is None:
+                return
+            index = plan.pending[position]
+            await control.wait()
+            hosts = await stream_scan(
+                plan.block(index), threads=threads, timeout=timeout, on_event=on_event,
+                control=control, log=log, arp_rate=options["arp_rate"], store=store,
+                incremental=options["incremental"], sweeper=sweeper, enricher=enricher,
+                nmap=False, whole=True, found_by=found_by, metrics=metrics,
+            )
+            records = sorted(hosts.values(), key=lambda host: ipaddress.ip_address(host["ip"]))
+            results.put(("block", position, index, records))
+            scanned += 1
+
+    watcher = asyncio.ensure_future(follow_pause())
+    reporter = asyncio.ensure_future(report_metrics())
+    try:
+        # Enough blocks in flight to keep the sweeper's probe window full; their enrichment
+        # shares the enricher's `threads` slots, so the process never enriches more hosts at once
+        await asyncio.gather(*(scan_next() for _ in range(max(2, sweeper.concurrency // 256))))
+    finally:
+        watcher.cancel()
+        reporter.cancel()
+        results.put(("metrics", worker, metrics.state()))
+        enricher.close()
+        sweeper.close()
+        if syn_scanner is not None:
+            syn_scanner.close()
+        if store is not None:
+            store.close()
+    return {"blocks": scanned, "found_by": found_by, "rtt": rtt.metrics() if rtt else None}
+
+
+def _worker(worker: int, ranges: List[str], prefix: int, done: Set[int], blocks: BlockQueue, results, running,
+            options: Dict[str, Any]) -> None:
+    """Worker process entry point: scan blocks until none are left, then report its totals."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl-C and stops workers
+    stats: Dict[str, Any] = {"blocks": 0, "found_by": {}, "rtt": None}
+    try:
+        plan = BlockPlan(ranges, prefix, done)
+        stats = asyncio.run(_scan_blocks(worker, plan, blocks, results, running, options))
+    except Exception as e:
+        results.put(("log", f"Shard worker {worker} failed: {e}", "error"))
+    finally:
+        results.put(("done", worker, stats))
+
+
+# --- Parent ---
+
+def _get_batch(results) -> List[Tuple]:
+    """Up to RESULT_BATCH messages, waiting at most POLL_INTERVAL for the first."""
+    try:
+        batch = [results.get(timeout=POLL_INTERVAL)]
+    except queue_module.Empty:
+        return []
+    while len(batch) < RESULT_BATCH:
+        try:
+            batch.append(results.get_nowait())
+        except queue_module.Empty:
+            break
+    return batch
+
+
+async def sharded_scan(ranges: List[str], workers: int = 0, threads: int = 50, timeout: float = 1.0,
+                       ports: Optional[List[int]] = None, on_event: Optional[EventCallback] = None,
+                       on_host: Optional[Callable[[Dict[str, str]], None]] = None,
+                       control: Optional[ScanControl] = None,
+                       log: LogCallback = _no_log,
+                       arp_rate: int = DEFAULT_ARP_RATE,
+                       store: Optional[ScanStore] = None,
+                       incremental: bool = False,
+                       adaptive: bool = True,
+                       block_prefix: int = BLOCK_PREFIX,
+                       checkpoint: Optional[ScanCheckpoint] = None,
+                       metrics: Optional[ScanMetrics] = None,
+                       progress: Optional[ScanProgress] = None,
+                       services: bool = False,
+                       syn: bool = False,
+                       syn_rate: int = DEFAULT_SYN_RATE) -> Dict[str, Dict[str, str]]:
+    """Scan `ranges` block by block over `workers` processes (0: one per core).
+
+    Takes the same callbacks and options as stream_scan(). on_event fires as
+    workers report hosts; on_host fires in address order once every earlier
+    block is done. Workers save hosts to their own connection to `store`'s
+    file. Nmap discovery is left out: its per-process start-up cost does not
+    fit thousands of blocks. Done blocks and their hosts are saved to
+    `checkpoint`; resuming from it reports the saved hosts first and scans
+    only the other blocks (blocks that were in flight start over). Each
+    worker's metrics are merged into `metrics` about once a second, and the
+    time the workers run counts as phase "shards". Each done block's
+    addresses are counted in `progress`. Returns all host records by IP.
+    """
+    hosts: Dict[str, Dict[str, str]] = {}
+    done_blocks: Set[int] = set()
+    if checkpoint is not None:
+        if checkpoint.block_prefix == block_prefix:
+            done_blocks = checkpoint.blocks
+        checkpoint.block_prefix, checkpoint.blocks = block_prefix, done_blocks
+        for ip in sorted(checkpoint.completed, key=ipaddress.ip_address):
+            hosts[ip] = checkpoint.hosts[ip]
+            if on_event:
+                on_event(NEW, ip, dict(hosts[ip]))
+            if on_host:
+                on_host(dict(hosts[ip]))
+        checkpoint.hosts = dict(hosts)  # Hosts still waiting for enrichment are found again
+    restored = len(hosts)
+    plan = BlockPlan(ranges, block_prefix, done_blocks)
+    skipped = split_families(ranges)[1]
+    if skipped:
+        log(f"Skipping {', '.join(skipped)}: IPv6 ranges are discovered by unsharded scans (one worker)", "error")
+    metrics = metrics if metrics is not None else ScanMetrics()
+    if progress is not None:
+        for index in done_blocks:
+            progress.block_done(plan.block(index))
+    workers = max(1, min(workers or available_cores(), len(plan.pending)))
+    ctx = multiprocessing.get_context("spawn")  # Forking a threaded parent (the TUI) is unsafe
+    blocks = BlockQueue(len(plan.pending), workers, ctx)
+    results = ctx.Queue()
+    running = ctx.Event()
+    running.set()
+    options = {
+        "threads": threads, "timeout": timeout, "ports": ports, "arp_rate": arp_rate,
+        "store": store.path if store is not None else None, "incremental": incremental,
+        "adaptive": adaptive, "services": services, "syn": syn, "syn_rate": syn_rate,
+    }
+    log(f"Sharding {plan.addresses} addresses into {plan.total} blocks of /{block_prefix} "
+        f"over {workers} worker processes{f', {len(plan.pending)} blocks left' if done_blocks else ''}...",
+        "info")
+    procs = [ctx.Process(target=_worker,
+                         args=(w, plan.ranges, block_prefix, done_blocks, blocks, results, running, options),
+                         name=f"shard-{w}", daemon=True)
+             for w in range(workers)]
+    start = time.monotonic()
+    for proc in procs:
+        proc.start()
+
+    loop = asyncio.get_running_loop()
+    finished: Dict[int, List[Dict[str, str]]] = {}  # Done blocks waiting for earlier ones, by position
+    next_block = 0
+    done: Dict[int, Dict[str, Any]] = {}
+
+    def emit(records: List[Dict[str, str]]) -> None:
+        for record in records:
+            hosts[record["ip"]] = record
+            if on_host:
+                on_host(dict(record))
+
+    def handle(message: Tuple) -> None:
+        nonlocal next_block
+        kind = message[0]
+        if kind == "event":
+            if on_event:
+                on_event(*message[1:])
+        elif kind == "block":
+            _, position, index, records = message
+            finished[position] = records
+            if checkpoint is not None:
+                checkpoint.block_done(index, records)
+            if progress is not None:
+                progress.block_done(plan.block(index))
+            while next_block in finished:
+                emit(finished.pop(next_block))
+                next_block += 1
+        elif kind == "metrics":
+            metrics.merge(message[1], message[2])
+        elif kind == "log":
+            log(message[1], message[2])
+        elif kind == "done":
+            done[message[1]] = message[2]
+
+    async def follow_pause() -> None:
+        while True:
+            if control is not None and control.paused:
+                running.clear()
+            else:
+                running.set()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    watcher = asyncio.ensure_future(follow_pause())
+    saver = asyncio.ensure_future(checkpoint.autosave(log)) if checkpoint is not None else None
+    completed = False
+    try:
+        with metrics.phase("shards"):
+            while len(done) < workers:
+                batch = await loop.run_in_executor(None, _get_batch, results)
+                for message in batch:
+                    handle(message)
+                if not batch:
+                    for w, proc in enumerate(procs):
+                        if w not in done and proc.exitcode is not None:
+                            log(f"Shard worker {w} exited with status {proc.exitcode}", "error")
+                            done[w] = {"blocks": 0, "found_by": {}, "rtt": None}
+        for position in sorted(finished):  # Blocks left behind a worker that died
+            emit(finished.pop(position))
+        completed = len(checkpoint.blocks) == plan.total if checkpoint is not None else True
+    finally:
+        watcher.cancel()
+        if saver is not None:
+            saver.cancel()
+            checkpoint.close(completed, log)
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in procs:
+            proc.join(1.0)
+            if proc.is_alive():
+                proc.kill()
+
+    found_by: Dict[str, int] = {}
+    rtt_metrics: Optional[Dict[str, Dict[str, float]]] = {} if adaptive else None
+    for stats in done.values():
+        for name, count in stats["found_by"].items():
+            found_by[name] = found_by.get(name, 0) + count
+        if rtt_metrics is not None and stats["rtt"]:
+            rtt_metrics.update(stats["rtt"])
+    log(f"Shards: {workers} workers, {blocks.steals} steals, blocks per worker "
+        f"{'/'.join(str(done[w]['blocks']) for w in sorted(done))}", "debug")
+    log_detection(plan.addresses, len(hosts), found_by, time.monotonic() - start,
+                  dict(sorted(rtt_metrics.items())) if rtt_metrics is not None else None, log,
+                  earlier=restored)
+    return dict(sorted(hosts.items(), key=lambda item: ipaddress.ip_address(item[0])))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sharded multi-process host discovery and enrichment")
+    parser.add_argument("ranges", nargs="+", help="CIDR ranges to scan")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: one per core)")
+    parser.add_argument("--block-prefix", type=int, default=BLOCK_PREFIX,
+                        help=f"Block size as an IPv4 prefix length (default: {BLOCK_PREFIX})")
+    parser.add_argument("--threads", type=int, default=50, help="Hosts enriched in parallel per worker (default: 50)")
+    parser.add_argument("--timeout", type=int, default=1000, help="Probe timeout in ms (default: 1000)")
+    parser.add_argument("--fixed-timeout", action="store_true",
+                        help="Always wait the full timeout instead of adapting it to measured RTTs")
+    parser.add_argument("--ports", default="top", help="Port list, e.g. 22,80,8000-8100 (default: top 10)")
+    parser.add_argument("--no-ports", action="store_true", help="Skip port scanning")
+    parser.add_argument("--syn", action="store_true", help="Scan ports half-open from a raw socket (needs root)")
+    parser.add_argument("--syn-rate", type=int, default=DEFAULT_SYN_RATE,
+                        help=f"SYNs per second per worker with --syn (default: {DEFAULT_SYN_RATE})")
+    parser.add_argument("--services", action="store_true", help="Identify the service on each open port")
+    parser.add_argument("--arp-rate", type=int, default=DEFAULT_ARP_RATE,
+                        help=f"ARP frames per second per interface and worker (default: {DEFAULT_ARP_RATE})")
+    parser.add_argument("--store", nargs="?", const=DEFAULT_STORE, metavar="FILE",
+                        help=f"Save results to a SQLite store (default file: {DEFAULT_STORE})."
+                             " A range right after a bare --store is taken as FILE: name FILE or put the ranges first.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse fresh stored hostname/vendor/ports/services for unchanged hosts (implies --store)")
+    parser.add_argument("--resume", action="store_true", help="Continue a stopped or crashed scan of these ranges")
+    parser.add_argument("--metrics-file", metavar="FILE", default=textfile_path(),
+                        help="Write scan metrics to this Prometheus text file while scanning "
+                             "(default: $IP_SCANNER_METRICS or the node_exporter textfile collector)")
+    parser.add_argument("--log-file", metavar="FILE",
+                        help="Also append log lines to FILE (written in batches by a background thread)")
+    parser.add_argument("--debug", action="store_true", help="Verbose logging")
+    args = parser.parse_args(argv)
+
+    try:
+        for subnet in args.ranges:
+            ipaddress.ip_network(subnet, strict=False)
+        ports = None if args.no_ports else parse_ports(args.ports)
+    except ValueError as e:
+        parser.error(str(e))
+    if not 8 <= args.block_prefix <= 32:
+        parser.error("--block-prefix must be between 8 and 32")
+
+    try:
+        log = ScanLogger(debug=args.debug, stream=sys.stdout, path=args.log_file)
+    except OSError as e:
+        parser.error(f"cannot write log file: {e}")
+
+    def report(host: Dict[str, str]) -> None:
+        print("\n".join([format_live_line(host)] + format_service_lines(host)), flush=True)
+
+    checkpoint = open_checkpoint(args.ranges, ports, args.resume, log)
+    store = ScanStore(args.store or DEFAULT_STORE) if args.store or args.incremental else None
+    if store is not None:
+        store.begin_scan(args.ranges)
+    metrics = ScanMetrics()
+    try:
+        scan = sharded_scan(args.ranges, workers=args.workers, threads=args.threads,
+                            timeout=args.timeout / 1000.0, ports=ports, on_host=report, log=log,
+                            arp_rate=args.arp_rate, store=store, incremental=args.incremental,
+                            adaptive=not args.fixed_timeout, block_prefix=args.block_prefix,
+                            checkpoint=checkpoint, metrics=metrics, services=args.services,
+                            syn=args.syn, syn_rate=args.syn_rate)
+        hosts = asyncio.run(metrics.track_scan(scan, count_addresses(outermost_ranges(args.ranges)),
+                                               args.metrics_file, log))
+        if store is not None:
+            new, gone = store.finish_scan(hosts)
+            log(f"Since the last scan: {len(new)} new ({', '.join(new) or '-'}), "
+                f"{len(gone)} gone ({', '.join(gone) or '-'})", "info")
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if store is not None:
+            store.close()
+        log.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""syn_scan.py — Stateless half-open (SYN) port scanner on a raw socket
+
+Sends crafted TCP SYNs from one raw socket and never completes a handshake:
+a SYN-ACK means open, a RST means closed, and the kernel answers the SYN-ACK
+with a RST since no local socket owns the source port. The sequence number of
+every SYN is a keyed hash of the target address and port, so a reply is
+matched by checking its acknowledgment number alone (masscan-style), with no
+table of outstanding probes. Replies are classified by a separate receive
+path on the event loop. SYNs are paced at a global packets-per-second rate,
+and each host's answers are one bit-per-port array, so scanning every port
+of a host costs no more memory than scanning ten. Needs root (CAP_NET_RAW).
+
+Usage: python3 scripts/syn_scan.py [--ports LIST] [--rate PPS] [--timeout MS] [--retries N] [--threads N]
+                                   [--all] [host ...]
+       (hosts are read from stdin, one per line, when none are given)
+       Prints one PORT|IP|PORT|STATE line per open port (with --all, closed ports too).
+"""
+import argparse
+import asyncio
+import hashlib
+import ipaddress
+import os
+import random
+import socket
+import struct
+import sys
+from typing import Dict, Iterable, List, Optional
+
+from port_scanner import CLOSED, OPEN, PortScanner, ResultCallback, parse_ports
+from rtt_estimator import RttEstimator
+
+# Default send rate (SYNs per second, all hosts together)
+DEFAULT_RATE = 10000
+
+# Source ports are picked above Linux's ephemeral range (32768-60999) so
+# replies never hit a local connection
+SOURCE_PORTS = (61000, 65535)
+
+# Sends may run this far (seconds) ahead of the pace before sleeping, so
+# high rates do not mean one event-loop sleep per packet
+PACE_SLACK = 0.002
+
+_TCP_SYN = 0x02
+_TCP_RST = 0x04
+_TCP_ACK = 0x10
+_SYN_ACK = _TCP_SYN | _TCP_ACK
+
+# SYN with one option (MSS 1460), as most stacks send
+_SYN_HEADER = struct.Struct("!HHIIBBHHH")
+_MSS_OPTION = struct.pack("!BBH", 2, 4, 1460)
+_SYN_LENGTH = _SYN_HEADER.size + len(_MSS_OPTION)
+_REPLY_FIELDS = struct.Struct("!HHII")  # source port, destination port, sequence, acknowledgment
+
+# Per-host answer states, one byte per port
+_NO_ANSWER = 0
+_OPEN = 1
+_CLOSED = 2
+
+
+def _fold(total: int) -> int:
+    while total > 0xFFFF:
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+
+def source_address(ip: str) -> str:
+    """Local address the kernel routes to `ip` from (needed for the TCP checksum)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.connect((ip, 9))  # UDP connect sends nothing; it only picks a route
+        return probe.getsockname()[0]
+
+
+class _HostScan:
+    """Answers from one host being scanned: a state byte per port and a count of ports left."""
+
+    def __init__(self, ip: str, ports: List[int], on_result: Optional[ResultCallback]):
+        self.ip = ip
+        self.states = bytearray(65536)
+        self.left = len(ports)
+        self.sent = 0
+        self.on_result = on_result
+        self.done = asyncio.Event()
+        self.finished = asyncio.Event()  # Set once the scan stops listening for this host
+
+    def answer(self, port: int, state: int) -> bool:
+        """Record a port's answer; False if it had already answered (a duplicate)."""
+        if self.states[port] != _NO_ANSWER:
+            return False
+        self.states[port] = state
+        self.left -= 1
+        if self.on_result:
+            self.on_result(self.ip, port, OPEN if state == _OPEN else CLOSED)
+        if self.left <= 0:
+            self.done.set()
+        return True
+
+
+class SynScanner:
+    """Half-open scanner with a drop-in PortScanner interface.
+
+    SYNs are paced at `rate` per second across every host being scanned.
+    After sending a host's SYNs, the scanner waits `timeout` seconds (or the
+    host's adaptive timeout from an `rtt` estimator) for replies, then sends
+    again to the ports that stayed silent, as many times as the estimator
+    says (or `retries`). Ports that never answer are filtered; only ports
+    that answered are in a host's result. `concurrency` is the number of
+    hosts scan() works on at once. The raw socket is opened on construction
+    (PermissionError without root) and must be released with close(). SYNs
+    are IPv4 only: IPv6 hosts are scanned with TCP connects instead.
+    """
+
+    def __init__(self, rate: int = DEFAULT_RATE, timeout: float = 1.0, retries: int = 1,
+                 rtt: Optional[RttEstimator] = None, concurrency: int = 50):
+        self.rate = max(1, int(rate))
+        self.timeout = max(0.05, float(timeout))
+        self.retries = max(0, int(retries))
+        self.rtt = rtt
+        self.concurrency = max(1, int(concurrency))
+        self.source_port = random.randint(*SOURCE_PORTS)
+        self._key = os.urandom(16)
+        try:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        except PermissionError as e:
+            raise PermissionError("SYN scans need root (CAP_NET_RAW)") from e
+        self._sock.setblocking(False)
+        try:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        except OSError:
+            pass
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._hosts: Dict[bytes, _HostScan] = {}  # Packed address -> host waiting for answers
+        self._next_send = 0.0
+        self._connects: Optional[PortScanner] = None  # For IPv6 hosts, made on first use
+        self.control = None  # Optional ScanControl: waited on before each SYN
+        self.metrics = None  # Optional ScanMetrics: counts SYNs, answers and SYNs unanswered so far
+
+    def close(self) -> None:
+        if self._sock is None:
+            return
+        self._detach()
+        self._sock.close()
+        self._sock = None
+
+    def _attach(self) -> None:
+        # The receive path lives on the loop of the scan; the TUI runs each scan in a fresh loop
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._detach()
+        loop.add_reader(self._sock.fileno(), self._on_readable)
+        self._loop = loop
+        self._next_send = loop.time()
+
+    def _detach(self) -> None:
+        try:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(self._sock.fileno())
+        except (ValueError, RuntimeError):
+            pass
+        self._loop = None
+
+    def _cookie(self, address: bytes, port: int) -> int:
+        """Sequence number of the SYN to address:port (keyed, so replies cannot be forged blindly)."""
+        digest = hashlib.blake2s(address + port.to_bytes(2, "big"), digest_size=4, key=self._key).digest()
+        return int.from_bytes(digest, "big")
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                packet = self._sock.recv(128)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if len(packet) < 20:
+                continue
+            offset = (packet[0] & 0x0F) * 4
+            if len(packet) < offset + 14:
+                continue
+            port, destination, _, ack = _REPLY_FIELDS.unpack_from(packet, offset)
+            if destination != self.source_port:
+                continue  # Someone else's traffic
+            host = self._hosts.get(packet[12:16])
+            if host is None or ack != (self._cookie(packet[12:16], port) + 1) & 0xFFFFFFFF:
+                continue  # Late, or not an answer to one of our SYNs
+            flags = packet[offset + 13]
+            if flags & _SYN_ACK == _SYN_ACK:
+                state = _OPEN
+            elif flags & _TCP_RST:
+                state = _CLOSED
+            else:
+                continue
+            if host.answer(port, state) and self.metrics:
+                self.metrics.inc("ipscan_probe_replies_total", probe="syn")
+                self.metrics.add("ipscan_probes_in_flight", -1, probe="syn")
+
+    async def _pace(self) -> None:
+        """Wait for the next send slot; slots are shared by every host being scanned."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(self._next_send, now)  # No catching up in a burst after a pause
+        self._next_send = slot + 1.0 / self.rate
+        if slot - now > PACE_SLACK:
+            await asyncio.sleep(slot - now)
+
+    async def _send(self, packet: bytes, ip: str) -> None:
+        while True:
+            try:
+                self._sock.sendto(packet, (ip, 0))
+                return
+            except (BlockingIOError, InterruptedError):
+                await asyncio.sleep(0.001)  # TX queue full
+
+    async def _send_pass(self, host: _HostScan, ports: Iterable[int], source: bytes, target: bytes) -> None:
+        """One SYN to every port of `host` that has not answered yet."""
+        # Checksum of everything but the destination port and sequence number, summed once per host
+        base = sum(struct.unpack("!4H", source + target)) + socket.IPPROTO_TCP + _SYN_LENGTH
+        base += self.source_port + ((_SYN_LENGTH // 4) << 12 | _TCP_SYN) + 1024 + sum(struct.unpack("!2H", _MSS_OPTION))
+        for port in ports:
+            if host.states[port] != _NO_ANSWER:
+                continue
+            if self.control:
+                await self.control.wait()
+            await self._pace()
+            seq = self._cookie(target, port)
+            checksum = ~_fold(base + port + (seq >> 16) + (seq & 0xFFFF)) & 0xFFFF
+            packet = _SYN_HEADER.pack(self.source_port, port, seq, 0, (_SYN_LENGTH // 4) << 4, _TCP_SYN,
+                                      1024, checksum, 0) + _MSS_OPTION
+            await self._send(packet, host.ip)
+            host.sent += 1
+            if self.metrics:
+                self.metrics.inc("ipscan_probes_sent_total", probe="syn")
+                self.metrics.add("ipscan_probes_in_flight", 1, probe="syn")
+
+    async def scan_host(self, ip: str, ports: Iterable[int],
+                        on_result: Optional[ResultCallback] = None) -> Dict[int, str]:
+        """SYN-scan one host's ports; on_result(ip, port, state) is called as each answer arrives.
+
+        Returns the state of each port that answered; the others are filtered.
+        A host already being scanned (e.g. re-queued by the monitor) is
+        scanned again once that scan is over, as answers are told apart by
+        address only.
+        """
+        if ":" in ip:
+            if self._connects is None:
+                self._connects = PortScanner(concurrency=self.concurrency, timeout=self.timeout, rtt=self.rtt)
+            self._connects.control, self._connects.metrics = self.control, self.metrics
+            return await self._connects.scan_host(ip, ports, on_result)
+        self._attach()
+        ports = list(ports)
+        target = socket.inet_aton(ip)
+        source = socket.inet_aton(source_address(ip))
+        host = _HostScan(ip, ports, on_result)
+        if not ports:
+            return {}
+        while target in self._hosts:
+            await self._hosts[target].finished.wait()
+        self._hosts[target] = host
+        attempts = self.rtt.retries_for(ip) + 1 if self.rtt else self.retries + 1
+        try:
+            for attempt in range(attempts):
+                await self._send_pass(host, ports, source, target)
+                timeout = self.rtt.timeout(ip, attempt) if self.rtt else self.timeout
+                try:
+                    await asyncio.wait_for(host.done.wait(), timeout)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self._hosts.get(target) is host:
+                del self._hosts[target]
+            host.finished.set()
+            if self.metrics:
+                unanswered = host.sent - (len(ports) - host.left)
+                self.metrics.add("ipscan_probes_in_flight", -unanswered, probe="syn")
+        return {port: OPEN if state == _OPEN else CLOSED for port, state in enumerate(host.states) if state}
+
+    async def scan(self, hosts: Iterable[str], ports: Iterable[int],
+                   on_result: Optional[ResultCallback] = None) -> Dict[str, Dict[int, str]]:
+        """Scan all hosts x ports, `concurrency` hosts at a time, at the shared SYN rate."""
+        ports = list(ports)
+        pending = iter(hosts)
+        results: Dict[str, Dict[int, str]] = {}
+
+        async def worker():
+            for ip in pending:
+                results[ip] = await self.scan_host(ip, ports, on_result)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Half-open SYN port scanner (needs root)")
+    parser.add_argument("hosts", nargs="*", help="IPv4 hosts to scan (default: read from stdin)")
+    parser.add_argument("--ports", default="top", help="Port list, e.g. 22,80,8000-8100 or 1-65535 (default: top 10)")
+    parser.add_argument("--rate", type=int, default=DEFAULT_RATE, help=f"SYNs per second (default: {DEFAULT_RATE})")
+    parser.add_argument("--timeout", type=int, default=1000, help="Wait for answers after each pass, in ms (default: 1000)")
+    parser.add_argument("--retries", type=int, default=1, help="Extra passes for silent ports (default: 1)")
+    parser.add_argument("--threads", type=int, default=50, help="Hosts scanned at once (default: 50)")
+    parser.add_argument("--all", action="store_true", help="Print closed ports too")
+    args = parser.parse_args(argv)
+
+    try:
+        ports = parse_ports(args.ports)
+        hosts = args.hosts or [line.strip() for line in sys.stdin if line.strip()]
+        for ip in hosts:
+            ipaddress.IPv4Address(ip)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def report(ip: str, port: int, state: str) -> None:
+        if args.all or state == OPEN:
+            # Format: PORT|IP|PORT|STATE
+            print(f"PORT|{ip}|{port}|{state}", flush=True)
+
+    try:
+        scanner = SynScanner(rate=args.rate, timeout=args.timeout / 1000.0, retries=args.retries,
+                             concurrency=args.threads)
+    except PermissionError as e:
+        print(f"syn_scan: {e}", file=sys.stderr)
+        return 1
+    try:
+        asyncio.run(scanner.scan(hosts, ports, on_result=report))
+    finally:
+        scanner.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
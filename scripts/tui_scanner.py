@@ -1,17 +1,49 @@
 import asyncio
 import os
 import sys
-import threading
+import time
 import subprocess
-from datetime import datetime
+from collections import deque
 from textual.app import App, ComposeResult
-from textual.widgets import Header, Footer, Static, Button, DataTable, RichLog, Switch, Label, Input
+from textual.widgets import Header, Footer, Static, Button, RichLog, Switch, Label, Input, ProgressBar
 from textual.containers import Container, Horizontal, Vertical, VerticalScroll
 from textual import work
 from textual.message import Message
 from rich.text import Text
 import subprocess
 
+from dns_resolver import ReverseResolver
+from host_filter import HostFilter
+from host_store import NEW
+from host_table import HostTable
+from port_scanner import parse_ports
+from range_router import RangeRouter, parse_ranges
+from scan_checkpoint import checkpoint_path
+from scan_engine import ScanConfig, ScanEngine
+from scan_events import FIELD_UPDATE, HOST_DISCOVERED, HOST_STATE, PHASE_CHANGE, PROGRESS, STARTED
+from scan_log import ScanLogger
+from scan_metrics import describe_timing, textfile_path
+from scan_monitor import UP
+from scan_store import DEFAULT_STORE
+from ui_updates import UpdateCoalescer
+
+# How often queued scan results are applied to the tables and log (frames per second)
+UI_REFRESH_HZ = 15
+
+# Lines kept in the on-screen log (older ones scroll out), and where each session's log file goes
+LOG_LINES = 2000
+LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+
+# Up/down changes kept in the monitoring timeline, and waiting for the next frame (older ones are dropped)
+TIMELINE_LINES = 500
+
+# Seconds between refreshes of the scan stats panel (rates are per this interval)
+STATS_REFRESH = 1.0
+
+# Probe types shown in the stats panel: metrics label -> display name
+STATS_PROBES = (("icmp", "ICMP"), ("arp", "ARP"), ("tcp", "TCP"), ("syn", "SYN"), ("dns", "DNS"),
+                ("service", "Service"))
+
 class NetworkScannerTUI(App):
     """Enhanced TUI styled after Angry IP Scanner with port detection and device info."""
     
@@ -19,14 +51,27 @@ class NetworkScannerTUI(App):
         super().__init__()
         self._scan_active = False
         self._scan_paused = False
-        self._scan_threads = []
-        self._scan_process = None
-        self._live_hosts = {}
+        self._engine = None  # ScanEngine of the running (or last) scan
         self._pending_actions = []  # Queue of pending button actions
         self._selected_ip = None  # Current selected IP
         self._selected_hostname = None
         self._selected_mac = None
         self._selected_ports = None
+        # Hosts live in each table's columnar HostStore; the tables draw only the rows in view
+        self._tables = {}  # table_id -> HostTable, one per configured range
+        self._router = None  # RangeRouter mapping IPs to the table of their range
+        self._filter = None  # HostFilter from the filter bar, applied to every table (None: show all)
+        self._updates = UpdateCoalescer()  # Scan results waiting for the next UI frame
+        self._resolver = ReverseResolver()  # Reverse-DNS cache kept for the whole session
+        self._gone_hosts = set()  # Hosts from the last scan that did not answer this time
+        self._stats_previous = None  # Metrics snapshot of the last stats refresh, for rates
+        self._progress = {}  # range -> (addresses done, total) from progress events
+        self._phases = frozenset()  # Scan phases running now (replaced, never mutated)
+        self._scan_state = ""  # Last state of the "scan" phase
+        self._progress_shown = (0, 0, "")  # (done, total, detail) on the progress bar
+        self._log_widget = None  # RichLog, looked up once on mount
+        self._state_changes = deque(maxlen=TIMELINE_LINES)  # (time, ip, state) from host-state events
+        self._scan_log = ScanLogger(sinks=[self._write_log])  # Gets a session log file on mount
 
     CSS = """
     Screen {
@@ -67,6 +112,13 @@ class NetworkScannerTUI(App):
         margin-top: 1;
     }
     
+    #ports-row {
+        height: 3;
+        align: left middle;
+        width: 100%;
+        margin-top: 1;
+    }
+    
     .section-title {
         text-style: bold;
         color: $accent;
@@ -98,6 +150,19 @@ class NetworkScannerTUI(App):
         width: 100%;
     }
 
+    #filter-row {
+        height: 3;
+        align: left middle;
+        margin: 1 1 0 1;
+    }
+
+    #filter-status {
+        width: auto;
+        min-width: 24;
+        height: 3;
+        content-align: left middle;
+    }
+
     .network-container {
         height: auto;
         min-height: 10;
@@ -114,12 +179,63 @@ class NetworkScannerTUI(App):
         dock: top;
     }
 
-    #log-container {
+    #stats-container {
+        height: 7;
+        margin: 0 1;
+        border: solid $primary;
+        background: $panel;
+    }
+
+    .stats-title {
+        text-style: bold;
+        color: $primary;
+        padding: 0 1;
+    }
+
+    #scan-stats {
+        padding: 0 1;
+    }
+
+    #progress-row {
+        height: 1;
+        padding: 0 1;
+    }
+
+    #scan-progress {
+        width: 60;
+    }
+
+    #progress-detail {
+        width: 1fr;
+        color: $text-muted;
+    }
+
+    #bottom-row {
         height: 14;
         margin: 0 1 1 1;
+    }
+
+    #log-container {
+        width: 2fr;
+        height: 100%;
         border: solid $warning;
         background: $panel;
     }
+
+    #timeline-container {
+        width: 1fr;
+        height: 100%;
+        margin-left: 1;
+        border: solid $success;
+        background: $panel;
+    }
+
+    .timeline-title {
+        text-style: bold;
+        color: $success;
+        padding: 0 1;
+        background: $panel;
+    }
     
     .log-title {
         text-style: bold;
@@ -128,10 +244,6 @@ class NetworkScannerTUI(App):
         background: $panel;
     }
 
-    DataTable {
-        height: auto;
-    }
-
     RichLog {
         height: 1fr;
     }
@@ -186,6 +298,10 @@ class NetworkScannerTUI(App):
                 yield Input(value="50", placeholder="50", id="threads-input")
                 yield Label("Timeout:")
                 yield Input(value="1000", placeholder="1000", id="timeout-input")
+                yield Label("Adaptive:")
+                yield Switch(value=True, id="adaptive-switch")
+                yield Label("Incremental:")
+                yield Switch(value=False, id="incremental-switch")
                 yield Label("Debug:")
                 yield Switch(value=False, id="debug-switch")
         
@@ -201,7 +317,18 @@ class NetworkScannerTUI(App):
                 yield Label("🔹 Range 3:")
                 yield Input(value="", placeholder="Optional: e.g., 10.0.0.0/8", id="range3-input", classes="range-input")
                 yield Label("🔹 Range 4:")
-                yield Input(value="", placeholder="Optional: e.g., 172.16.0.0/12", id="range4-input", classes="range-input")
+                yield Input(value="", placeholder="Optional: e.g., 172.16.0.0/12 or fd00::/64", id="range4-input", classes="range-input")
+            with Horizontal(id="ports-row"):
+                yield Label("🔌 Ports:")
+                yield Input(value="22,80,443,3389,3306,8080,21,25,110,143", placeholder="e.g., 22,80,443 or 1-65535", id="ports-input", classes="range-input")
+                yield Label("SYN:")
+                yield Switch(value=False, id="syn-switch")
+                yield Label("Services:")
+                yield Switch(value=False, id="services-switch")
+                yield Label("Monitor:")
+                yield Switch(value=False, id="monitor-switch")
+                yield Label("IPv6:")
+                yield Switch(value=False, id="ipv6-switch")
         
         # Selected IP Actions Section
         with Container(id="selected-ip-actions"):
@@ -212,23 +339,42 @@ class NetworkScannerTUI(App):
                 yield Button("📋 Copy MAC", variant="default", id="action-copy-mac-btn")
                 yield Button("📋 Copy Ports", variant="default", id="action-copy-ports-btn")
         
-        # Results section - vertically stacked networks
-        with VerticalScroll(id="results-section"):
-            with Container(classes="network-container", id="network1-container"):
-                yield Static("🌐 Network: 192.168.0.0/24", classes="network-title", id="network1-title")
-                yield DataTable(id="results-table-1")
-            with Container(classes="network-container", id="network2-container"):
-                yield Static("🌐 Network: 192.168.8.0/24", classes="network-title", id="network2-title")
-                yield DataTable(id="results-table-2")
+        # Filter bar: narrows every results table as you type, answered from in-memory indexes
+        with Horizontal(id="filter-row"):
+            yield Label("🔎 Filter:")
+            yield Input(placeholder="e.g. port:22 vendor:cisco 10.1.0.0/16 rtt>50", id="filter-input")
+            yield Static("", id="filter-status")
         
-        # Log section - BIGGER
-        with Container(id="log-container"):
-            yield Static("═══ 📋 SCAN LOG ═══", classes="log-title")
-            yield RichLog(id="scan-log", wrap=True, highlight=True, markup=True)
+        # Results section - vertically stacked networks, one table per range (built on mount/scan)
+        yield VerticalScroll(id="results-section")
+        
+        # Live scan stats: probe rates, in-flight probes, queues, phase timings
+        with Container(id="stats-container"):
+            yield Static("═══ 📈 SCAN STATS ═══", classes="stats-title")
+            with Horizontal(id="progress-row"):
+                yield ProgressBar(total=1, id="scan-progress", show_eta=True)
+                yield Static("", id="progress-detail")
+            yield Static("No scan yet.", id="scan-stats")
+        
+        # Log section - BIGGER, with the monitoring timeline (hosts coming up or going down) beside it
+        with Horizontal(id="bottom-row"):
+            with Container(id="log-container"):
+                yield Static("═══ 📋 SCAN LOG ═══", classes="log-title")
+                yield RichLog(id="scan-log", wrap=True, highlight=True, markup=True, max_lines=LOG_LINES)
+            with Container(id="timeline-container"):
+                yield Static("═══ ⏱ MONITOR TIMELINE ═══", classes="timeline-title")
+                yield RichLog(id="timeline", wrap=False, max_lines=TIMELINE_LINES)
         
         yield Footer()
 
-    def on_mount(self) -> None:
+    async def on_mount(self) -> None:
+        self._log_widget = self.query_one("#scan-log", RichLog)
+        path = os.path.join(LOG_DIR, f"tui_{time.strftime('%Y-%m-%d_%H-%M-%S')}.log")
+        try:
+            self._scan_log = ScanLogger(path=path, sinks=[self._write_log])
+        except OSError as e:
+            self.log_message(f"⚠️ Cannot write log file {path}: {e}", "error")
+        
         # Check if running as root
         if os.geteuid() != 0:
             self.log_message("⚠️  WARNING: Not running as root. Some scans may fail.", "error")
@@ -236,34 +382,78 @@ class NetworkScannerTUI(App):
         else:
             self.log_message("✓ Running with sudo privileges.", "success")
         
-        # Setup tables with enhanced columns - Angry IP Scanner style
-        for table_id in ["results-table-1", "results-table-2"]:
-            table = self.query_one(f"#{table_id}", DataTable)
-            # Add columns with specific widths
-            table.add_column("IP", width=16)
-            table.add_column("Ping", width=10)
-            table.add_column("Hostname", width=25)
-            table.add_column("MAC", width=18)
-            table.add_column("Vendor", width=20)
-            table.add_column("Ports", width=30)
-            table.add_column("Copy", width=8)   # New copy column
-            table.add_column("Ping", width=8)   # New ping column
-            table.cursor_type = "row"  # Allow row selection
-            table.show_header = True
-            table.zebra_stripes = True
+        # One results table per configured range
+        try:
+            await self._setup_result_tables(self._read_ranges())
+        except ValueError as e:
+            await self._setup_result_tables([])
+            self.log_message(f"❌ Error: Invalid range: {e}", "error")
+        
+        # Scan threads never call into the UI directly; queued results are applied in batches
+        self.set_interval(1 / UI_REFRESH_HZ, self._flush_updates)
+        self.set_interval(STATS_REFRESH, self._refresh_stats)
         
         self.log_message("✓ Scanner Ready. Configure ranges and press Start.", "success")
-        self.log_message("📊 Scanning top 10 ports: 22,80,443,3389,3306,8080,21,25,110,143", "info")
+        self.log_message("🌐 Each range gets its own table; a range field may hold several CIDRs (e.g. 10.0.0.0/8, 10.1.0.0/16)", "info")
+        self.log_message("📊 Port list is editable (e.g. 22,80,443 or 1-1024), default is the top 10 ports", "info")
         self.log_message("💡 Tip: Click IP row, then press 'c' to copy or Shift+P to ping", "info")
+        self.log_message("↕️ Sort a table by clicking IP, Ping, Vendor or Ports (again to reverse), or press i/t/v/o", "info")
+        self.log_message("🔎 Filter the tables as you type, e.g. port:3389, vendor:hikvision, 10.1.0.0/16, rtt>50", "info")
+        self.log_message("⏱ With Monitor on, the ranges are watched after the scan until Stop; "
+                         "hosts coming up or going down show in the timeline", "info")
+        self.log_message("🧭 With IPv6 on (or an IPv6 range such as fd00::/64), IPv6 hosts are found through NDP; "
+                         "a device's IPv6 addresses fill the IPv6 column of its IPv4 row", "info")
+        if self._resumable():
+            self.log_message("💾 A stopped scan of these ranges can be continued: press Resume", "info")
+        self.update_buttons("idle")
+
+    def on_unmount(self) -> None:
+        self._scan_log.close()
+
+    def on_switch_changed(self, event: Switch.Changed) -> None:
+        if event.switch.id == "debug-switch":
+            self._scan_log.set_debug(event.value)
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        if event.input.id == "filter-input":
+            self._apply_filter(event.value)
+
+    def _apply_filter(self, query: str) -> None:
+        """Filter every results table by a query from the filter bar (a malformed one is reported, not applied)."""
+        try:
+            host_filter = HostFilter(query)
+        except ValueError as e:
+            self.query_one("#filter-status", Static).update(Text(f"⚠️ {e}", style="bold red"))
+            return
+        self._filter = host_filter if host_filter else None
+        for table in self._tables.values():
+            table.set_filter(self._filter)
+        self._show_filter_status()
+
+    def _show_filter_status(self) -> None:
+        """Show how many hosts the filter matches, over all tables."""
+        text = ""
+        if self._filter is not None:
+            shown = sum(table.store.shown for table in self._tables.values())
+            total = sum(len(table.store) for table in self._tables.values())
+            text = f"{shown:,} of {total:,} hosts"
+        try:
+            self.query_one("#filter-status", Static).update(text)
+        except Exception:
+            pass  # App is shutting down
 
     def log_message(self, message: str, level: str = "info") -> None:
-        """Log a message with appropriate styling based on level."""
+        """Log a message to the screen and the session log file (debug only in debug mode)."""
+        self._scan_log(message, level)
+
+    def _write_log(self, message: str, level: str) -> None:
+        """Show a log message with styling based on its level."""
         try:
-            log = self.query_one("#scan-log", RichLog)
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            
+            log = self._log_widget
+            if log is None:
+                return  # Not mounted yet; the log file still gets it
             text = Text()
-            text.append(f"[{timestamp}] ", style="dim cyan")
+            text.append(f"[{self._scan_log.timestamp()}] ", style="dim cyan")
             
             if "[DEBUG]" in message or level == "debug":
                 text.append(message, style="dim italic")
@@ -287,18 +477,12 @@ class NetworkScannerTUI(App):
         """Copy selected IP from active table to clipboard"""
         try:
             # Try to find focused table
-            for table_id in ["results-table-1", "results-table-2"]:
+            for table_id in list(self._tables):
                 try:
-                    table = self.query_one(f"#{table_id}", DataTable)
-                    if table.rows:
-                        # Get cursor row
-                        row_idx = table.cursor_row
-                        if row_idx >= 0 and row_idx < len(table.rows):
-                            row_key = list(table.rows.keys())[row_idx]
-                            ip_cell = table.get_row(row_key)[0]
-                            ip = ip_cell.replace("🔗 ", "").strip()
-                            self.copy_ip_to_clipboard(ip)
-                            return
+                    ip = self._tables[table_id].cursor_ip
+                    if ip:
+                        self.copy_ip_to_clipboard(ip)
+                        return
                 except Exception as ex:
                     self.log_message(f"Table error: {ex}", "debug")
                     continue
@@ -310,18 +494,12 @@ class NetworkScannerTUI(App):
         """Ping selected IP in external terminal"""
         try:
             # Try to find focused table
-            for table_id in ["results-table-1", "results-table-2"]:
+            for table_id in list(self._tables):
                 try:
-                    table = self.query_one(f"#{table_id}", DataTable)
-                    if table.rows:
-                        # Get cursor row
-                        row_idx = table.cursor_row
-                        if row_idx >= 0 and row_idx < len(table.rows):
-                            row_key = list(table.rows.keys())[row_idx]
-                            ip_cell = table.get_row(row_key)[0]
-                            ip = ip_cell.replace("🔗 ", "").strip()
-                            self.ping_ip_external(ip)
-                            return
+                    ip = self._tables[table_id].cursor_ip
+                    if ip:
+                        self.ping_ip_external(ip)
+                        return
                 except Exception as ex:
                     self.log_message(f"Table error: {ex}", "debug")
                     continue
@@ -329,33 +507,8 @@ class NetworkScannerTUI(App):
         except Exception as e:
             self.log_message(f"❌ Ping error: {e}", "error")
     
-    def action_on_row(self) -> None:
-        """Handle Enter key on selected row - detect column and act"""
-        try:
-            for table_id in ["results-table-1", "results-table-2"]:
-                try:
-                    table = self.query_one(f"#{table_id}", DataTable)
-                    if table.rows and table.cursor_row >= 0:
-                        row_idx = table.cursor_row
-                        col_idx = table.cursor_column if hasattr(table, 'cursor_column') else -1
-                        
-                        row_key = list(table.rows.keys())[row_idx]
-                        ip_cell = table.get_row(row_key)[0]
-                        ip = ip_cell.replace("🔗 ", "").strip()
-                        
-                        # Column 6 = Copy, Column 7 = Ping
-                        if col_idx == 6:  # Copy column
-                            self.copy_ip_to_clipboard(ip)
-                        elif col_idx == 7:  # Ping column
-                            self.ping_ip_external(ip)
-                        return
-                except:
-                    continue
-        except Exception as e:
-            self.log_message(f"Error: {e}", "error")
-    
     def action_pause_scan(self) -> None:
-        """Pause the running scan by sending SIGSTOP to the process."""
+        """Pause the running scan: no new probes start, in-flight ones finish."""
         if not self._scan_active:
             self.log_message("⚠️ No scan is currently running.", "info")
             return
@@ -364,73 +517,54 @@ class NetworkScannerTUI(App):
             self.log_message("⚠️ Scan is already paused.", "info")
             return
         
-        if not self._scan_process:
-            self.log_message("❌ Scan process not available.", "error")
+        if self._engine is None:
+            self.log_message("❌ Scan engine not available.", "error")
             self.update_buttons("idle")
             self._scan_active = False
             return
         
-        # Check if process is still running
-        if self._scan_process.poll() is not None:
-            self.log_message("⚠️ Scan process has already finished.", "info")
-            self._scan_active = False
-            self._scan_paused = False
-            self.update_buttons("idle")
-            return
-        
-        try:
-            self._scan_process.send_signal(19)  # SIGSTOP
+        if self._engine.pause():
             self._scan_paused = True
             self.log_message("⏸ Scan paused.", "info")
             self.update_buttons("paused")
-        except ProcessLookupError:
-            self.log_message("❌ Process not found - scan may have finished.", "error")
+        else:
+            self.log_message("⚠️ Scan has already finished.", "info")
             self._scan_active = False
             self._scan_paused = False
             self.update_buttons("idle")
-        except Exception as e:
-            self.log_message(f"❌ Failed to pause scan: {e}", "error")
     
     def action_resume_scan(self) -> None:
-        """Resume the paused scan by sending SIGCONT to the process."""
+        """Resume the paused scan, or continue a stopped one from its checkpoint."""
         if not self._scan_active:
-            self.log_message("⚠️ No scan is currently active.", "info")
+            if self._resumable():
+                self.call_later(self.action_start_scan, True)
+            else:
+                self.log_message("⚠️ No paused or stopped scan to resume.", "info")
             return
         
         if not self._scan_paused:
             self.log_message("⚠️ Scan is not paused.", "info")
             return
         
-        if not self._scan_process:
-            self.log_message("❌ Scan process not available.", "error")
+        if self._engine is None:
+            self.log_message("❌ Scan engine not available.", "error")
             self.update_buttons("idle")
             self._scan_active = False
             self._scan_paused = False
             return
         
-        # Check if process is still running
-        if self._scan_process.poll() is not None:
-            self.log_message("⚠️ Scan process has already finished.", "info")
-            self._scan_active = False
-            self._scan_paused = False
-            self.update_buttons("idle")
-            return
-        
-        try:
-            self._scan_process.send_signal(18)  # SIGCONT
+        if self._engine.resume():
             self._scan_paused = False
             self.log_message("▶ Scan resumed.", "info")
             self.update_buttons("scanning")
-        except ProcessLookupError:
-            self.log_message("❌ Process not found - scan may have finished.", "error")
+        else:
+            self.log_message("⚠️ Scan has already finished.", "info")
             self._scan_active = False
             self._scan_paused = False
             self.update_buttons("idle")
-        except Exception as e:
-            self.log_message(f"❌ Failed to resume scan: {e}", "error")
     
     def action_stop_scan(self) -> None:
-        """Stop the scan by terminating the process and cleaning up."""
+        """Stop the scan by cancelling the scan task (probe processes are killed with it)."""
         if not self._scan_active:
             self.log_message("⚠️ No scan is currently running.", "info")
             return
@@ -442,45 +576,12 @@ class NetworkScannerTUI(App):
         # Update buttons immediately
         self.update_buttons("idle")
         
-        # Terminate the process
-        if self._scan_process:
-            try:
-                # If paused, resume first so we can terminate it properly
-                if self._scan_paused:
-                    try:
-                        self._scan_process.send_signal(18)  # SIGCONT
-                    except:
-                        pass
-                
-                # Terminate the process
-                self._scan_process.terminate()
-                
-                # Wait for it to finish (with timeout)
-                try:
-                    self._scan_process.wait(timeout=2)
-                except subprocess.TimeoutExpired:
-                    # Force kill if it doesn't terminate
-                    try:
-                        self._scan_process.kill()
-                        self._scan_process.wait(timeout=1)
-                    except:
-                        pass
-            except ProcessLookupError:
-                # Process already finished
-                pass
-            except Exception as e:
-                self.log_message(f"⚠️ Error stopping process: {e}", "error")
-            finally:
-                self._scan_process = None
-        
-        # Stop reading threads by setting flag (they check _scan_active)
-        # Give threads a moment to finish
-        if self._scan_threads:
-            for thread in self._scan_threads:
-                if thread.is_alive():
-                    thread.join(timeout=1)
-        
-        self.log_message("✓ Scan stopped.", "success")
+        monitoring = self._engine is not None and self._engine.monitoring
+        if self._engine is not None:
+            self._engine.stop()  # No-op if the scan already finished
+        
+        if not monitoring:
+            self.log_message("✓ Scan stopped. Press Resume to continue it from where it stopped.", "success")
     
     def copy_ip_to_clipboard(self, ip: str) -> None:
         """Copy IP address to clipboard with multiple fallback methods"""
@@ -559,94 +660,170 @@ class NetworkScannerTUI(App):
         except Exception as e:
             self.log_message(f"❌ Error opening terminal: {e}", "error")
 
-    def _safe_call_from_thread(self, func, *args, **kwargs):
-        """Safely call a function from thread, checking if app is running."""
+    def _read_ranges(self) -> list:
+        """Configured CIDRs from the range inputs, in order, without duplicates (ValueError if invalid)."""
+        ranges = []
+        for i in range(1, 5):
+            ranges.extend(parse_ranges(self.query_one(f"#range{i}-input", Input).value))
+        return list(dict.fromkeys(ranges))
+
+    async def _setup_result_tables(self, ranges: list) -> None:
+        """Show one empty results table per range, rebuilding them only if the ranges changed."""
+        if self._router is not None and self._router.ranges == ranges:
+            self._clear_tables()
+            return
+        section = self.query_one("#results-section", VerticalScroll)
+        await section.remove_children()
+        self._tables = {}
+        self._router = RangeRouter(ranges)
+        containers = []
+        for i, cidr in enumerate(ranges, 1):
+            table_id = f"results-table-{i}"
+            table = HostTable(id=table_id)
+            table.store.set_filter(self._filter)
+            containers.append(Container(
+                Static(f"🌐 Network: {cidr}", classes="network-title", id=f"network{i}-title"),
+                table,
+                classes="network-container", id=f"network{i}-container",
+            ))
+            self._tables[table_id] = table
+        if containers:
+            await section.mount_all(containers)
+
+    def _table_for_ip(self, ip: str) -> str:
+        """Table of the most specific configured range containing this IP."""
+        index = self._router.lookup(ip) if self._router is not None else None
+        # Hosts outside every range (e.g. reported by a neighbor) go to the first table
+        return f"results-table-{index + 1}" if index is not None else "results-table-1"
+
+    def _on_scan_event(self, event: dict) -> None:
+        """Take one protocol event from the scan (called on the scan loop, never touches widgets)."""
+        kind = event["type"]
+        if kind in (HOST_DISCOVERED, FIELD_UPDATE):
+            self._updates.push_host(event["ip"], event["fields"], kind == HOST_DISCOVERED)
+        elif kind == HOST_STATE:
+            self._state_changes.append((event["time"], event["ip"], event["state"]))
+        elif kind == PROGRESS:
+            self._progress[event["range"]] = (event["done"], event["total"])
+        elif kind == PHASE_CHANGE:
+            phase, state = event["phase"], event["state"]
+            if phase == "scan":
+                self._scan_state = state
+            elif state == STARTED:
+                self._phases = self._phases | {phase}
+            else:
+                self._phases = self._phases - {phase}
+        # Stats events carry what the stats panel reads from the engine's metrics directly
+
+    def _show_progress(self) -> None:
+        """Move the progress bar to the addresses done over all ranges, with per-range detail."""
+        progress = sorted(self._progress.items())
+        done = sum(d for _, (d, _) in progress)
+        total = sum(t for _, (_, t) in progress)
+        ranges = " · ".join(f"{spec} {d}/{t}" for spec, (d, t) in progress) if len(progress) > 1 else ""
+        phases = ", ".join(sorted(self._phases))
+        status = f"running: {phases}" if phases else self._scan_state
+        detail = " │ ".join(part for part in (ranges, status) if part)
+        shown = (done, total, detail)
+        if shown == self._progress_shown:
+            return
+        self._progress_shown = shown
         try:
-            if self.is_running and self._scan_active:
-                self.call_from_thread(func, *args, **kwargs)
-        except (RuntimeError, AttributeError):
-            pass
-    
-    def _parse_scan_output(self, line: str):
-        """Parse scan output and update tables."""
-        if not line or not line.startswith("LIVE|"):
+            self.query_one("#scan-progress", ProgressBar).update(total=total or None, progress=done)
+            self.query_one("#progress-detail", Static).update(detail)
+        except Exception:
+            pass  # App is shutting down
+
+    def _flush_updates(self) -> None:
+        """Apply queued host changes, log lines and progress in one batch (runs every UI frame)."""
+        self._show_progress()
+        self._show_state_changes()
+        hosts, logs = self._updates.drain()
+        if not hosts and not logs:
+            return
+        with self.batch_update():
+            changed = set()
+            for ip, fields, is_new in hosts:
+                table = self._tables.get(self._table_for_ip(ip))
+                if table is None:
+                    continue  # No ranges configured
+                changed.add(table)
+                if table.store.update(ip, fields, self._host_flags(ip)) and ip not in self._gone_hosts:
+                    self.log_message(f"✅ Found live host: {ip}", "success")
+            for table in changed:
+                table.refresh_rows()  # Redraws only the rows in view
+            if changed and self._filter is not None:
+                self._show_filter_status()
+            for message, level in logs:
+                self.log_message(message, level)
+
+    def _show_state_changes(self) -> None:
+        """Add the hosts that came up or went down since the last frame to the monitoring timeline."""
+        if not self._state_changes:
             return
-        
         try:
-            # Format: LIVE|IP|HOSTNAME|MAC|VENDOR|PORTS|PING
-            # Using | delimiter to avoid issues with : in MAC addresses
-            parts = line[5:].split("|")
-            if len(parts) < 6:  # Need at least IP through PORTS
-                self.log_message(f"⚠️ Incomplete data: {line[:50]}...", "debug")
-                return
-                
-            ip = parts[0] if parts[0] else "-"
-            hostname = parts[1] if parts[1] else "-"
-            mac = parts[2] if parts[2] else "-"
-            vendor = parts[3] if parts[3] else "-"
-            ports = parts[4] if parts[4] else "-"  # PORTS - now correctly parsed!
-            ping = parts[5] if len(parts) > 5 and parts[5] else "-"
-            
-            # Debug log to verify parsing
-            debug_switch = self.query_one("#debug-switch", Switch)
-            if debug_switch and debug_switch.value:
-                self.log_message(f"🔍 {ip}: Ports=[{ports}] Ping={ping}", "debug")
-            
-            self._live_hosts[ip] = {
-                "hostname": hostname,
-                "mac": mac,
-                "vendor": vendor,
-                "ports": ports,
-                "ping": ping
-            }
-            
-            # Determine which table this IP belongs to
-            if ip.startswith("192.168.0."):
-                table_id = "results-table-1"
-            elif ip.startswith("192.168.8."):
-                table_id = "results-table-2"
+            timeline = self.query_one("#timeline", RichLog)
+        except Exception:
+            return  # App is shutting down
+        while self._state_changes:
+            when, ip, state = self._state_changes.popleft()
+            text = Text()
+            text.append(f"[{time.strftime('%H:%M:%S', time.localtime(when))}] ", style="dim cyan")
+            if state == UP:
+                text.append(f"⬆ {ip} up", style="bold green")
             else:
-                # Try to find the right table based on custom ranges
-                table_id = "results-table-1"
-            
-            self._safe_call_from_thread(self.add_row, table_id, ip, ping, hostname, mac, vendor, ports)
-            
-        except Exception as e:
-            self._safe_call_from_thread(self.log_message, f"⚠️ Parse error: {str(e)}", "error")
+                text.append(f"⬇ {ip} down", style="bold red")
+            timeline.write(text)
 
-    def _read_stream(self, stream, is_stderr=False):
-        """Read from a stream line by line and log messages."""
+    def _refresh_stats(self) -> None:
+        """Show the running (or last) scan's rates, in-flight probes, queue depths and timings."""
+        engine = self._engine
+        if engine is None:
+            return
+        if not self._scan_active and self._stats_previous is not None and \
+                self._stats_previous.value("ipscan_scan_running") == 0:
+            return  # Finished scan: keep its final numbers
+        now = engine.metrics.snapshot()
+        previous, self._stats_previous = self._stats_previous, now
+        probes = " │ ".join(
+            f"{name} {now.rate(previous, 'ipscan_probes_sent_total', probe=probe):,.0f}↑ "
+            f"{now.rate(previous, 'ipscan_probe_replies_total', probe=probe):,.0f}↓"
+            for probe, name in STATS_PROBES
+        )
+        in_flight = ", ".join(f"{name} {now.value('ipscan_probes_in_flight', probe=probe):.0f}"
+                              for probe, name in STATS_PROBES if probe != "arp")
+        found = now.value("ipscan_hosts_found_total")
+        enriched = now.value("ipscan_hosts_enriched_total")
+        text = Text()
+        text.append("Probes/s ", style="bold")
+        text.append(f"{probes}\n")
+        text.append("In flight ", style="bold")
+        text.append(f"{in_flight} │ ")
+        text.append("Queued ", style="bold")
+        text.append(f"{now.value('ipscan_queue_depth', queue='enrichment'):.0f} hosts, "
+                    f"{now.value('ipscan_queue_depth', queue='events'):.0f} events │ ")
+        text.append("Hosts ", style="bold")
+        text.append(f"{found:.0f} found ({now.rate(previous, 'ipscan_hosts_found_total'):.1f}/s), "
+                    f"{enriched:.0f} enriched ({now.rate(previous, 'ipscan_hosts_enriched_total'):.1f}/s) │ "
+                    f"{now.value('ipscan_scan_duration_seconds'):.1f}s\n")
+        text.append(describe_timing(now), style="dim")
         try:
-            while self._scan_active:
-                line = stream.readline()
-                if not line:
-                    # EOF reached
-                    break
-                if not self._scan_active:
-                    break
-                line = line.strip()
-                if line:
-                    if is_stderr:
-                        self._safe_call_from_thread(self.log_message, f"[STDERR] {line}", "error")
-                    else:
-                        if line.startswith("LIVE|"):
-                            self._parse_scan_output(line)
-                        else:
-                            self._safe_call_from_thread(self.log_message, line)
-        except Exception as e:
-            if self._scan_active:
-                self._safe_call_from_thread(self.log_message, f"Stream error: {str(e)}", "error")
-        finally:
-            try:
-                stream.close()
-            except:
-                pass
+            self.query_one("#scan-stats", Static).update(text)
+        except Exception:
+            pass  # App is shutting down
+
+    def _resumable(self) -> bool:
+        """Whether a stopped scan of the configured ranges left a checkpoint."""
+        try:
+            ranges = self._read_ranges()
+        except ValueError:
+            return False
+        return bool(ranges) and os.path.exists(checkpoint_path(ranges))
 
     @work(exclusive=True, thread=True)
-    async def run_scan(self) -> None:
+    async def run_scan(self, ranges: list, resume: bool = False) -> None:
         self._scan_active = True
         self._scan_paused = False
-        self._live_hosts = {}
         
         # Get options
         try:
@@ -656,132 +833,96 @@ class NetworkScannerTUI(App):
             threads = 50
             timeout = 1000
         
-        # Get IP ranges and update titles
-        ranges = []
-        for i in range(1, 5):
-            range_val = self.query_one(f"#range{i}-input", Input).value.strip()
-            if range_val:
-                ranges.append(range_val)
-                # Update network titles
-                if i <= 2:
-                    try:
-                        title = self.query_one(f"#network{i}-title", Static)
-                        title.update(f"🌐 Network: {range_val}")
-                    except:
-                        pass
-        
-        if not ranges:
-            self.log_message("❌ Error: No IP ranges specified!", "error")
+        try:
+            ports = parse_ports(self.query_one("#ports-input", Input).value)
+        except ValueError as e:
+            self.log_message(f"❌ Error: Invalid port list: {e}", "error")
             self.update_buttons("idle")
             self._scan_active = False
             return
-            
-        debug_enabled = self.query_one("#debug-switch", Switch).value
-        self.log_message(f"🚀 Starting scan: {', '.join(ranges)}", "info")
-        self.log_message(f"⚙️ Config: {threads} threads, {timeout}ms timeout", "info")
-        self.update_buttons("scanning")
-        
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        script_path = os.path.join(script_dir, "scan_subnets_enhanced.sh")
         
-        if not os.path.exists(script_path):
-            self.log_message(f"❌ Script not found: {script_path}", "error")
+        incremental = self.query_one("#incremental-switch", Switch).value
+        adaptive = self.query_one("#adaptive-switch", Switch).value
+        services = self.query_one("#services-switch", Switch).value
+        syn = self.query_one("#syn-switch", Switch).value
+        monitor = self.query_one("#monitor-switch", Switch).value
+        ipv6 = self.query_one("#ipv6-switch", Switch).value
+        # Results are kept in results/scan_store.db so the next scan can compare and reuse them
+        try:
+            config = ScanConfig(ranges, threads=threads, timeout=timeout, ports=ports,
+                                store=DEFAULT_STORE, incremental=incremental, adaptive=adaptive,
+                                resume=resume, metrics_file=textfile_path(), services=services,
+                                syn=syn, monitor=monitor, ipv6=ipv6)
+        except ValueError as e:
+            self.log_message(f"❌ Error: {e}", "error")
             self.update_buttons("idle")
             self._scan_active = False
             return
         
-        cmd = ["bash", script_path, str(threads), str(timeout)] + ranges
-        if debug_enabled:
-            cmd.append("--debug")
-            
-        stdout_thread = None
-        stderr_thread = None
+        self.log_message(f"{'⏩ Resuming' if resume else '🚀 Starting'} scan: {', '.join(config.ranges)}", "info")
+        self.log_message(f"⚙️ Config: {config.describe()}", "info")
+        if config.metrics_file:
+            self.log_message(f"📈 Writing scan metrics to {config.metrics_file}", "info")
+        self.update_buttons("scanning")
+        
+        def log(message: str, level: str = "info") -> None:
+            if not self._scan_log.enabled(level):
+                return  # Cached level check: debug lines cost nothing with debug off
+            self._updates.push_log(message, level)
+        
+        # Discovery and enrichment run in-process on this worker's event loop;
+        # hosts show up as soon as any probe finds them and fill in as lookups finish.
+        engine = self._engine = ScanEngine(config, log=log, resolver=self._resolver,
+                                           on_scan_event=self._on_scan_event)
         
         try:
-            self._scan_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1
-            )
-            process = self._scan_process
-            
-            stdout_thread = threading.Thread(target=self._read_stream, args=(process.stdout, False), daemon=True)
-            stderr_thread = threading.Thread(target=self._read_stream, args=(process.stderr, True), daemon=True)
-            
-            self._scan_threads = [stdout_thread, stderr_thread]
-            
-            stdout_thread.start()
-            stderr_thread.start()
-            
-            # Wait for process to complete (or be stopped)
-            process.wait()
-            
-            # Wait for reading threads to finish
-            if stdout_thread and stdout_thread.is_alive():
-                stdout_thread.join(timeout=2)
-            if stderr_thread and stderr_thread.is_alive():
-                stderr_thread.join(timeout=2)
-            
-            # Only log completion if scan wasn't manually stopped
-            if self._scan_active:
-                live_count = len(self._live_hosts)
-                if process.returncode == 0:
-                    self._safe_call_from_thread(self.log_message, f"✓ Scan completed! Found {live_count} live hosts.", "success")
-                elif process.returncode == -15:  # SIGTERM
-                    self._safe_call_from_thread(self.log_message, f"⏹ Scan stopped by user. Found {live_count} hosts.", "info")
-                else:
-                    self._safe_call_from_thread(self.log_message, f"⚠️ Scan finished with errors. Found {live_count} hosts.", "error")
-                
-        except FileNotFoundError:
-            if self._scan_active:
-                self._safe_call_from_thread(self.log_message, "❌ Error: bash not found.", "error")
+            hosts = await engine.run()
+            log(f"✓ Scan completed in {engine.duration:.1f}s! Found {len(hosts)} live hosts.", "success")
+            self._report_changes(engine, log)
+            if config.monitor:
+                log("⏱ Monitoring the ranges for hosts coming up or going down; press Stop to end", "info")
+                await engine.monitor()
+                log("✓ Monitoring stopped.", "success")
+        except asyncio.CancelledError:
+            pass  # Stopped by user; action_stop_scan() already reported it
         except Exception as e:
             if self._scan_active:
-                self._safe_call_from_thread(self.log_message, f"❌ Error: {str(e)}", "error")
+                log(f"❌ Error: {str(e)}", "error")
         finally:
-            # Clean up process if still running
-            if self._scan_process:
-                try:
-                    # If paused, resume first
-                    if self._scan_paused:
-                        try:
-                            self._scan_process.send_signal(18)  # SIGCONT
-                        except:
-                            pass
-                    
-                    # Check if still running
-                    if self._scan_process.poll() is None:
-                        self._scan_process.terminate()
-                        try:
-                            self._scan_process.wait(timeout=1)
-                        except subprocess.TimeoutExpired:
-                            try:
-                                self._scan_process.kill()
-                                self._scan_process.wait(timeout=1)
-                            except:
-                                pass
-                except ProcessLookupError:
-                    pass
-                except Exception:
-                    pass
-                finally:
-                    self._scan_process = None
-            
-            # Clean up threads
-            if self._scan_threads:
-                for thread in self._scan_threads:
-                    if thread.is_alive():
-                        thread.join(timeout=1)
-                self._scan_threads = []
+            stats = self._updates.metrics()
+            log(f"🔧 UI updates: {stats['host_updates']} host updates queued, {stats['host_merged']} merged, "
+                f"{stats['batches']} batches (max {stats['max_batch']}), "
+                f"{stats['logs_dropped']} log lines dropped", "debug")
             
             # Reset state
             self._scan_active = False
             self._scan_paused = False
             
             # Update buttons
-            self._safe_call_from_thread(self.update_buttons, "idle")
+            try:
+                self.call_from_thread(self.update_buttons, "idle")
+            except RuntimeError:
+                pass  # App is shutting down
+
+    def _report_changes(self, engine: ScanEngine, log) -> None:
+        """Log new/gone hosts since the last scan and list the gone ones in their tables."""
+        if engine.previous is None:
+            if engine.config.store is not None:
+                log(f"💾 First stored scan of these ranges: {len(engine.hosts)} hosts recorded", "info")
+            return
+        log(f"🆕 {len(engine.new)} new, 👻 {len(engine.gone)} gone since the last scan", "info")
+        if engine.gone:
+            log(f"👻 Gone: {', '.join(engine.gone)}", "info")
+            self._gone_hosts = set(engine.gone)
+            for ip, record in engine.gone.items():
+                fields = {k: v for k, v in record.items() if k not in ("ip", "last_seen")}
+                fields["ping"] = "gone"
+                self._updates.push_host(ip, fields, True)
+
+    def _host_flags(self, ip: str) -> int:
+        """Row flags of a host added now: NEW if the last stored scan did not see it (gone hosts set their own)."""
+        previous = self._engine.previous if self._engine is not None else None
+        return NEW if previous is not None and ip not in previous and ip not in self._gone_hosts else 0
 
     def update_buttons(self, state: str) -> None:
         """Update button states: 'idle', 'scanning', 'paused'"""
@@ -795,7 +936,7 @@ class NetworkScannerTUI(App):
                 scan_btn.disabled = False
                 scan_btn.variant = "success"
                 pause_btn.disabled = True
-                resume_btn.disabled = True
+                resume_btn.disabled = not self._resumable()  # A stopped scan can be continued
                 stop_btn.disabled = True
             elif state == "scanning":
                 scan_btn.disabled = True
@@ -811,41 +952,12 @@ class NetworkScannerTUI(App):
         except Exception as e:
             self.log_message(f"Button update error: {e}", "error")
 
-    def add_row(self, table_id: str, ip: str, ping: str, hostname: str, mac: str, vendor: str, ports: str) -> None:
-        try:
-            table = self.query_one(f"#{table_id}", DataTable)
-            
-            # Truncate long values to fit columns better
-            hostname = hostname[:24] if len(hostname) > 24 else hostname
-            vendor = vendor[:19] if len(vendor) > 19 else vendor
-            
-            # Add interactive buttons to IP column
-            ip_display = f"🔗 {ip}"  # Add icon to indicate interactive
-            
-            # Action columns
-            copy_action = "📋 Copy"   # Copy button
-            ping_action = "🔔 Ping"   # Ping button
-            
-            # Check for duplicates
-            for row_key in table.rows:
-                row_data = table.get_row(row_key)
-                # Compare without the icon
-                if row_data[0].replace("🔗 ", "").strip() == ip:
-                    # Update existing row
-                    table.update_cell(row_key, "Ping", ping)
-                    table.update_cell(row_key, "Hostname", hostname)
-                    table.update_cell(row_key, "MAC", mac)
-                    table.update_cell(row_key, "Vendor", vendor)
-                    table.update_cell(row_key, "Ports", ports)
-                    return
-            # Add new row with IP and action columns
-            table.add_row(ip_display, ping, hostname, mac, vendor, ports, copy_action, ping_action)
-            self.log_message(f"✅ Found live host: {ip}", "success")
-        except Exception as e:
-            self.log_message(f"Error adding row: {e}", "error")
+    def _clear_tables(self) -> None:
+        for table in self._tables.values():
+            table.clear()
 
-    def action_start_scan(self) -> None:
-        """Start a new scan or resume if paused."""
+    async def action_start_scan(self, resume: bool = False) -> None:
+        """Start a new scan (or continue a stopped one with `resume`), or resume if paused."""
         # If paused, resume instead of starting new scan
         if self._scan_active and self._scan_paused:
             self.action_resume_scan()
@@ -858,49 +970,59 @@ class NetworkScannerTUI(App):
         # Clear previous scan state
         self._scan_active = False
         self._scan_paused = False
-        self._scan_process = None
-        self._scan_threads = []
+        self._engine = None
+        self._stats_previous = None
         
-        # Clear tables
+        # Get IP ranges; each one gets its own results table
         try:
-            self.query_one("#results-table-1", DataTable).clear()
-            self.query_one("#results-table-2", DataTable).clear()
-        except:
-            pass
+            ranges = self._read_ranges()
+        except ValueError as e:
+            self.log_message(f"❌ Error: Invalid range: {e}", "error")
+            return
         
-        # Clear live hosts
-        self._live_hosts = {}
+        if not ranges:
+            self.log_message("❌ Error: No IP ranges specified!", "error")
+            return
+        
+        # Clear (or rebuild) tables
+        try:
+            await self._setup_result_tables(ranges)
+        except Exception as e:
+            self.log_message(f"Error setting up tables: {e}", "error")
+            return
+        
+        # Clear anything still queued from the last scan
+        self._updates.clear()
+        self._progress = {}
+        self._phases = frozenset()
+        self._scan_state = ""
+        self._gone_hosts = set()
         
         # Start new scan
-        self.run_scan()
+        self.run_scan(ranges, resume)
     
-    def on_data_table_row_selected(self, event) -> None:
-        """Handle row selection in data tables for copy/ping actions"""
+    def on_host_table_row_selected(self, event: HostTable.RowSelected) -> None:
+        """Handle row selection in the results tables; a click on Copy or Ping also runs that action"""
         try:
-            # Get the table and row
-            table = event.data_table
-            row_idx = event.cursor_row
-            
-            if row_idx < 0 or row_idx >= len(table.rows):
-                return
-            
-            row_key = list(table.rows.keys())[row_idx]
-            row_data = table.get_row(row_key)
-            ip = row_data[0].replace("🔗 ", "").strip() if row_data[0] else None
-            
-            if not ip:
-                return
+            ip = event.ip
+            if event.column == "copy":
+                self.copy_ip_to_clipboard(ip)
+            elif event.column == "ping-action":
+                self.ping_ip_external(ip)
             
             # Store selected IP data
+            host = event.table.store.host(ip) or {}
             self._selected_ip = ip
-            self._selected_hostname = row_data[2] if len(row_data) > 2 else "-"
-            self._selected_mac = row_data[3] if len(row_data) > 3 else "-"
-            self._selected_ports = row_data[5] if len(row_data) > 5 else "-"
+            self._selected_hostname = host.get("hostname", "-")
+            self._selected_mac = host.get("mac", "-")
+            self._selected_ports = host.get("ports", "-")
             
             # Update display
             try:
                 display = self.query_one("#selected-ip-display", Static)
-                display.update(f"🔍 Selected IP: {ip} | MAC: {self._selected_mac} | Ports: {self._selected_ports}")
+                services = host.get("services", "-")
+                display.update(f"🔍 Selected IP: {ip} | MAC: {self._selected_mac} | Ports: {self._selected_ports}"
+                               + (f" | Services: {services}" if services != "-" else ""))
                 self.log_message(f"✅ Selected: {ip}", "success")
             except:
                 pass
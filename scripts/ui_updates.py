@@ -0,0 +1,94 @@
+"""ui_updates.py — Coalescing update queue between scan threads and the TUI
+
+Scan threads push parsed host records and log lines without waiting for the
+UI; the TUI drains the queue on a timer and applies each batch at once.
+Repeated updates to a host that has not been drawn yet are merged into a
+single row write, and the log backlog is bounded (oldest lines are dropped).
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+# Host update as drained: (ip, merged fields, is_new)
+HostBatchItem = Tuple[str, Dict[str, str], bool]
+LogBatchItem = Tuple[str, str]
+
+
+class UpdateCoalescer:
+    """Thread-safe buffer of pending host and log updates.
+
+    `max_logs` bounds the log backlog, `max_batch` bounds how many host rows
+    one drain() returns so a single frame never does unbounded work.
+    """
+
+    def __init__(self, max_logs: int = 1000, max_batch: int = 500):
+        self.max_batch = max(1, int(max_batch))
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, str]] = {}  # Insertion-ordered pending rows
+        self._new: set = set()
+        self._logs: Deque[LogBatchItem] = deque(maxlen=max(1, int(max_logs)))
+        self._stats = {
+            "host_updates": 0,   # Updates pushed by the scan
+            "host_merged": 0,    # Updates folded into an already-pending row
+            "rows_applied": 0,   # Row writes handed to the UI
+            "logs_pushed": 0,
+            "logs_dropped": 0,   # Lines lost to the bounded backlog
+            "batches": 0,
+            "max_batch": 0,
+        }
+
+    def push_host(self, ip: str, fields: Dict[str, str], is_new: bool = False) -> None:
+        with self._lock:
+            self._stats["host_updates"] += 1
+            pending = self._hosts.get(ip)
+            if pending is None:
+                self._hosts[ip] = dict(fields)
+            else:
+                pending.update(fields)
+                self._stats["host_merged"] += 1
+            if is_new:
+                self._new.add(ip)
+
+    def push_log(self, message: str, level: str = "info") -> None:
+        with self._lock:
+            self._stats["logs_pushed"] += 1
+            if len(self._logs) == self._logs.maxlen:
+                self._stats["logs_dropped"] += 1
+            self._logs.append((message, level))
+
+    def drain(self) -> Tuple[List[HostBatchItem], List[LogBatchItem]]:
+        """Take up to max_batch pending host rows and all pending log lines."""
+        with self._lock:
+            if not self._hosts and not self._logs:
+                return [], []
+            hosts: List[HostBatchItem] = []
+            while self._hosts and len(hosts) < self.max_batch:
+                ip = next(iter(self._hosts))
+                fields = self._hosts.pop(ip)
+                is_new = ip in self._new
+                self._new.discard(ip)
+                hosts.append((ip, fields, is_new))
+            logs = list(self._logs)
+            self._logs.clear()
+            self._stats["rows_applied"] += len(hosts)
+            self._stats["batches"] += 1
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(hosts) + len(logs))
+        return hosts, logs
+
+    def clear(self) -> None:
+        with self._lock:
+            self._hosts.clear()
+            self._new.clear()
+            self._logs.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._hosts) + len(self._logs)
+
+    def metrics(self) -> Dict[str, int]:
+        """Counters for merged/dropped updates and batch sizes since the last clear()."""
+        with self._lock:
+            return dict(self._stats)